@@ -441,11 +441,16 @@ class RemoteExecutionTwillPreparer implements TwillPreparer {
                                                     twillRuntimeSpec.getReservedMemory(runnableName),
                                                     twillRuntimeSpec.getMinHeapRatio(runnableName));
 
-          // Spark env setup script
-          session.executeAndWait(String.format("bash %s/%s/%s %s/%s/%s > %s/%s",
-                                               targetPath, Constants.Files.RUNTIME_CONFIG_JAR, SETUP_SPARK_SH,
-                                               targetPath, Constants.Files.RUNTIME_CONFIG_JAR, SETUP_SPARK_PY,
-                                               targetPath, SPARK_ENV_SH));
+          // Spark env setup script. The environment is cached on the remote host, and only discovered by running
+          // spark-submit when Spark or the environment changed. The script prints how it was setup and the time.
+          long startMillis = System.currentTimeMillis();
+          String sparkEnvResult = session.executeAndWait(
+            String.format("bash %s/%s/%s %s/%s/%s %s/%s",
+                          targetPath, Constants.Files.RUNTIME_CONFIG_JAR, SETUP_SPARK_SH,
+                          targetPath, Constants.Files.RUNTIME_CONFIG_JAR, SETUP_SPARK_PY,
+                          targetPath, SPARK_ENV_SH)).trim();
+          LOG.info("Spark environment on {} {}, {} ms including the SSH round trip",
+                   session.getAddress().getHostName(), sparkEnvResult, System.currentTimeMillis() - startMillis);
           // Generates the launch script
           byte[] scriptContent = generateLaunchScript(runtimeSpec, targetPath,
                                                       runnableName, memory).getBytes(StandardCharsets.UTF_8);
@@ -13,8 +13,65 @@
 # the License.
 #
 # Shell script to optionally setup spark environment variables for CDAP to use
+#
+# Usage: setupSpark.sh <setupSpark.py> <output file>
+#
+# The environment printed by running setupSpark.py with spark-submit is cached in the
+# CDAP_SPARK_ENV_CACHE_DIR directory ($HOME/.cdap/spark-env by default), keyed by the spark-submit path,
+# its modification time, the modification time of spark-env.sh, the checksum of setupSpark.py and the SPARK_*
+# and HADOOP_* environment variables, so that spark-submit only runs again when any of them changes.
+# Prints how the environment was set up ("cached", "discovered" or "none") and the elapsed time.
 #!/bin/bash
 
-if [[ $(which spark-submit 2>/dev/null) ]]; then
-  spark-submit --master local[2] $1
+now_ms() {
+  local ms=$(date +%s%3N)
+  # Without nanoseconds support, date prints the format literally
+  case "${ms}" in
+    *N) echo $(( $(date +%s) * 1000 )) ;;
+    *) echo ${ms} ;;
+  esac
+}
+
+mtime() {
+  stat -c %Y "$1" 2>/dev/null || stat -f %m "$1" 2>/dev/null
+}
+
+script=$1
+output=$2
+start=$(now_ms)
+
+spark_submit=$(which spark-submit 2>/dev/null)
+if [[ -z "${spark_submit}" ]]; then
+  : > "${output}"
+  echo "none in $(( $(now_ms) - start )) ms"
+  exit 0
+fi
+
+resolved=$(readlink -f "${spark_submit}" 2>/dev/null || echo "${spark_submit}")
+spark_conf_dir=${SPARK_CONF_DIR:-$(dirname "${resolved}")/../conf}
+key=$( { echo "${resolved}"; mtime "${resolved}"; mtime "${spark_conf_dir}/spark-env.sh"; cksum < "${script}"; \
+         env | grep -E '^(SPARK|HADOOP)_' | sort; } | cksum | cut -d ' ' -f 1 )
+
+cache_dir=${CDAP_SPARK_ENV_CACHE_DIR:-${HOME}/.cdap/spark-env}
+cache_file=${cache_dir}/spark-env-${key}.sh
+
+if [[ -f "${cache_file}" ]] && cp "${cache_file}" "${output}"; then
+  # Marks the entry as recently used
+  touch "${cache_file}" 2>/dev/null
+  echo "cached in $(( $(now_ms) - start )) ms"
+  exit 0
+fi
+
+spark-submit --master local[2] "${script}" > "${output}"
+status=$?
+if [[ ${status} -ne 0 ]]; then
+  exit ${status}
+fi
+
+# Write to a temporary file and rename it, so that concurrent launches never read a partial entry
+if mkdir -p "${cache_dir}" 2>/dev/null && cp "${output}" "${cache_file}.$$" 2>/dev/null; then
+  mv -f "${cache_file}.$$" "${cache_file}"
+  # Remove entries of environments that are no longer used
+  find "${cache_dir}" -name 'spark-env-*.sh' -mtime +30 -exec rm -f {} \; 2>/dev/null
 fi
+echo "discovered in $(( $(now_ms) - start )) ms"
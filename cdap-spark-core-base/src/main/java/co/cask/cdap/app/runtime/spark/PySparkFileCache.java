@@ -0,0 +1,347 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark;
+
+import co.cask.cdap.common.utils.DirUtils;
+import com.google.common.annotations.VisibleForTesting;
+import com.google.common.base.Charsets;
+import com.google.common.collect.HashMultiset;
+import com.google.common.collect.Multiset;
+import com.google.common.hash.Hasher;
+import com.google.common.hash.Hashing;
+import org.slf4j.Logger;
+import org.slf4j.LoggerFactory;
+
+import java.io.ByteArrayInputStream;
+import java.io.Closeable;
+import java.io.File;
+import java.io.FileFilter;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.net.JarURLConnection;
+import java.net.URL;
+import java.net.URLConnection;
+import java.nio.file.Files;
+import java.nio.file.StandardCopyOption;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.Comparator;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+import java.util.UUID;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.atomic.AtomicBoolean;
+import java.util.jar.JarEntry;
+import javax.annotation.Nullable;
+
+/**
+ * A content addressed cache of the files provided to PySpark in local mode, which are the pyspark and py4j
+ * libraries and the Python script. Each entry is a directory named by the hash of the file name and content,
+ * containing the file. Entries are created atomically, hence they can be shared by concurrent runs, and the
+ * least recently used ones are evicted when the cache grows beyond its maximum size.
+ */
+final class PySparkFileCache {
+
+  private static final Logger LOG = LoggerFactory.getLogger(PySparkFileCache.class);
+
+  // Prefix of the directories that are being created or deleted
+  private static final String TEMP_PREFIX = ".tmp-";
+
+  // Entries used recently are not evicted, since they may be in use by another process sharing the cache
+  private static final long MIN_EVICTION_AGE_MILLIS = TimeUnit.MINUTES.toMillis(1);
+
+  // Temporary directories older than this are left over by a process that died
+  private static final long STALE_TEMP_AGE_MILLIS = TimeUnit.HOURS.toMillis(1);
+
+  // Entries in use by the runs in this process, shared by all cache instances. Guarded by itself.
+  private static final Multiset<File> IN_USE = HashMultiset.create();
+
+  private final File cacheDir;
+  private final long maxSize;
+  private final long minEvictionAge;
+
+  PySparkFileCache(File cacheDir, long maxSize) {
+    this(cacheDir, maxSize, MIN_EVICTION_AGE_MILLIS);
+  }
+
+  @VisibleForTesting
+  PySparkFileCache(File cacheDir, long maxSize, long minEvictionAge) {
+    this.cacheDir = cacheDir.getAbsoluteFile();
+    this.maxSize = maxSize;
+    this.minEvictionAge = minEvictionAge;
+  }
+
+  /**
+   * Acquires the cached copy of the content of the given {@link URL}. For an entry in a jar file, such as the
+   * libraries packaged with CDAP, the CRC and size recorded in the jar are used as the content hash, so that the
+   * content is only copied when it is not in the cache.
+   *
+   * @param name the file name
+   * @param url the location of the content
+   * @return a {@link Lease} of the cached file, which must be closed when the file is no longer used
+   * @throws IOException if failed to copy the content
+   */
+  Lease acquire(String name, URL url) throws IOException {
+    String checksum = getChecksum(url);
+    String key = null;
+    if (checksum != null) {
+      key = newHasher(name).putString(checksum, Charsets.UTF_8).hash().toString();
+      Lease lease = tryAcquire(new File(cacheDir, key), name);
+      if (lease != null) {
+        return lease;
+      }
+    }
+    try (InputStream is = url.openStream()) {
+      return store(name, is, key);
+    }
+  }
+
+  /**
+   * Acquires the cached copy of the given content.
+   *
+   * @param name the file name
+   * @param content the file content
+   * @return a {@link Lease} of the cached file, which must be closed when the file is no longer used
+   * @throws IOException if failed to write the content
+   */
+  Lease acquire(String name, byte[] content) throws IOException {
+    String key = newHasher(name).putBytes(content).hash().toString();
+    Lease lease = tryAcquire(new File(cacheDir, key), name);
+    return lease == null ? store(name, new ByteArrayInputStream(content), key) : lease;
+  }
+
+  /**
+   * Acquires the cached copy of the content read from the given {@link InputStream}. The content is always read
+   * for computing its hash, but it is only kept once in the cache.
+   *
+   * @param name the file name
+   * @param input the stream of the content, which is not closed by this method
+   * @return a {@link Lease} of the cached file, which must be closed when the file is no longer used
+   * @throws IOException if failed to copy the content
+   */
+  Lease acquire(String name, InputStream input) throws IOException {
+    return store(name, input, null);
+  }
+
+  /**
+   * Copies the content to the cache, unless it is already there.
+   *
+   * @param key the key of the entry or {@code null} to use the hash of the name and content
+   */
+  private Lease store(String name, InputStream input, @Nullable String key) throws IOException {
+    if (!DirUtils.mkdirs(cacheDir)) {
+      throw new IOException("Failed to create PySpark file cache directory " + cacheDir);
+    }
+
+    // Copy to a temporary directory and move it to the entry directory atomically, so that the entry only appears
+    // when it is complete.
+    File tempDir = new File(cacheDir, TEMP_PREFIX + UUID.randomUUID());
+    if (!tempDir.mkdir()) {
+      throw new IOException("Failed to create temporary directory " + tempDir);
+    }
+    try {
+      Hasher hasher = newHasher(name);
+      try (OutputStream os = new FileOutputStream(new File(tempDir, name))) {
+        byte[] buffer = new byte[65536];
+        int len = input.read(buffer);
+        while (len >= 0) {
+          hasher.putBytes(buffer, 0, len);
+          os.write(buffer, 0, len);
+          len = input.read(buffer);
+        }
+      }
+
+      File entryDir = new File(cacheDir, key == null ? hasher.hash().toString() : key);
+      Lease lease = tryAcquire(entryDir, name);
+      if (lease != null) {
+        return lease;
+      }
+
+      try {
+        Files.move(tempDir.toPath(), entryDir.toPath(), StandardCopyOption.ATOMIC_MOVE);
+      } catch (IOException e) {
+        // It fails if the same entry was just added by another run, which is fine.
+        if (!entryDir.isDirectory()) {
+          throw e;
+        }
+      }
+      lease = tryAcquire(entryDir, name);
+      if (lease == null) {
+        throw new IOException("Failed to add " + name + " to the PySpark file cache " + cacheDir);
+      }
+      evict();
+      return lease;
+    } finally {
+      // Only logs a failure to delete, so that it doesn't mask the failure to store
+      if (tempDir.exists()) {
+        delete(tempDir);
+      }
+    }
+  }
+
+  /**
+   * Acquires an existing entry.
+   *
+   * @return the {@link Lease} of the entry or {@code null} if the entry is not in the cache
+   */
+  @Nullable
+  private Lease tryAcquire(File entryDir, String name) {
+    File file = new File(entryDir, name);
+    synchronized (IN_USE) {
+      if (!file.isFile()) {
+        return null;
+      }
+      IN_USE.add(entryDir);
+    }
+    // Marks the entry as recently used, which is the order of eviction
+    if (!entryDir.setLastModified(System.currentTimeMillis())) {
+      LOG.debug("Failed to update last modified time of {}", entryDir);
+    }
+    LOG.debug("Using cached PySpark file {}", file);
+    return new Lease(entryDir, file);
+  }
+
+  /**
+   * Deletes the least recently used entries until the total size of the cache is not larger than the maximum size.
+   * Entries in use by this process and entries used recently are never deleted.
+   */
+  @VisibleForTesting
+  void evict() {
+    List<File> entries = new ArrayList<>();
+    final Map<File, Long> lastModified = new HashMap<>();
+    long totalSize = 0L;
+    long now = System.currentTimeMillis();
+
+    for (File dir : DirUtils.listFiles(cacheDir, new FileFilter() {
+      @Override
+      public boolean accept(File file) {
+        return file.isDirectory();
+      }
+    })) {
+      if (dir.getName().startsWith(TEMP_PREFIX)) {
+        if (now - dir.lastModified() > STALE_TEMP_AGE_MILLIS) {
+          delete(dir);
+        }
+        continue;
+      }
+      entries.add(dir);
+      lastModified.put(dir, dir.lastModified());
+      totalSize += getSize(dir);
+    }
+    if (totalSize <= maxSize) {
+      return;
+    }
+
+    Collections.sort(entries, new Comparator<File>() {
+      @Override
+      public int compare(File o1, File o2) {
+        return Long.compare(lastModified.get(o1), lastModified.get(o2));
+      }
+    });
+
+    for (File entryDir : entries) {
+      if (totalSize <= maxSize || now - lastModified.get(entryDir) < minEvictionAge) {
+        break;
+      }
+      // Rename before deleting, so that the entry disappears atomically
+      File deleteDir = new File(cacheDir, TEMP_PREFIX + UUID.randomUUID());
+      long size = getSize(entryDir);
+      synchronized (IN_USE) {
+        if (IN_USE.contains(entryDir) || !entryDir.renameTo(deleteDir)) {
+          continue;
+        }
+      }
+      LOG.debug("Evicting {} from the PySpark file cache", entryDir);
+      delete(deleteDir);
+      totalSize -= size;
+    }
+  }
+
+  private Hasher newHasher(String name) {
+    return Hashing.sha256().newHasher().putString(name, Charsets.UTF_8).putByte((byte) 0);
+  }
+
+  /**
+   * Returns the checksum of the content of the given {@link URL} without reading it, or {@code null} if it is not
+   * known.
+   */
+  @Nullable
+  private static String getChecksum(URL url) {
+    try {
+      URLConnection connection = url.openConnection();
+      if (!(connection instanceof JarURLConnection)) {
+        return null;
+      }
+      JarEntry entry = ((JarURLConnection) connection).getJarEntry();
+      if (entry == null || entry.getCrc() < 0 || entry.getSize() < 0) {
+        return null;
+      }
+      return String.format("crc32:%d:%d", entry.getCrc(), entry.getSize());
+    } catch (IOException e) {
+      LOG.debug("Failed to get the checksum of {}", url, e);
+      return null;
+    }
+  }
+
+  private static long getSize(File dir) {
+    long size = 0L;
+    for (File file : DirUtils.listFiles(dir)) {
+      size += file.length();
+    }
+    return size;
+  }
+
+  private static void delete(File dir) {
+    try {
+      DirUtils.deleteDirectoryContents(dir);
+    } catch (IOException e) {
+      LOG.warn("Failed to delete directory {}", dir, e);
+    }
+  }
+
+  /**
+   * A cached file in use. The file is not evicted until the lease is closed.
+   */
+  static final class Lease implements Closeable {
+
+    private final File entryDir;
+    private final File file;
+    private final AtomicBoolean closed;
+
+    private Lease(File entryDir, File file) {
+      this.entryDir = entryDir;
+      this.file = file;
+      this.closed = new AtomicBoolean();
+    }
+
+    File getFile() {
+      return file;
+    }
+
+    @Override
+    public void close() {
+      if (closed.compareAndSet(false, true)) {
+        synchronized (IN_USE) {
+          IN_USE.remove(entryDir);
+        }
+      }
+    }
+  }
+}
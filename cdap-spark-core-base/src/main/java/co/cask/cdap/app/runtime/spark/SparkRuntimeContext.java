@@ -139,6 +139,33 @@ public final class SparkRuntimeContext extends AbstractContext implements Metric
     getMetrics().gauge(metricName, value);
   }
 
+  /**
+   * Updates a batch of metrics in one call. This is used by the PySpark library, which aggregates metrics on the
+   * Python side and publishes them through a single gateway call instead of one call per update.
+   *
+   * @param counters a map from counter name to the delta to increase by
+   * @param gauges a map from gauge name to the value to set
+   */
+  public void updateMetrics(Map<String, ? extends Number> counters, Map<String, ? extends Number> gauges) {
+    Metrics metrics = getMetrics();
+    for (Map.Entry<String, ? extends Number> entry : counters.entrySet()) {
+      // Aggregated deltas can go beyond the int range, hence need to be emitted in multiple increments
+      long delta = entry.getValue().longValue();
+      while (delta > Integer.MAX_VALUE) {
+        metrics.count(entry.getKey(), Integer.MAX_VALUE);
+        delta -= Integer.MAX_VALUE;
+      }
+      while (delta < Integer.MIN_VALUE) {
+        metrics.count(entry.getKey(), Integer.MIN_VALUE);
+        delta -= Integer.MIN_VALUE;
+      }
+      metrics.count(entry.getKey(), (int) delta);
+    }
+    for (Map.Entry<String, ? extends Number> entry : gauges.entrySet()) {
+      metrics.gauge(entry.getKey(), entry.getValue().longValue());
+    }
+  }
+
   /**
    * Returns the {@link SparkSpecification} of the spark program of this context.
    */
@@ -144,9 +144,11 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
   private final boolean isLocal;
   private final ProgramLifecycle<SparkRuntimeContext> programLifecycle;
   private final FieldLineageWriter fieldLineageWriter;
+  private final List<PySparkFileCache.Lease> pySparkFileLeases;
 
   private Callable<ListenableFuture<RunId>> submitSpark;
   private Runnable cleanupTask;
+  private PySparkFileCache pySparkFileCache;
 
   SparkRuntimeService(CConfiguration cConf, final Spark spark, @Nullable File pluginArchive,
                       SparkRuntimeContext runtimeContext, SparkSubmitter sparkSubmitter,
@@ -160,6 +162,7 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
     this.completion = new AtomicReference<>();
     this.context = new BasicSparkClientContext(runtimeContext);
     this.isLocal = isLocal;
+    this.pySparkFileLeases = new ArrayList<>();
     this.programLifecycle = new ProgramLifecycle<SparkRuntimeContext>() {
       @Override
       public void initialize(SparkRuntimeContext runtimeContext) throws Exception {
@@ -205,6 +208,7 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
                                                    cConfCopy.get(Constants.AppFabric.TEMP_DIR)).getAbsoluteFile());
     tempDir.mkdirs();
     this.cleanupTask = createCleanupTask(tempDir, System.getProperties());
+    this.pySparkFileCache = isLocal && context.isPySpark() ? createPySparkFileCache(cConfCopy) : null;
     try {
       initialize();
       SparkRuntimeContextConfig contextConfig = new SparkRuntimeContextConfig(runtimeContext.getConfiguration());
@@ -571,6 +575,19 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
       if (isLocal) {
         SparkRuntimeEnv.setProperty("cdap.spark.pyFiles", Joiner.on(File.pathSeparator).join(pyFilePaths));
       }
+
+      // Run the Python workers from the CDAP fork server if enabled. Spark 2.3.1+ reads the daemon module from
+      // the configuration, while earlier versions get it from the PythonWorkerFactory rewritten by SparkClassRewriter.
+      if (Boolean.parseBoolean(configs.get(SparkRuntimeUtils.PYSPARK_DAEMON_ENABLED))) {
+        if (!configs.containsKey("spark.python.daemon.module")) {
+          configs.put("spark.python.daemon.module", SparkRuntimeUtils.PYSPARK_DAEMON_MODULE);
+        }
+        // The fork server gets the environment of the executors
+        String preload = configs.get(SparkRuntimeUtils.PYSPARK_DAEMON_PRELOAD);
+        if (preload != null) {
+          configs.put("spark.executorEnv." + SparkRuntimeUtils.PYSPARK_DAEMON_PRELOAD_ENV, preload);
+        }
+      }
     }
 
     return configs;
@@ -652,23 +669,73 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
       // This shouldn't happen
       throw new IOException("Failed to locate py4j-src.zip, which is required to run PySpark");
     }
-    File file = new File(tempDir, "py4j-src.zip");
-    try (FileOutputStream fos = new FileOutputStream(file)) {
-      Resources.copy(py4jURL, fos);
-    }
-    result.add(file);
+    result.add(copyPySparkFile(py4jURL, new File(tempDir, "py4j-src.zip")));
 
     URL pysparkURL = getClass().getClassLoader().getResource("pyspark/pyspark.zip");
     if (pysparkURL == null) {
       // This shouldn't happen
       throw new IOException("Failed to locate pyspark.zip, which is required to run PySpark");
     }
+    result.add(copyPySparkFile(pysparkURL, new File(tempDir, "pyspark.zip")));
+  }
 
-    file = new File(tempDir, "pyspark.zip");
+  /**
+   * Copies the content of the given {@link URL} to the given file, or gets it from the {@link PySparkFileCache}
+   * if it is enabled.
+   */
+  private File copyPySparkFile(URL url, File file) throws IOException {
+    if (pySparkFileCache != null) {
+      return acquirePySparkFile(pySparkFileCache.acquire(file.getName(), url));
+    }
     try (FileOutputStream fos = new FileOutputStream(file)) {
-      Resources.copy(pysparkURL, fos);
+      Resources.copy(url, fos);
     }
-    result.add(file);
+    return file;
+  }
+
+  /**
+   * Copies the Python script from the given {@link InputStream} to the given file, or gets it from the
+   * {@link PySparkFileCache} if it is enabled.
+   */
+  private File copyPySparkScript(InputStream is, File pythonFile) throws IOException {
+    if (pySparkFileCache != null) {
+      return acquirePySparkFile(pySparkFileCache.acquire(getCachedScriptName(), is));
+    }
+    ByteStreams.copy(is, Files.newOutputStreamSupplier(pythonFile));
+    return pythonFile;
+  }
+
+  /**
+   * Returns the name of the Python script in the {@link PySparkFileCache}. It doesn't include the run id, so that
+   * the script is reused by runs of the same program.
+   */
+  private String getCachedScriptName() {
+    ProgramRunId programRunId = runtimeContext.getProgramRunId();
+    return String.format("%s.%s.%s.py",
+                         programRunId.getNamespace(), programRunId.getApplication(), programRunId.getProgram());
+  }
+
+  /**
+   * Keeps the given {@link PySparkFileCache.Lease} until the program completed.
+   */
+  private File acquirePySparkFile(PySparkFileCache.Lease lease) {
+    pySparkFileLeases.add(lease);
+    return lease.getFile();
+  }
+
+  /**
+   * Creates the {@link PySparkFileCache} for local mode.
+   *
+   * @return the {@link PySparkFileCache} or {@code null} if it is disabled
+   */
+  @Nullable
+  private PySparkFileCache createPySparkFileCache(CConfiguration cConf) {
+    long maxSizeMB = cConf.getLong(Constants.AppFabric.SPARK_PYSPARK_CACHE_SIZE_MB, 0L);
+    String cacheDir = cConf.get(Constants.AppFabric.SPARK_PYSPARK_CACHE_DIR);
+    if (maxSizeMB <= 0 || cacheDir == null) {
+      return null;
+    }
+    return new PySparkFileCache(new File(cacheDir), maxSizeMB * 1024 * 1024);
   }
 
   /**
@@ -689,6 +756,10 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
                                                       programRunId.getProgram(),
                                                       programRunId.getRun()));
     if (context.getPySparkScript() != null) {
+      if (pySparkFileCache != null) {
+        byte[] script = context.getPySparkScript().getBytes(StandardCharsets.UTF_8);
+        return acquirePySparkFile(pySparkFileCache.acquire(getCachedScriptName(), script)).toURI();
+      }
       Files.write(context.getPySparkScript(), pythonFile, StandardCharsets.UTF_8);
       return pythonFile.toURI();
     }
@@ -734,8 +805,7 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
         FileSystem fs = FileSystem.get(scriptURI, hConf);
         InputStream is = fs.open(new Path(scriptURI))
       ) {
-        ByteStreams.copy(is, Files.newOutputStreamSupplier(pythonFile));
-        return pythonFile.toURI();
+        return copyPySparkScript(is, pythonFile).toURI();
       }
     } catch (IOException e) {
       // Not able to copy it with FileSystem. Just log a debug as we'll try to open the URL as last resort
@@ -744,9 +814,8 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
 
     // Last resort, turn the URI to URL and try to copy from it.
     try (InputStream is = scriptURI.toURL().openStream()) {
-      ByteStreams.copy(is, Files.newOutputStreamSupplier(pythonFile));
+      return copyPySparkScript(is, pythonFile).toURI();
     }
-    return pythonFile.toURI();
   }
 
   /**
@@ -864,6 +933,12 @@ final class SparkRuntimeService extends AbstractExecutionThreadService {
         } catch (IOException e) {
           LOG.warn("Failed to cleanup directory {}", directory);
         }
+
+        // Release the cached PySpark files so that they can be evicted
+        for (PySparkFileCache.Lease lease : pySparkFileLeases) {
+          lease.close();
+        }
+        pySparkFileLeases.clear();
       }
     };
   }
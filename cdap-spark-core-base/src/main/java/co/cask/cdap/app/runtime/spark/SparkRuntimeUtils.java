@@ -62,6 +62,12 @@ public final class SparkRuntimeUtils {
 
   public static final String CDAP_SPARK_EXECUTION_SERVICE_URI = "CDAP_SPARK_EXECUTION_SERVICE_URI";
 
+  // Spark configurations for running the PySpark Python workers from the CDAP fork server
+  public static final String PYSPARK_DAEMON_ENABLED = "spark.cdap.pyspark.daemon.enabled";
+  public static final String PYSPARK_DAEMON_PRELOAD = "spark.cdap.pyspark.daemon.preload";
+  public static final String PYSPARK_DAEMON_MODULE = "cdap.pyspark.daemon";
+  public static final String PYSPARK_DAEMON_PRELOAD_ENV = "CDAP_PYSPARK_PRELOAD";
+
   private static final String LOCALIZED_RESOURCES = "spark.cdap.localized.resources";
   private static final Logger LOG = LoggerFactory.getLogger(SparkRuntimeUtils.class);
   private static final Gson GSON = new Gson();
@@ -710,7 +710,8 @@ public class SparkClassRewriter implements ClassRewriter {
 
   /**
    * Rewrite all System.out and System.err redirected via RedirectedPrintStream.
-   * Also update pythonPath field in local mode to include the pyspark library
+   * Also update pythonPath field in local mode to include the pyspark library, and replace the "pyspark.daemon"
+   * module name with the one returned by SparkRuntimeEnv#getPythonDaemonModule(String).
    */
   private byte[] rewritePythonWorkerFactory(InputStream byteCodeStream) throws IOException {
     ClassReader cr = new ClassReader(byteCodeStream);
@@ -760,6 +761,19 @@ public class SparkClassRewriter implements ClassRewriter {
 
             super.visitFieldInsn(opcode, owner, name, desc);
           }
+
+          @Override
+          public void visitLdcInsn(Object cst) {
+            super.visitLdcInsn(cst);
+
+            // Spark before 2.3.1 has the python daemon module hardcoded. Generates
+            // SparkRuntimeEnv.getPythonDaemonModule("pyspark.daemon")
+            // The call has the same stack size, hence no need to update the max stack
+            if ("pyspark.daemon".equals(cst)) {
+              adapter.invokeStatic(SPARK_RUNTIME_ENV_TYPE,
+                                   Methods.getMethod(String.class, "getPythonDaemonModule", String.class));
+            }
+          }
         };
       }
     }, ClassReader.EXPAND_FRAMES);
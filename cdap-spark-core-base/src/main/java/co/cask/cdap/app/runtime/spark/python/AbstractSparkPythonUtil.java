@@ -16,13 +16,30 @@
 
 package co.cask.cdap.app.runtime.spark.python;
 
+import co.cask.cdap.api.workflow.NodeValue;
+import co.cask.cdap.api.workflow.WorkflowToken;
+import co.cask.cdap.app.runtime.spark.SparkRuntimeContext;
+import co.cask.cdap.common.logging.LoggingContextAccessor;
+import co.cask.cdap.internal.app.runtime.workflow.WorkflowProgramInfo;
+import com.google.gson.Gson;
+import com.google.gson.reflect.TypeToken;
+import org.apache.twill.common.Cancellable;
+import org.slf4j.Logger;
+import org.slf4j.LoggerFactory;
 import py4j.GatewayServer;
 import py4j.Py4JNetworkException;
 
 import java.io.IOException;
+import java.lang.reflect.Type;
 import java.nio.charset.StandardCharsets;
 import java.nio.file.Files;
 import java.nio.file.Path;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+import javax.annotation.Nullable;
 
 /**
  * Abstract base utility class for PySpark. Different Spark version has different implementation, due to API changes
@@ -30,6 +47,11 @@ import java.nio.file.Path;
  */
 public abstract class AbstractSparkPythonUtil {
 
+  private static final Gson GSON = new Gson();
+  private static final Type METRICS_MAP_TYPE = new TypeToken<Map<String, Number>>() { }.getType();
+  private static final Type LOG_RECORDS_TYPE = new TypeToken<List<PythonLogRecord>>() { }.getType();
+  private static final Type TOKEN_VALUES_TYPE = new TypeToken<Map<String, String>>() { }.getType();
+
   /**
    * Starts a Py4j gateway server.
    *
@@ -49,4 +71,154 @@ public abstract class AbstractSparkPythonUtil {
     Files.write(portFile, Integer.toString(server.getListeningPort()).getBytes(StandardCharsets.UTF_8));
     return server;
   }
+
+  /**
+   * Encodes the given map as a JSON object. This allows Python to fetch the content of a map with a single gateway
+   * call, instead of one call per entry access on the map proxy.
+   *
+   * @param map the map to encode
+   * @return a JSON object string
+   */
+  public static String toJson(Map<String, String> map) {
+    return GSON.toJson(map);
+  }
+
+  /**
+   * Updates a batch of metrics through the given {@link SparkRuntimeContext}. The metrics are passed as JSON objects,
+   * since py4j converts a Python dictionary into a Java map with one gateway call per entry.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} for emitting the metrics
+   * @param countersJson a JSON object from counter name to the delta to increase by
+   * @param gaugesJson a JSON object from gauge name to the value to set
+   */
+  public static void updateMetrics(SparkRuntimeContext runtimeContext, String countersJson, String gaugesJson) {
+    Map<String, Number> counters = GSON.fromJson(countersJson, METRICS_MAP_TYPE);
+    Map<String, Number> gauges = GSON.fromJson(gaugesJson, METRICS_MAP_TYPE);
+    runtimeContext.updateMetrics(counters, gauges);
+  }
+
+  /**
+   * Emits a batch of log records from a Python program through the CDAP logging pipeline, using the
+   * {@link co.cask.cdap.common.logging.LoggingContext} of the given {@link SparkRuntimeContext}.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} of the program
+   * @param recordsJson a JSON array of objects, each with the {@code logger}, {@code level} and {@code message} fields,
+   *                    where {@code level} is the numeric Python logging level
+   */
+  public static void log(SparkRuntimeContext runtimeContext, String recordsJson) {
+    List<PythonLogRecord> records = GSON.fromJson(recordsJson, LOG_RECORDS_TYPE);
+    Cancellable cancellable = LoggingContextAccessor.setLoggingContext(runtimeContext.getLoggingContext());
+    try {
+      for (PythonLogRecord record : records) {
+        Logger logger = LoggerFactory.getLogger(record.logger);
+        if (record.level >= 40) {
+          logger.error(record.message);
+        } else if (record.level >= 30) {
+          logger.warn(record.message);
+        } else if (record.level >= 20) {
+          logger.info(record.message);
+        } else if (record.level >= 10) {
+          logger.debug(record.message);
+        } else {
+          logger.trace(record.message);
+        }
+      }
+    } finally {
+      cancellable.cancel();
+    }
+  }
+
+  /**
+   * Returns the properties of a plugin as a JSON object, so that Python can read them with a single gateway call.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} of the program
+   * @param pluginId the id of the plugin as used when the program was configured
+   * @return a JSON object from property name to value
+   */
+  public static String getPluginProperties(SparkRuntimeContext runtimeContext, String pluginId) {
+    return GSON.toJson(runtimeContext.getPluginProperties(pluginId).getProperties());
+  }
+
+  /**
+   * Reads a value from the secure store with a single gateway call.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} of the program
+   * @param namespace the namespace of the key or {@code null} to use the program namespace
+   * @param name name of the key
+   * @return the secure value
+   * @throws Exception if failed to read from the secure store
+   */
+  public static byte[] getSecureData(SparkRuntimeContext runtimeContext,
+                                     @Nullable String namespace, String name) throws Exception {
+    return runtimeContext.getSecureData(namespace == null ? runtimeContext.getNamespace() : namespace, name).get();
+  }
+
+  /**
+   * Returns all the user scope values in the {@link WorkflowToken} of the workflow that the program is running in.
+   * It allows Python to read the whole token with a single gateway call.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} of the program
+   * @return a JSON object with the {@code nodeName} field for the node of the program and the {@code values} field,
+   *         which maps each key to the list of {@code [nodeName, value]} pairs in the order they were added;
+   *         or {@code null} if the program is not running in a workflow
+   */
+  @Nullable
+  public static String getWorkflowToken(SparkRuntimeContext runtimeContext) {
+    WorkflowProgramInfo workflowInfo = runtimeContext.getWorkflowInfo();
+    if (workflowInfo == null) {
+      return null;
+    }
+
+    Map<String, List<List<String>>> values = new HashMap<>();
+    for (Map.Entry<String, List<NodeValue>> entry
+      : workflowInfo.getWorkflowToken().getAll(WorkflowToken.Scope.USER).entrySet()) {
+      List<List<String>> nodeValues = new ArrayList<>();
+      for (NodeValue nodeValue : entry.getValue()) {
+        nodeValues.add(Arrays.asList(nodeValue.getNodeName(), nodeValue.getValue().toString()));
+      }
+      values.put(entry.getKey(), nodeValues);
+    }
+    return GSON.toJson(new PythonWorkflowToken(workflowInfo.getNodeId(), values));
+  }
+
+  /**
+   * Puts a batch of values into the {@link WorkflowToken} of the workflow that the program is running in.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} of the program
+   * @param valuesJson a JSON object from key to the value to put
+   * @throws IllegalStateException if the program is not running in a workflow
+   */
+  public static void putWorkflowToken(SparkRuntimeContext runtimeContext, String valuesJson) {
+    WorkflowProgramInfo workflowInfo = runtimeContext.getWorkflowInfo();
+    if (workflowInfo == null) {
+      throw new IllegalStateException("The program is not running in a workflow");
+    }
+    Map<String, String> values = GSON.fromJson(valuesJson, TOKEN_VALUES_TYPE);
+    WorkflowToken token = workflowInfo.getWorkflowToken();
+    for (Map.Entry<String, String> entry : values.entrySet()) {
+      token.put(entry.getKey(), entry.getValue());
+    }
+  }
+
+  /**
+   * The content of a {@link WorkflowToken} sent to a Python program.
+   */
+  private static final class PythonWorkflowToken {
+    private final String nodeName;
+    private final Map<String, List<List<String>>> values;
+
+    PythonWorkflowToken(String nodeName, Map<String, List<List<String>>> values) {
+      this.nodeName = nodeName;
+      this.values = values;
+    }
+  }
+
+  /**
+   * A log record emitted by a Python program.
+   */
+  private static final class PythonLogRecord {
+    private String logger;
+    private int level;
+    private String message;
+  }
 }
@@ -0,0 +1,123 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark.python;
+
+import co.cask.cdap.api.data.batch.BatchWritable;
+import co.cask.cdap.api.dataset.Dataset;
+import co.cask.cdap.app.runtime.spark.SparkRuntimeContext;
+import com.google.common.io.Closeables;
+import com.google.gson.Gson;
+import com.google.gson.reflect.TypeToken;
+import org.apache.tephra.TransactionAware;
+import org.apache.tephra.TransactionContext;
+import org.apache.tephra.TransactionFailureException;
+
+import java.lang.reflect.Type;
+import java.nio.ByteBuffer;
+import java.util.Collections;
+import java.util.Map;
+import javax.annotation.Nullable;
+
+/**
+ * Writes key/value pairs from a Python program to a {@link BatchWritable} dataset, with all writes performed in a
+ * single transaction. Records are passed in batches, so that there is one gateway call per batch instead of one
+ * per record.
+ *
+ * Calls from Python can be served by different gateway threads, hence the transaction is managed explicitly instead
+ * of through the thread bound dataset cache.
+ */
+@SuppressWarnings("unused")
+public final class PythonDatasetWriter {
+
+  private static final Gson GSON = new Gson();
+  private static final Type ARGUMENTS_TYPE = new TypeToken<Map<String, String>>() { }.getType();
+
+  private final Dataset dataset;
+  private final BatchWritable<byte[], byte[]> writable;
+  private final TransactionContext txContext;
+
+  /**
+   * Creates a writer and starts a new transaction.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} of the program
+   * @param namespace the namespace of the dataset or {@code null} to use the program namespace
+   * @param datasetName name of the dataset
+   * @param argumentsJson the dataset arguments as a JSON object
+   * @throws TransactionFailureException if failed to start the transaction
+   */
+  @SuppressWarnings("unchecked")
+  public PythonDatasetWriter(SparkRuntimeContext runtimeContext, @Nullable String namespace, String datasetName,
+                             String argumentsJson) throws TransactionFailureException {
+    Map<String, String> arguments = GSON.fromJson(argumentsJson, ARGUMENTS_TYPE);
+    // Bypass the dataset cache so that the dataset is not bound to the transaction context of the current thread
+    this.dataset = runtimeContext.getDatasetCache().getDataset(
+      namespace == null ? runtimeContext.getNamespace() : namespace, datasetName,
+      arguments == null ? Collections.<String, String>emptyMap() : arguments, true);
+    if (!(dataset instanceof BatchWritable)) {
+      Closeables.closeQuietly(dataset);
+      throw new IllegalArgumentException("Dataset " + datasetName + " is not a BatchWritable");
+    }
+    this.writable = (BatchWritable<byte[], byte[]>) dataset;
+    this.txContext = dataset instanceof TransactionAware
+      ? new TransactionContext(runtimeContext.getTransactionSystemClient(), (TransactionAware) dataset)
+      : new TransactionContext(runtimeContext.getTransactionSystemClient());
+    txContext.start();
+  }
+
+  /**
+   * Writes a batch of records. The batch is a sequence of records, each encoded as a four bytes big endian key
+   * length, the key, a four bytes big endian value length and the value.
+   *
+   * @param batch the encoded records
+   */
+  public synchronized void write(byte[] batch) {
+    ByteBuffer buffer = ByteBuffer.wrap(batch);
+    while (buffer.hasRemaining()) {
+      byte[] key = new byte[buffer.getInt()];
+      buffer.get(key);
+      byte[] value = new byte[buffer.getInt()];
+      buffer.get(value);
+      writable.write(key, value);
+    }
+  }
+
+  /**
+   * Commits the transaction and closes the dataset.
+   *
+   * @throws TransactionFailureException if failed to commit the transaction. The transaction is aborted in that case.
+   */
+  public synchronized void commit() throws TransactionFailureException {
+    try {
+      txContext.finish();
+    } finally {
+      Closeables.closeQuietly(dataset);
+    }
+  }
+
+  /**
+   * Aborts the transaction and closes the dataset.
+   *
+   * @throws TransactionFailureException if failed to abort the transaction
+   */
+  public synchronized void abort() throws TransactionFailureException {
+    try {
+      txContext.abort();
+    } finally {
+      Closeables.closeQuietly(dataset);
+    }
+  }
+}
@@ -0,0 +1,296 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark.python;
+
+import co.cask.cdap.app.runtime.spark.SparkRuntimeContext;
+import com.google.common.io.ByteStreams;
+import com.google.gson.Gson;
+import com.google.gson.reflect.TypeToken;
+import org.apache.twill.common.Threads;
+import org.apache.twill.filesystem.Location;
+import org.apache.twill.filesystem.LocationFactory;
+
+import java.io.BufferedOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.lang.reflect.Type;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.SocketException;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
+import java.util.UUID;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.concurrent.TimeoutException;
+
+/**
+ * Transfers the content of a {@link Location} to or from a Python program through a local socket, so that the
+ * data is streamed with large buffers instead of going through one gateway call per chunk.
+ *
+ * Each instance serves a single connection on the loopback interface. The client first sends the secret returned by
+ * {@link #getSecret()}, followed by a new line. For reads, the server then sends the number of bytes that will follow
+ * as an eight bytes big endian long, followed by the content. For writes, the client sends the content and closes
+ * its side of the connection.
+ */
+@SuppressWarnings("unused")
+public final class PythonLocationStream {
+
+  private static final int BUFFER_SIZE = 1024 * 1024;
+  private static final int ACCEPT_TIMEOUT_MILLIS = 60000;
+  // Maximum time to block on reading from the client, so that an idle client can't hold the thread forever
+  private static final int READ_TIMEOUT_MILLIS = 600000;
+  private static final int LIST_THREADS = 16;
+  private static final Gson GSON = new Gson();
+  private static final Type PATHS_TYPE = new TypeToken<List<String>>() { }.getType();
+
+  private final ServerSocket serverSocket;
+  private final String secret;
+  private final Thread thread;
+  private volatile long bytes;
+  private volatile Throwable failure;
+
+  /**
+   * Starts serving a read of the given {@link Location}.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} for resolving the location
+   * @param path a path relative to the root of the location factory, or an absolute URI
+   * @param offset the position to start reading from. Nothing is read if it is at or past the end.
+   * @param length maximum number of bytes to read, or a negative number to read until the end
+   * @return a {@link PythonLocationStream} for the Python program to connect to
+   * @throws IOException if failed to open the location or to start the server
+   */
+  public static PythonLocationStream read(SparkRuntimeContext runtimeContext, String path,
+                                          long offset, long length) throws IOException {
+    Location location = resolve(runtimeContext.getLocationFactory(), path);
+    long size = Math.max(0L, location.length() - offset);
+    long count = length < 0 ? size : Math.min(size, length);
+    return new PythonLocationStream("python-location-read", (stream, socket) -> {
+      DataOutputStream output = new DataOutputStream(
+        new BufferedOutputStream(socket.getOutputStream(), BUFFER_SIZE));
+      try {
+        output.writeLong(count);
+        if (count > 0) {
+          try (InputStream input = location.getInputStream()) {
+            ByteStreams.skipFully(input, offset);
+            stream.bytes = copy(input, output, count);
+          }
+        }
+        output.flush();
+      } catch (SocketException e) {
+        // The client closed the connection before reading all the content, which is not a failure
+        stream.bytes = -1L;
+      }
+    });
+  }
+
+  /**
+   * Starts serving a write to the given {@link Location}. An existing file is overwritten. The content is written to
+   * a temporary file first and renamed on success, so that the location is left untouched if the client resets the
+   * connection.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} for resolving the location
+   * @param path a path relative to the root of the location factory, or an absolute URI
+   * @return a {@link PythonLocationStream} for the Python program to connect to
+   * @throws IOException if failed to start the server
+   */
+  public static PythonLocationStream write(SparkRuntimeContext runtimeContext, String path) throws IOException {
+    Location location = resolve(runtimeContext.getLocationFactory(), path);
+    return new PythonLocationStream("python-location-write", (stream, socket) -> {
+      Location tmpLocation = location.getTempFile(".tmp");
+      try {
+        long bytes;
+        try (OutputStream output = new BufferedOutputStream(tmpLocation.getOutputStream(), BUFFER_SIZE)) {
+          bytes = ByteStreams.copy(socket.getInputStream(), output);
+        }
+        if (tmpLocation.renameTo(location) == null) {
+          throw new IOException("Failed to rename " + tmpLocation + " to " + location);
+        }
+        stream.bytes = bytes;
+      } finally {
+        tmpLocation.delete();
+      }
+    });
+  }
+
+  /**
+   * Lists the given directories in parallel.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} for resolving the locations
+   * @param pathsJson a JSON array of paths, each relative to the root of the location factory or an absolute URI
+   * @param recursive {@code true} to list the sub-directories recursively
+   * @return a JSON object from each given path to the list of entries under it. Each entry has the {@code path},
+   *         {@code name}, {@code length}, {@code directory} and {@code lastModified} fields.
+   * @throws Exception if failed to list any of the directories
+   */
+  public static String list(SparkRuntimeContext runtimeContext, String pathsJson, boolean recursive) throws Exception {
+    List<String> paths = GSON.fromJson(pathsJson, PATHS_TYPE);
+    LocationFactory locationFactory = runtimeContext.getLocationFactory();
+    ExecutorService executor = Executors.newFixedThreadPool(Math.max(1, Math.min(LIST_THREADS, paths.size())),
+                                                            Threads.createDaemonThreadFactory("python-location-list"));
+    try {
+      Map<String, Future<List<LocationStatus>>> futures = new LinkedHashMap<>();
+      for (String path : paths) {
+        Location location = resolve(locationFactory, path);
+        futures.put(path, executor.submit(() -> list(location, recursive, new ArrayList<>())));
+      }
+      Map<String, List<LocationStatus>> result = new LinkedHashMap<>();
+      for (Map.Entry<String, Future<List<LocationStatus>>> entry : futures.entrySet()) {
+        result.put(entry.getKey(), entry.getValue().get());
+      }
+      return GSON.toJson(result);
+    } finally {
+      executor.shutdownNow();
+    }
+  }
+
+  private PythonLocationStream(String name, StreamHandler handler) throws IOException {
+    this.serverSocket = new ServerSocket(0, 1, InetAddress.getLoopbackAddress());
+    this.serverSocket.setSoTimeout(ACCEPT_TIMEOUT_MILLIS);
+    this.secret = UUID.randomUUID().toString();
+    this.thread = new Thread(() -> {
+      try (ServerSocket server = serverSocket; Socket socket = server.accept()) {
+        socket.setSoTimeout(READ_TIMEOUT_MILLIS);
+        authenticate(socket);
+        handler.handle(this, socket);
+      } catch (Throwable t) {
+        failure = t;
+      }
+    }, name);
+    this.thread.setDaemon(true);
+    this.thread.start();
+  }
+
+  /**
+   * Returns the port to connect to.
+   */
+  public int getPort() {
+    return serverSocket.getLocalPort();
+  }
+
+  /**
+   * Returns the secret that the client must send first.
+   */
+  public String getSecret() {
+    return secret;
+  }
+
+  /**
+   * Waits for the transfer to complete.
+   *
+   * @param timeoutMillis maximum number of milliseconds to wait
+   * @return the number of bytes transferred, or {@code -1} if the client closed a read before the end
+   * @throws Exception if the transfer failed or didn't complete in time
+   */
+  public long await(long timeoutMillis) throws Exception {
+    thread.join(timeoutMillis);
+    if (thread.isAlive()) {
+      throw new TimeoutException("Location transfer did not complete in " + timeoutMillis + " milliseconds");
+    }
+    Throwable t = failure;
+    if (t instanceof Exception) {
+      throw (Exception) t;
+    }
+    if (t != null) {
+      throw new IOException(t);
+    }
+    return bytes;
+  }
+
+  private void authenticate(Socket socket) throws IOException {
+    byte[] expected = (secret + "\n").getBytes(StandardCharsets.UTF_8);
+    byte[] received = new byte[expected.length];
+    // Not buffered, so that no content after the secret is consumed
+    new DataInputStream(socket.getInputStream()).readFully(received);
+    if (!Arrays.equals(expected, received)) {
+      throw new IOException("Connection rejected due to invalid secret");
+    }
+  }
+
+  /**
+   * Copies exactly {@code count} bytes from the given {@link InputStream}.
+   *
+   * @throws EOFException if the stream ends before {@code count} bytes are copied
+   */
+  private static long copy(InputStream input, OutputStream output, long count) throws IOException {
+    byte[] buffer = new byte[(int) Math.min(count, BUFFER_SIZE)];
+    long remaining = count;
+    while (remaining > 0) {
+      int len = input.read(buffer, 0, (int) Math.min(remaining, buffer.length));
+      if (len < 0) {
+        throw new EOFException("Content ended after " + (count - remaining) + " of " + count + " bytes");
+      }
+      output.write(buffer, 0, len);
+      remaining -= len;
+    }
+    return count;
+  }
+
+  private static Location resolve(LocationFactory locationFactory, String path) {
+    return path.contains("://") ? locationFactory.create(URI.create(path)) : locationFactory.create(path);
+  }
+
+  private static List<LocationStatus> list(Location location, boolean recursive,
+                                           List<LocationStatus> result) throws IOException {
+    for (Location child : location.list()) {
+      boolean directory = child.isDirectory();
+      result.add(new LocationStatus(child.toURI().toString(), child.getName(),
+                                    directory ? 0L : child.length(), directory, child.lastModified()));
+      if (directory && recursive) {
+        list(child, true, result);
+      }
+    }
+    return result;
+  }
+
+  /**
+   * Performs the transfer on the accepted connection.
+   */
+  private interface StreamHandler {
+    void handle(PythonLocationStream stream, Socket socket) throws IOException;
+  }
+
+  /**
+   * The status of a {@link Location} sent to a Python program.
+   */
+  private static final class LocationStatus {
+    private final String path;
+    private final String name;
+    private final long length;
+    private final boolean directory;
+    private final long lastModified;
+
+    LocationStatus(String path, String name, long length, boolean directory, long lastModified) {
+      this.path = path;
+      this.name = name;
+      this.length = length;
+      this.directory = directory;
+      this.lastModified = lastModified;
+    }
+  }
+}
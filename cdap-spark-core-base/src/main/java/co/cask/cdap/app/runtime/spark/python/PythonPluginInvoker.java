@@ -0,0 +1,129 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark.python;
+
+import co.cask.cdap.app.runtime.spark.SparkRuntimeContext;
+import com.google.common.annotations.VisibleForTesting;
+import com.google.common.base.Throwables;
+import com.google.gson.Gson;
+import com.google.gson.JsonArray;
+import com.google.gson.JsonElement;
+import com.google.gson.JsonParser;
+
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.lang.reflect.Modifier;
+import java.lang.reflect.Type;
+
+/**
+ * Invokes a method of a plugin instance for a batch of calls from a Python program, so that there is one gateway
+ * call per batch instead of one per record. Arguments and results are passed as JSON and converted to and from
+ * the Java types of the method with Gson.
+ *
+ * The plugin is instantiated like with {@code PluginContext.newPluginInstance}, hence no lifecycle method such as
+ * {@code initialize} or {@code destroy} is called on it. Plugins that need to set up resources must do it when they
+ * are instantiated or on first use. Pipeline plugins such as ETL transforms, which need an initialized context and
+ * emit {@code StructuredRecord}s through an {@code Emitter}, cannot be invoked this way.
+ */
+@SuppressWarnings("unused")
+public final class PythonPluginInvoker {
+
+  private static final Gson GSON = new Gson();
+  private static final JsonParser JSON_PARSER = new JsonParser();
+
+  private final Object plugin;
+  private final Method method;
+  private final Type[] parameterTypes;
+
+  /**
+   * Creates a new plugin instance and resolves the method to invoke.
+   *
+   * @param runtimeContext the {@link SparkRuntimeContext} for instantiating the plugin
+   * @param pluginId the id of the plugin as used when the program was configured
+   * @param methodName name of the public method to invoke
+   * @param arity number of parameters of the method
+   * @throws InstantiationException if failed to create the plugin instance
+   * @throws IllegalArgumentException if there is no unique public method with the given name and number of parameters
+   */
+  public PythonPluginInvoker(SparkRuntimeContext runtimeContext, String pluginId,
+                             String methodName, int arity) throws InstantiationException {
+    this(runtimeContext.newPluginInstance(pluginId), methodName, arity);
+  }
+
+  /**
+   * Resolves the method to invoke on the given plugin instance.
+   */
+  @VisibleForTesting
+  PythonPluginInvoker(Object plugin, String methodName, int arity) {
+    this.plugin = plugin;
+    this.method = findMethod(plugin.getClass(), methodName, arity);
+    this.parameterTypes = method.getGenericParameterTypes();
+  }
+
+  /**
+   * Invokes the method once per entry of the given batch.
+   *
+   * @param argumentsJson a JSON array, where each element is the JSON array of arguments of one invocation
+   * @return a JSON array of the results, in the same order as the invocations
+   * @throws Exception if any invocation failed
+   */
+  public synchronized String invoke(String argumentsJson) throws Exception {
+    JsonArray batch = JSON_PARSER.parse(argumentsJson).getAsJsonArray();
+    JsonArray results = new JsonArray();
+    Object[] arguments = new Object[parameterTypes.length];
+    for (JsonElement element : batch) {
+      JsonArray jsonArguments = element.getAsJsonArray();
+      if (jsonArguments.size() != arguments.length) {
+        throw new IllegalArgumentException("Method " + method + " expects " + arguments.length
+                                             + " arguments, but " + jsonArguments.size() + " were given");
+      }
+      for (int i = 0; i < arguments.length; i++) {
+        arguments[i] = GSON.fromJson(jsonArguments.get(i), parameterTypes[i]);
+      }
+      try {
+        results.add(GSON.toJsonTree(method.invoke(plugin, arguments)));
+      } catch (InvocationTargetException e) {
+        Throwable cause = e.getCause();
+        Throwables.propagateIfPossible(cause, Exception.class);
+        throw Throwables.propagate(cause);
+      }
+    }
+    return GSON.toJson(results);
+  }
+
+  private static Method findMethod(Class<?> pluginClass, String methodName, int arity) {
+    Method found = null;
+    for (Method method : pluginClass.getMethods()) {
+      if (!method.getName().equals(methodName) || method.getParameterTypes().length != arity
+        || Modifier.isStatic(method.getModifiers()) || method.isBridge()) {
+        continue;
+      }
+      if (found != null) {
+        throw new IllegalArgumentException("Plugin class " + pluginClass.getName() + " has more than one method "
+                                             + methodName + " with " + arity + " parameters");
+      }
+      found = method;
+    }
+    if (found == null) {
+      throw new IllegalArgumentException("Plugin class " + pluginClass.getName() + " has no public method "
+                                           + methodName + " with " + arity + " parameters");
+    }
+    // The plugin class may not be public
+    found.setAccessible(true);
+    return found;
+  }
+}
@@ -19,6 +19,7 @@ package co.cask.cdap.app.runtime.spark
 import com.google.common.reflect.TypeToken
 import org.apache.spark.SparkConf
 import org.apache.spark.SparkContext
+import org.apache.spark.SparkEnv
 import org.apache.spark.scheduler.SparkListener
 import org.apache.spark.scheduler.SparkListenerApplicationStart
 import org.apache.spark.streaming.StreamingContext
@@ -84,6 +85,20 @@ object SparkRuntimeEnv {
     */
   def getProperty(key: String): String = properties.getProperty(key)
 
+  /**
+    * Returns the Python module that Spark runs as the fork server of the Python workers. It is called by the
+    * `PythonWorkerFactory` rewritten by the `SparkClassRewriter`.
+    *
+    * @param defaultModule the module that Spark would run
+    * @return the CDAP fork server module if it is enabled in the Spark configuration, otherwise the default module
+    */
+  def getPythonDaemonModule(defaultModule: String): String = {
+    Option(SparkEnv.get)
+      .filter(_.conf.getBoolean(SparkRuntimeUtils.PYSPARK_DAEMON_ENABLED, false))
+      .map(_ => SparkRuntimeUtils.PYSPARK_DAEMON_MODULE)
+      .getOrElse(defaultModule)
+  }
+
   /**
     * Puts all global properties into the given [[org.apache.spark.SparkConf]].
     */
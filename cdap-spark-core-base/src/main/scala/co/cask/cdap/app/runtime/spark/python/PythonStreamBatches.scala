@@ -0,0 +1,148 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark.python
+
+import java.io.{BufferedOutputStream, DataOutputStream, File, FileOutputStream}
+import java.nio.charset.StandardCharsets
+
+import co.cask.cdap.api.flow.flowlet.StreamEvent
+import co.cask.cdap.app.runtime.spark.SparkClassLoader
+import com.google.gson.Gson
+import org.apache.spark.SparkContext
+import org.apache.spark.TaskContext
+import org.apache.spark.api.java.JavaRDD
+
+import scala.collection.mutable
+import scala.reflect.ClassTag
+
+/**
+  * Reads stream events for Python in batches written to local files, so that the Python worker can memory map
+  * the files instead of receiving each event body through the worker socket.
+  *
+  * Each element of the resulting RDD is the UTF-8 encoded absolute path of a batch file on the executor host.
+  * A batch file is a sequence of events, each encoded as an eight bytes timestamp, a four bytes headers length,
+  * the headers as a JSON object, a four bytes body length and the body. All numbers are big endian and
+  * the headers length is zero if there is no header. The Python side deletes the file once it is mapped.
+  * Files that the Python worker didn't consume, for example because the task failed, are deleted when the task
+  * completes.
+  */
+object PythonStreamBatches {
+
+  /**
+    * Creates a [[org.apache.spark.api.java.JavaRDD]] of batch file paths by reading from the given stream.
+    *
+    * @param sc the [[org.apache.spark.SparkContext]] to use
+    * @param namespace namespace of the stream
+    * @param streamName name of the stream
+    * @param startTime the starting time of the stream to be read in milliseconds (inclusive)
+    * @param endTime the ending time of the stream to be read in milliseconds (exclusive)
+    * @param batchSize maximum number of events in a batch file
+    * @param directory the local directory for the batch files, for example a tmpfs mount such as `/dev/shm`.
+    *                  If it is `null`, the JVM temporary directory is used.
+    * @return a new [[org.apache.spark.api.java.JavaRDD]] of batch file paths
+    */
+  def fromStream(sc: SparkContext, namespace: String, streamName: String, startTime: Long, endTime: Long,
+                 batchSize: Int, directory: String): JavaRDD[Array[Byte]] = {
+    val sec = SparkClassLoader.findFromContext().getSparkExecutionContext(false)
+    val ct: ClassTag[StreamEvent] = ClassTag(classOf[StreamEvent])
+    val events = sec.fromStream[StreamEvent](sc, namespace, streamName, startTime, endTime)(ct, (e: StreamEvent) => e)
+    val dir = Option(directory)
+    JavaRDD.fromRDD(events.mapPartitions(itor => {
+      val batches = new BatchFileIterator(itor, batchSize, dir)
+      TaskContext.get().addTaskCompletionListener(context => batches.deleteFiles())
+      batches
+    }))
+  }
+
+  /**
+    * An [[scala.Iterator]] that writes up to `batchSize` events to a new batch file on each call to `next`.
+    * It is iterated by the thread that feeds the Python worker, while [[BatchFileIterator#deleteFiles]] is called
+    * by the task thread.
+    */
+  private final class BatchFileIterator(events: Iterator[StreamEvent], batchSize: Int,
+                                        directory: Option[String]) extends Iterator[Array[Byte]] {
+
+    private val gson = new Gson()
+    private val dir = new File(directory.getOrElse(System.getProperty("java.io.tmpdir")))
+
+    // Batch files created so far. Guarded by itself.
+    private val files = mutable.ArrayBuffer[File]()
+    @volatile private var deleted = false
+
+    override def hasNext: Boolean = !deleted && events.hasNext
+
+    override def next(): Array[Byte] = {
+      val file = files.synchronized {
+        if (deleted) {
+          throw new NoSuchElementException("Batch files were already deleted at task completion")
+        }
+        files += File.createTempFile("stream", ".batch", dir)
+        files.last
+      }
+      try {
+        val output = new DataOutputStream(new BufferedOutputStream(new FileOutputStream(file), 65536))
+        try {
+          var count = 0
+          while (count < batchSize && events.hasNext) {
+            write(events.next(), output)
+            count += 1
+          }
+        } finally {
+          output.close()
+        }
+      } catch {
+        case t: Throwable =>
+          file.delete()
+          throw t
+      }
+      file.getAbsolutePath.getBytes(StandardCharsets.UTF_8)
+    }
+
+    /**
+      * Deletes the batch files that are still present and stops creating new ones. Files consumed by the Python
+      * worker are already deleted.
+      */
+    def deleteFiles(): Unit = {
+      files.synchronized {
+        deleted = true
+        files.foreach(_.delete())
+        files.clear()
+      }
+    }
+
+    private def write(event: StreamEvent, output: DataOutputStream): Unit = {
+      output.writeLong(event.getTimestamp)
+      if (event.getHeaders.isEmpty) {
+        output.writeInt(0)
+      } else {
+        val headers = gson.toJson(event.getHeaders).getBytes(StandardCharsets.UTF_8)
+        output.writeInt(headers.length)
+        output.write(headers)
+      }
+
+      val body = event.getBody
+      output.writeInt(body.remaining())
+      if (body.hasArray) {
+        output.write(body.array(), body.arrayOffset() + body.position(), body.remaining())
+      } else {
+        val bytes = new Array[Byte](body.remaining())
+        body.duplicate().get(bytes)
+        output.write(bytes)
+      }
+    }
+  }
+}
@@ -0,0 +1,154 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark;
+
+import co.cask.cdap.api.common.Bytes;
+import co.cask.cdap.common.utils.DirUtils;
+import com.google.common.base.Charsets;
+import com.google.common.io.Files;
+import org.junit.Assert;
+import org.junit.ClassRule;
+import org.junit.Test;
+import org.junit.rules.TemporaryFolder;
+
+import java.io.ByteArrayInputStream;
+import java.io.File;
+import java.io.FileOutputStream;
+import java.net.URL;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.concurrent.Callable;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.jar.JarEntry;
+import java.util.jar.JarOutputStream;
+
+/**
+ * Unit tests for {@link PySparkFileCache}.
+ */
+public class PySparkFileCacheTest {
+
+  @ClassRule
+  public static final TemporaryFolder TEMP_FOLDER = new TemporaryFolder();
+
+  @Test
+  public void testReuse() throws Exception {
+    PySparkFileCache cache = new PySparkFileCache(TEMP_FOLDER.newFolder(), 1024 * 1024);
+
+    try (
+      PySparkFileCache.Lease lease1 = cache.acquire("script.py", Bytes.toBytes("print 'hello'"));
+      PySparkFileCache.Lease lease2 = cache.acquire("script.py",
+                                                    new ByteArrayInputStream(Bytes.toBytes("print 'hello'")));
+      PySparkFileCache.Lease lease3 = cache.acquire("script.py", Bytes.toBytes("print 'world'"));
+      PySparkFileCache.Lease lease4 = cache.acquire("other.py", Bytes.toBytes("print 'hello'"))
+    ) {
+      Assert.assertEquals("script.py", lease1.getFile().getName());
+      Assert.assertEquals("print 'hello'", Files.toString(lease1.getFile(), Charsets.UTF_8));
+
+      // Same name and content share the entry, regardless of how the content is provided
+      Assert.assertEquals(lease1.getFile(), lease2.getFile());
+      Assert.assertNotEquals(lease1.getFile(), lease3.getFile());
+      Assert.assertNotEquals(lease1.getFile(), lease4.getFile());
+      Assert.assertEquals("print 'world'", Files.toString(lease3.getFile(), Charsets.UTF_8));
+    }
+  }
+
+  @Test
+  public void testJarEntry() throws Exception {
+    File jarFile = TEMP_FOLDER.newFile("pyspark.jar");
+    try (JarOutputStream output = new JarOutputStream(new FileOutputStream(jarFile))) {
+      output.putNextEntry(new JarEntry("pyspark/py4j-src.zip"));
+      output.write(Bytes.toBytes("py4j"));
+      output.closeEntry();
+    }
+    URL url = new URL("jar:" + jarFile.toURI() + "!/pyspark/py4j-src.zip");
+
+    PySparkFileCache cache = new PySparkFileCache(TEMP_FOLDER.newFolder(), 1024 * 1024);
+    try (
+      PySparkFileCache.Lease lease1 = cache.acquire("py4j-src.zip", url);
+      PySparkFileCache.Lease lease2 = cache.acquire("py4j-src.zip", url)
+    ) {
+      Assert.assertEquals("py4j", Files.toString(lease1.getFile(), Charsets.UTF_8));
+      Assert.assertEquals(lease1.getFile(), lease2.getFile());
+    }
+  }
+
+  @Test
+  public void testConcurrentAcquire() throws Exception {
+    final PySparkFileCache cache = new PySparkFileCache(TEMP_FOLDER.newFolder(), 1024 * 1024);
+    final byte[] content = new byte[100000];
+
+    ExecutorService executor = Executors.newFixedThreadPool(8);
+    try {
+      List<Future<PySparkFileCache.Lease>> futures = new ArrayList<>();
+      for (int i = 0; i < 32; i++) {
+        futures.add(executor.submit(new Callable<PySparkFileCache.Lease>() {
+          @Override
+          public PySparkFileCache.Lease call() throws Exception {
+            return cache.acquire("pyspark.zip", new ByteArrayInputStream(content));
+          }
+        }));
+      }
+
+      File file = null;
+      for (Future<PySparkFileCache.Lease> future : futures) {
+        try (PySparkFileCache.Lease lease = future.get()) {
+          if (file == null) {
+            file = lease.getFile();
+          }
+          Assert.assertEquals(file, lease.getFile());
+          Assert.assertEquals(content.length, lease.getFile().length());
+        }
+      }
+      // Only the entry is left, without any temporary directory
+      Assert.assertEquals(1, DirUtils.list(file.getParentFile().getParentFile()).size());
+    } finally {
+      executor.shutdownNow();
+    }
+  }
+
+  @Test
+  public void testEviction() throws Exception {
+    PySparkFileCache cache = new PySparkFileCache(TEMP_FOLDER.newFolder(), 250, 0L);
+
+    PySparkFileCache.Lease lease1 = cache.acquire("file1", new byte[100]);
+    PySparkFileCache.Lease lease2 = cache.acquire("file2", new byte[100]);
+    File file1 = lease1.getFile();
+    File file2 = lease2.getFile();
+    lease2.close();
+
+    // Make the entry of file2 the least recently used one, while file1 is still in use
+    Assert.assertTrue(file1.getParentFile().setLastModified(System.currentTimeMillis() - 20000));
+    Assert.assertTrue(file2.getParentFile().setLastModified(System.currentTimeMillis() - 10000));
+
+    // Adding a third entry exceeds the maximum size. The file in use is kept and the unused one is evicted.
+    try (PySparkFileCache.Lease lease3 = cache.acquire("file3", new byte[100])) {
+      Assert.assertTrue(file1.exists());
+      Assert.assertFalse(file2.exists());
+      Assert.assertTrue(lease3.getFile().exists());
+    }
+
+    // After release, the least recently used entry is evicted
+    lease1.close();
+    Assert.assertTrue(file1.getParentFile().setLastModified(System.currentTimeMillis() - 20000));
+    try (PySparkFileCache.Lease lease4 = cache.acquire("file4", new byte[100])) {
+      Assert.assertFalse(file1.exists());
+      Assert.assertTrue(lease4.getFile().exists());
+    }
+  }
+}
@@ -0,0 +1,111 @@
+/*
+ * Copyright © 2018 Cask Data, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ */
+
+package co.cask.cdap.app.runtime.spark.python;
+
+import org.junit.Assert;
+import org.junit.Test;
+
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+/**
+ * Unit tests for {@link PythonPluginInvoker}.
+ */
+public class PythonPluginInvokerTest {
+
+  @Test
+  public void testInvokeBatch() throws Exception {
+    PythonPluginInvoker invoker = new PythonPluginInvoker(new TestPlugin(), "add", 2);
+    Assert.assertEquals("[3,-1,0]", invoker.invoke("[[1,2],[-3,2],[0,0]]"));
+    Assert.assertEquals("[]", invoker.invoke("[]"));
+  }
+
+  @Test
+  public void testGenericTypes() throws Exception {
+    PythonPluginInvoker invoker = new PythonPluginInvoker(new TestPlugin(), "count", 1);
+    Assert.assertEquals("[{\"a\":2,\"b\":1},{}]", invoker.invoke("[[[\"a\",\"b\",\"a\"]],[[]]]"));
+  }
+
+  @Test
+  public void testNonPublicClass() throws Exception {
+    PythonPluginInvoker invoker = new PythonPluginInvoker(new HiddenPlugin(), "upper", 1);
+    Assert.assertEquals("[\"CAFÉ\",null]", invoker.invoke("[[\"café\"],[null]]"));
+  }
+
+  @Test(expected = IllegalArgumentException.class)
+  public void testWrongArguments() throws Exception {
+    new PythonPluginInvoker(new TestPlugin(), "add", 2).invoke("[[1]]");
+  }
+
+  @Test(expected = IllegalArgumentException.class)
+  public void testMissingMethod() {
+    new PythonPluginInvoker(new TestPlugin(), "add", 3);
+  }
+
+  @Test(expected = IllegalArgumentException.class)
+  public void testAmbiguousMethod() {
+    new PythonPluginInvoker(new TestPlugin(), "format", 1);
+  }
+
+  @Test(expected = IllegalStateException.class)
+  public void testPluginFailure() throws Exception {
+    // The exception thrown by the plugin is propagated instead of an InvocationTargetException
+    new PythonPluginInvoker(new TestPlugin(), "fail", 1).invoke("[[\"failure\"]]");
+  }
+
+  /**
+   * Plugin class with methods to invoke.
+   */
+  public static final class TestPlugin {
+
+    public int add(int a, int b) {
+      return a + b;
+    }
+
+    public Map<String, Integer> count(List<String> words) {
+      Map<String, Integer> counts = new HashMap<>();
+      for (String word : words) {
+        Integer count = counts.get(word);
+        counts.put(word, count == null ? 1 : count + 1);
+      }
+      return counts;
+    }
+
+    public String format(String value) {
+      return value;
+    }
+
+    public String format(int value) {
+      return Integer.toString(value);
+    }
+
+    public String fail(String message) {
+      throw new IllegalStateException(message);
+    }
+  }
+
+  /**
+   * Plugin class that is not public.
+   */
+  private static final class HiddenPlugin {
+
+    public String upper(String value) {
+      return value == null ? null : value.toUpperCase();
+    }
+  }
+}
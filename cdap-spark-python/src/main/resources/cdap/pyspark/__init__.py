@@ -15,5 +15,6 @@
 # the License.
 
 from context import *
+from udf import *
 
-__all__ = ["SparkExecutionContext", "Metrics", "ServiceDiscoverer"]
+__all__ = ["SparkExecutionContext", "Metrics", "ServiceDiscoverer", "vectorizedUDF"]
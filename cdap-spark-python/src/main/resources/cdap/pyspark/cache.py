@@ -0,0 +1,118 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import atexit
+import time
+from threading import Event, RLock, Thread
+
+__all__ = ["TTLCache"]
+
+class TTLCache(object):
+  """
+    Process-wide cache of values loaded from the JVM. Each entry remembers when it was loaded and the expiry is
+    decided by the caller on each lookup, so that callers with different TTLs can share the same cache.
+
+    An entry is evicted once the TTL it was loaded with has passed, by a daemon thread that wakes up at the
+    earliest expiry, so that values don't stay in memory after they stopped being used. The `hits` and `misses`
+    attributes count the lookups.
+  """
+
+  def __init__(self):
+    self._lock = RLock()
+    # Key to a (value, load time, expiry time) tuple
+    self._entries = {}
+    self._nextExpiry = None
+    self._evictor = None
+    self._wakeup = Event()
+    self._stopped = Event()
+    self.hits = 0
+    self.misses = 0
+    atexit.register(self.close)
+
+  def get(self, key, ttl, loader, negativeTtl = None):
+    """
+      Returns the cached value for the given key if it is not expired, otherwise calls the loader to load it.
+
+      :param key: the cache key
+      :param ttl: number of seconds a value stays valid
+      :param loader: a function that takes no argument and returns the value
+      :param negativeTtl: an optional number of seconds a `None` value stays valid. Defaults to `ttl`.
+    """
+    if negativeTtl is None:
+      negativeTtl = ttl
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        value, loadTime, _ = entry
+        if time.time() - loadTime < (negativeTtl if value is None else ttl):
+          self.hits += 1
+          return value
+      self.misses += 1
+
+    value = loader()
+    now = time.time()
+    expiry = now + (negativeTtl if value is None else ttl)
+    if expiry <= now:
+      # Caching is disabled for this value
+      return value
+    with self._lock:
+      self._entries[key] = (value, now, expiry)
+      # The evictor thread doesn't survive a fork, hence a thread that is not alive is replaced
+      if self._evictor is None or not self._evictor.is_alive():
+        self._startEvictor()
+      elif self._nextExpiry is None or expiry < self._nextExpiry:
+        self._wakeup.set()
+    return value
+
+  def invalidate(self, key = None):
+    """
+      Removes the entry of the given key, or all entries if key is `None`.
+    """
+    with self._lock:
+      if key is None:
+        self._entries.clear()
+      else:
+        self._entries.pop(key, None)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def close(self):
+    """
+      Stops the eviction thread.
+    """
+    self._stopped.set()
+    self._wakeup.set()
+    if self._evictor is not None:
+      self._evictor.join(1)
+
+  def _startEvictor(self):
+    self._wakeup.clear()
+    self._evictor = Thread(target = self._evict, name = "cdap-cache-evictor")
+    self._evictor.daemon = True
+    self._evictor.start()
+
+  def _evict(self):
+    while not self._stopped.is_set():
+      with self._lock:
+        now = time.time()
+        for key, (_, _, expiry) in list(self._entries.items()):
+          if expiry <= now:
+            del self._entries[key]
+        self._nextExpiry = min(expiry for _, _, expiry in self._entries.values()) if self._entries else None
+      # Without entries, the thread waits until the next value is cached
+      self._wakeup.wait(None if self._nextExpiry is None else self._nextExpiry - now)
+      self._wakeup.clear()
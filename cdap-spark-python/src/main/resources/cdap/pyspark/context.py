@@ -14,31 +14,40 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import atexit
+import json
 import os
 from threading import RLock
 
-from py4j.java_gateway import java_import, JavaGateway
-
-try:
-  # The JavaObject is only needed for the Spark 1 hack. Failure to import in future Spark/py4j version is ok.
-  from py4j.java_gateway import JavaObject
-except:
-  pass
-try:
-  # The CallbackServer is only needed for the Spark < 1.6 hack. Failure to import in future Spark/py4j version is ok.
-  from py4j.java_gateway import CallbackServer
-except:
-  pass
+# The py4j modules and the modules of the individual features are only imported when they are first used, so that
+# importing this module stays cheap for scripts and Python workers that never interact with CDAP.
 
 __all__ = ["SparkExecutionContext", "Metrics", "ServiceDiscoverer"]
 
+# Runtime argument for enabling the profiling of the round trips to the Java gateway
+PROFILING_ARGUMENT = "system.pyspark.gateway.profiling.enabled"
+
+# File in the working directory with the port of the Java gateway, written by the container launcher in distributed mode
+GATEWAY_PORT_FILE = "cdap.py4j.gateway.port.txt"
+
 class SparkExecutionContext(object):
   """
     Spark program execution context. User Spark program can interact with CDAP through this context.
   """
 
-  def __init__(self):
-    self._runtimeContext = SparkRuntimeContext()
+  def __init__(self, gatewayPoolSize = 0, gatewayThreadAffinity = False, gatewayProfiling = False):
+    """
+      :param gatewayPoolSize: number of connections to the Java gateway to pre-open and keep idle in each
+                              Python process. When it is `0`, the default py4j connection handling is used.
+      :param gatewayThreadAffinity: if `True`, each Python thread keeps reusing its own gateway connection.
+                                    It only applies if `gatewayPoolSize` is greater than `0`.
+      :param gatewayProfiling: if `True`, the round trips to the Java gateway are measured in the driver and
+                               on the executors, published as metrics and reported by the driver when the
+                               program ends. It can also be enabled with the
+                               `system.pyspark.gateway.profiling.enabled` runtime argument.
+    """
+    self._runtimeContext = SparkRuntimeContext(poolSize = gatewayPoolSize, threadAffinity = gatewayThreadAffinity,
+                                               profiling = gatewayProfiling)
 
   def getLogicalStartTime(self):
     """
@@ -49,7 +58,7 @@ class SparkExecutionContext(object):
       :return:
         Time in milliseconds since epoch time (00:00:00 January 1, 1970 UTC).
     """
-    return self._runtimeContext.getSparkRuntimeContext().getLogicalStartTime()
+    return self._runtimeContext.getLogicalStartTime()
 
 
   def getRuntimeArguments(self):
@@ -58,27 +67,274 @@ class SparkExecutionContext(object):
       :return:
         A dictionary of argument key and value
     """
-    return self._runtimeContext.getSparkRuntimeContext().getRuntimeArguments()
+    return dict(self._runtimeContext.getRuntimeArguments())
 
-  def getMetrics(self):
+  def getWorkflowToken(self):
+    """
+      Returns the :class:`WorkflowToken` of the workflow that this Spark program is running in. Reads are cached
+      in the Python process and puts are sent to CDAP together when the program ends, or when
+      :meth:`WorkflowToken.flush` is called. The token can be passed in closures for reading.
+
+      :return:
+        a :class:`WorkflowToken`, or `None` if the program is not running in a workflow
+    """
+    return self._runtimeContext.getWorkflowToken()
+
+  def getSecureData(self, namespace, key, ttl = 300):
+    """
+      Reads a value from the CDAP secure store. Values are cached in the Python process for `ttl` seconds.
+      The returned :class:`SecureData` cannot be pickled; use :meth:`broadcastSecureData` to use secure data
+      in closures.
+
+      :param namespace: the namespace of the key, or `None` for the namespace of the program
+      :param key: the secure key
+      :param ttl: number of seconds a value read from the secure store is cached. Setting it to `0` disables caching.
+      :return:
+        a :class:`SecureData` object
+    """
+    from security import SecureData
+    return SecureData(key, self._runtimeContext.getSecureData(namespace, key, ttl))
+
+  def broadcastSecureData(self, keys, namespace = None, ttl = 300, sparkContext = None):
+    """
+      Reads values from the CDAP secure store in the driver and ships them to executors once, through a Spark
+      broadcast variable. The returned :class:`SecureDataBroadcast` can be passed in closures; it carries only
+      the broadcast reference, not the secure values. The broadcast itself is not encrypted by CDAP, see
+      :class:`SecureDataBroadcast`.
+
+      :param keys: the secure keys to broadcast
+      :param namespace: an optional namespace of the keys. Defaults to the namespace of the program.
+      :param ttl: number of seconds a value read from the secure store is cached in the driver
+      :param sparkContext: the SparkContext to use. Defaults to the active one.
+      :return:
+        a :class:`SecureDataBroadcast` object
+    """
+    # Imported here so that pyspark is only loaded when broadcasting
+    from pyspark import SparkContext
+    from security import SecureDataBroadcast
+
+    sc = sparkContext or SparkContext.getOrCreate()
+    if namespace is None:
+      namespace = self._runtimeContext.getSparkRuntimeContext().getNamespace()
+    values = dict(((namespace, key), self._runtimeContext.getSecureData(namespace, key, ttl)) for key in keys)
+    return SecureDataBroadcast(sc.broadcast(values), namespace)
+
+  def getPluginContext(self):
+    """
+      Returns a :class:`PluginContext` for using the plugins of this Spark program. Plugin methods can be called
+      in batches through :meth:`PluginContext.getInvoker`. It can be passed in closures.
+
+      :return:
+        a :class:`PluginContext` object
+    """
+    from plugin import PluginContext
+    return PluginContext(self._runtimeContext)
+
+  def getLocation(self, path):
+    """
+      Returns a :class:`Location` for reading and writing a file through the CDAP location factory.
+      It can be passed in closures, for example to load side inputs on the executors.
+
+      :param path: a path relative to the root of the location factory, or an absolute URI
+      :return:
+        a :class:`Location` object
+    """
+    from location import Location
+    return Location(self._runtimeContext, path)
+
+  def listLocations(self, paths, recursive = False):
+    """
+      Lists multiple directories in parallel, with a single call to the JVM.
+
+      :param paths: the paths of the directories, each relative to the root of the location factory or an absolute URI
+      :param recursive: if `True`, sub-directories are listed recursively
+      :return:
+        a dictionary from each path to the list of :class:`LocationStatus` under it
+    """
+    from location import listLocations
+    return listLocations(self._runtimeContext, paths, recursive)
+
+  def getGatewayProfiler(self):
+    """
+      Returns the :class:`GatewayProfiler` of the Python process, which can be used to print a report of the
+      round trips to the JVM at any point of the program.
+
+      :return:
+        a :class:`GatewayProfiler`, or `None` if gateway profiling is not enabled
+    """
+    return self._runtimeContext.getGatewayProfiler()
+
+  def getMetrics(self, buffered = False):
     """
       Returns a :class:`Metrics` object which can be used to emit custom metrics from the Spark program.
       This can also be passed in closures and workers can emit their own metrics.
 
+      :param buffered: if `True`, metrics are aggregated in the Python process and published to CDAP in batches,
+                       instead of making one call to the JVM per metric update
       :return:
         a :class:`Metrics` object
     """
-    return Metrics(self._runtimeContext)
+    return Metrics(self._runtimeContext, buffered)
 
-  def getServiceDiscoverer(self):
+  def getServiceDiscoverer(self, cacheTTL = 60, negativeCacheTTL = 5):
     """
       Returns a :class:`ServiceDiscoverer` for Service Discovery
       in Spark Program which can be passed in closures.
 
+      :param cacheTTL: number of seconds a discovered service URL is cached in the Python process.
+                       Setting it to `0` disables caching.
+      :param negativeCacheTTL: number of seconds the absence of a service is cached in the Python process
       :return:
         a :class:`ServiceDiscoverer` object
     """
-    return ServiceDiscoverer(self._runtimeContext)
+    return ServiceDiscoverer(self._runtimeContext, cacheTTL, negativeCacheTTL)
+
+  def fromDataset(self, datasetName, namespace = None, arguments = None, sqlContext = None, asPandas = False):
+    """
+      Reads a CDAP Dataset as a DataFrame. The Dataset is read by the JVM through the `cdap` Spark SQL data source,
+      hence records are not serialized to Python one by one. The Dataset must be `RecordScannable`.
+
+      :param datasetName: name of the Dataset
+      :param namespace: an optional namespace of the Dataset. Defaults to the namespace of the program.
+      :param arguments: an optional dictionary of Dataset arguments
+      :param sqlContext: the SQLContext or SparkSession to use. Defaults to the one of the active SparkContext.
+      :param asPandas: if `True`, returns a pandas DataFrame. It is converted with `toPandas`, which sends the rows
+                       to Python one by one on Spark versions before 2.3.
+      :return: a Spark DataFrame, or a pandas DataFrame if `asPandas` is `True`
+    """
+    from dataframes import getSQLContext
+    sqlContext = getSQLContext(sqlContext)
+    reader = sqlContext.read.format("cdap").options(**self._getSourceOptions(namespace, arguments))
+    dataFrame = reader.load(datasetName)
+    return dataFrame.toPandas() if asPandas else dataFrame
+
+  def saveAsDataset(self, data, datasetName, namespace = None, arguments = None, sqlContext = None):
+    """
+      Writes a DataFrame to a CDAP Dataset through the `cdap` Spark SQL data source. The Dataset must be
+      `RecordWritable`.
+
+      :param data: a Spark DataFrame, or a pandas DataFrame, which is converted with `createDataFrame`
+      :param datasetName: name of the Dataset
+      :param namespace: an optional namespace of the Dataset. Defaults to the namespace of the program.
+      :param arguments: an optional dictionary of Dataset arguments
+      :param sqlContext: the SQLContext or SparkSession to use. Defaults to the one of the active SparkContext.
+    """
+    from dataframes import getSQLContext, isPandasDataFrame
+    if isPandasDataFrame(data):
+      data = getSQLContext(sqlContext).createDataFrame(data)
+    data.write.format("cdap").options(**self._getSourceOptions(namespace, arguments)).save(datasetName)
+
+  def getLookup(self, datasetName, namespace = None, arguments = None, keyColumn = "key", valueColumn = "value",
+                maxBroadcastBytes = 64 * 1024 * 1024, sqlContext = None):
+    """
+      Returns a :class:`DatasetLookup` for enriching records with the values of a key/value Dataset, such as a
+      `KeyValueTable`. If the Dataset is not bigger than `maxBroadcastBytes`, it is loaded once into a compact hash
+      table that is broadcasted to the executors. Otherwise, lookups fall back to a partitioned join.
+      The Dataset is read through :meth:`fromDataset`.
+
+      :param datasetName: name of the Dataset
+      :param namespace: an optional namespace of the Dataset. Defaults to the namespace of the program.
+      :param arguments: an optional dictionary of Dataset arguments
+      :param keyColumn: name of the column with the keys
+      :param valueColumn: name of the column with the values
+      :param maxBroadcastBytes: approximate maximum size of the table to broadcast
+      :param sqlContext: the SQLContext or SparkSession to use. Defaults to the one of the active SparkContext.
+      :return:
+        a :class:`DatasetLookup` object
+    """
+    from lookup import DatasetLookup
+    dataFrame = self.fromDataset(datasetName, namespace, arguments, sqlContext)
+    return DatasetLookup.load(dataFrame, keyColumn, valueColumn, maxBroadcastBytes)
+
+  def fromStream(self, streamName, namespace = None, format = None, arguments = None, sqlContext = None):
+    """
+      Reads a CDAP Stream as a DataFrame through the `cdapstream` Spark SQL data source. Besides the body columns,
+      the DataFrame has the `ts` column for the event timestamp and the `headers` column for the event headers.
+      Combined with :func:`vectorizedUDF` on its `rdd`, stream events can be processed in batches of pandas columns.
+
+      :param streamName: name of the Stream
+      :param namespace: an optional namespace of the Stream. Defaults to the namespace of the program.
+      :param format: an optional format for decoding the event body. With `raw`, the body is a binary column.
+                     Defaults to the format configured for the Stream.
+      :param arguments: an optional dictionary of parameters for the data source
+      :param sqlContext: the SQLContext or SparkSession to use. Defaults to the one of the active SparkContext.
+      :return: a Spark DataFrame
+    """
+    from dataframes import getSQLContext
+    options = self._getSourceOptions(namespace, arguments)
+    if format is not None:
+      options["stream.format"] = format
+    return getSQLContext(sqlContext).read.format("cdapstream").options(**options).load(streamName)
+
+  def fromStreamBatches(self, streamName, namespace = None, startTime = 0, endTime = None, batchSize = 10000,
+                        directory = None, sparkContext = None):
+    """
+      Reads a CDAP Stream as an RDD of :class:`StreamEventBatch`. The JVM writes the events of each batch to a local
+      file that is memory mapped in the Python worker, hence event bodies are not serialized through the Python
+      worker socket, nor copied into Python strings. This is suited for parsing high volume streams, for example
+      with NumPy through :meth:`StreamEventBatch.toNumPy`.
+
+      :param streamName: name of the Stream
+      :param namespace: an optional namespace of the Stream. Defaults to the namespace of the program.
+      :param startTime: the starting time of the events to read in milliseconds (inclusive)
+      :param endTime: the ending time of the events to read in milliseconds (exclusive). Defaults to reading up to
+                      the latest event.
+      :param batchSize: maximum number of events in a batch
+      :param directory: an optional local directory for the batch files on the executor hosts. Using a tmpfs
+                        directory such as `/dev/shm` keeps the batches in shared memory.
+                        Defaults to the temporary directory of the JVM.
+      :param sparkContext: the SparkContext to use. Defaults to the active one.
+      :return: an RDD of :class:`StreamEventBatch`
+    """
+    # Imported here so that pyspark is only loaded when RDDs are used
+    from pyspark import RDD, SparkContext
+    from pyspark.serializers import NoOpSerializer
+    from streams import StreamEventBatch
+
+    sc = sparkContext or SparkContext.getOrCreate()
+    runtimeContext = self._runtimeContext.getSparkRuntimeContext()
+    if namespace is None:
+      namespace = runtimeContext.getNamespace()
+    if endTime is None:
+      endTime = (1 << 63) - 1
+    jrdd = self._runtimeContext.getJVM().PythonStreamBatches.fromStream(sc._jsc.sc(), namespace, streamName,
+                                                                        startTime, endTime, batchSize, directory)
+    return RDD(jrdd, sc, NoOpSerializer()).map(StreamEventBatch)
+
+  def getTransactionalWriter(self, datasetName, namespace = None, arguments = None, batchSize = 4 * 1024 * 1024):
+    """
+      Returns a :class:`TransactionalWriter` for writing key/value pairs to a CDAP Dataset in a transaction,
+      with writes sent to the JVM in batches. It can be passed in closures, for example
+      `rdd.foreachPartition(writer.writePartition)` writes each partition in its own transaction.
+
+      :param datasetName: name of the Dataset. It must be a `BatchWritable` of `byte[]` keys and values.
+      :param namespace: an optional namespace of the Dataset. Defaults to the namespace of the program.
+      :param arguments: an optional dictionary of Dataset arguments
+      :param batchSize: number of buffered bytes that triggers sending the writes to the JVM
+      :return:
+        a :class:`TransactionalWriter` object
+    """
+    from writer import TransactionalWriter
+    return TransactionalWriter(self._runtimeContext, datasetName, namespace, arguments, batchSize)
+
+  def _getSourceOptions(self, namespace, arguments):
+    options = dict(arguments or {})
+    if namespace is not None:
+      options["namespace"] = namespace
+    return options
+
+  def getLogHandler(self, **kwargs):
+    """
+      Returns a :class:`CDAPLogHandler` that sends log records of the Python program to CDAP. It can be added to
+      any Python logger, for example `logging.getLogger().addHandler(sec.getLogHandler())`.
+
+      :param kwargs: optional arguments for the :class:`CDAPLogHandler`
+      :return:
+        a :class:`CDAPLogHandler` object
+    """
+    # Imported here so that the logging module is only loaded when logs are sent to CDAP
+    from log import CDAPLogHandler
+    return CDAPLogHandler(runtimeContext = self._runtimeContext, **kwargs)
 
 
 class Metrics(object):
@@ -86,15 +342,16 @@ class Metrics(object):
     This class is for user program to emit metrics to CDAP.
   """
 
-  def __init__(self, runtimeContext = None):
+  def __init__(self, runtimeContext = None, buffered = False):
     self._runtimeContext = runtimeContext
-    self._metrics = runtimeContext.getSparkRuntimeContext()
+    self._buffered = buffered
+    self._metrics = None
 
   def __getstate__(self):
-    return { "context" : self._runtimeContext }
+    return { "context" : self._runtimeContext, "buffered" : self._buffered }
 
   def __setstate__(self, state):
-    self.__init__(state["context"])
+    self.__init__(state["context"], state.get("buffered", False))
 
   def count(self, name, delta):
     """
@@ -103,7 +360,7 @@ class Metrics(object):
       :param name: Name of the counter. Use alphanumeric characters in metric names
       :param delta: The value to increase by
     """
-    self._metrics.count(name, delta)
+    self._getMetrics().count(name, delta)
 
   def gauge(self, name, value):
     """
@@ -112,35 +369,125 @@ class Metrics(object):
       :param name: Name of the counter. Use alphanumeric characters in metric names
       :param value: The value to be set
     """
-    self._metrics.gauge(name, value)
+    self._getMetrics().gauge(name, value)
+
+  def histogram(self, name, value):
+    """
+      Records a value into the specific histogram. Histograms are aggregated in the Python process and
+      published periodically as the `<name>.count` counter and the `<name>.p50`, `<name>.p90`, `<name>.p99`
+      and `<name>.max` gauges.
+
+      :param name: Name of the histogram. Use alphanumeric characters in metric names
+      :param value: The non-negative value to record
+    """
+    self._runtimeContext.getMetricsBuffer().histogram(name, value)
+
+  def timer(self, name):
+    """
+      Returns a :class:`Timer` that records elapsed time in microseconds into the specific histogram.
+      It can be used as a context manager or as a function decorator.
+
+      :param name: Name of the histogram. Use alphanumeric characters in metric names
+      :return: a :class:`Timer`
+    """
+    from metrics import Timer
+    return Timer(self.histogram, name)
+
+  def partitionCounter(self, name):
+    """
+      Returns a :class:`PartitionCounter` that accumulates increments locally and emits the total to this
+      :class:`Metrics` once per partition. The metrics buffered in the Python process are flushed when
+      the counter is closed, so that they are published before the Python worker may be terminated.
+
+      :param name: Name of the counter. Use alphanumeric characters in metric names
+      :return: a :class:`PartitionCounter`
+    """
+    from metrics import PartitionCounter
+    return PartitionCounter(self, name)
+
+  def flush(self):
+    """
+      Publishes all metrics that are buffered in the current Python process, including histograms.
+      Partition functions that use buffered metrics without a :class:`PartitionCounter` should call it
+      at the end of the partition, since Python workers may exit without flushing.
+    """
+    self._runtimeContext.getMetricsBuffer().flush()
+
+  def _getMetrics(self):
+    # Resolved on first use, so that the gateway is only connected when metrics are actually emitted
+    if self._metrics is None:
+      if self._buffered:
+        self._metrics = self._runtimeContext.getMetricsBuffer()
+      else:
+        self._metrics = self._runtimeContext.getSparkRuntimeContext()
+    return self._metrics
 
 class ServiceDiscoverer(object):
   """
     This class provides discovery service to user program.
   """
 
-  def __init__(self, runtimeContext = None):
+  def __init__(self, runtimeContext = None, cacheTTL = 60, negativeCacheTTL = 5):
     self._runtimeContext = runtimeContext
-    self._discover = runtimeContext.getSparkRuntimeContext()
+    self._cacheTTL = cacheTTL
+    self._negativeCacheTTL = negativeCacheTTL
 
   def __getstate__(self):
-    return { "context" : self._runtimeContext }
+    return {
+      "context" : self._runtimeContext,
+      "cacheTTL" : self._cacheTTL,
+      "negativeCacheTTL" : self._negativeCacheTTL
+    }
 
   def __setstate__(self, state):
-    self.__init__(state["context"])
+    self.__init__(state["context"], state.get("cacheTTL", 60), state.get("negativeCacheTTL", 5))
 
   def getServiceURL(self, serviceId, appId = None):
     """
       Discover the base URL for a Service, relative to which Service endpoints can be accessed.
+      Discovery results are cached in the Python process based on the TTLs of this discoverer.
 
       :param serviceId: name of the service to be discovered
-      :param appId: an optional application name that the service belongs to
+      :param appId: an optional application name that the service belongs to. If it is `None`,
+                    the service is discovered from the application of this Spark program.
       :return: an URL :class:`str` for the discovered service or `None` if the service is not found
     """
+    return self._runtimeContext.getServiceURLCache().get((appId, serviceId), self._cacheTTL,
+                                                         self._negativeCacheTTL,
+                                                         lambda: self._discover(serviceId, appId))
+
+  def getClient(self, serviceId, appId = None, maxConnections = 4, timeout = 60):
+    """
+      Returns a :class:`ServiceClient` for calling endpoints of a Service. The client reuses HTTP connections
+      across requests and discovers the Service again if a request fails to connect.
+      It can be passed in closures.
+
+      :param serviceId: name of the service to call
+      :param appId: an optional application name that the service belongs to
+      :param maxConnections: maximum number of connections and concurrent requests of the client
+      :param timeout: socket timeout in seconds
+      :return: a :class:`ServiceClient`
+    """
+    from discovery import ServiceClient
+    return ServiceClient(self, serviceId, appId, maxConnections, timeout)
+
+  def invalidate(self, serviceId, appId = None):
+    """
+      Removes the cached URL of a Service, so that the next :meth:`getServiceURL` call discovers it again.
+      This should be called when connecting to a previously discovered URL failed.
+
+      :param serviceId: name of the service
+      :param appId: an optional application name that the service belongs to
+    """
+    self._runtimeContext.getServiceURLCache().invalidate((appId, serviceId))
+
+  def _discover(self, serviceId, appId):
+    runtimeContext = self._runtimeContext.getSparkRuntimeContext()
     if appId is None:
-      return self.getServiceURL(serviceId)
+      url = runtimeContext.getServiceURL(serviceId)
+    else:
+      url = runtimeContext.getServiceURL(appId, serviceId)
 
-    url = self._discover.getServiceURL(appId, serviceId)
     if url is None:
       return None
     else:
@@ -156,36 +503,294 @@ class SparkRuntimeContext(object):
   _jvm = None
   _runtimeContext = None
   _onDemandCallback = False
-
-  def __init__(self, gatewayPort = None, driver = True):
-    # If the gateway port file is there, always use it. This is for distributed mode.
-    if os.path.isfile("cdap.py4j.gateway.port.txt"):
-      fd = open("cdap.py4j.gateway.port.txt", "r")
-      gatewayPort = int(fd.read())
-      fd.close()
-    elif gatewayPort is None:
-      if "PYSPARK_GATEWAY_PORT" in os.environ:
-        gatewayPort = int(os.environ["PYSPARK_GATEWAY_PORT"])
-      else:
-        raise Exception("Cannot determine Py4j GatewayServer port")
-
-    self.__class__.__ensureGatewayInit(gatewayPort, driver)
+  _metricsBuffer = None
+  _workflowToken = None
+  _secureDataCache = None
+  _serviceURLCache = None
+  _connectionPool = None
+  _profiler = None
+  _registry = {}
+  _portFileRead = False
+  _portFilePort = None
+
+  def __init__(self, gatewayPort = None, driver = True, poolSize = 0, threadAffinity = False, profiling = False):
     self._allowCallback = driver
-    self._gatewayPort = gatewayPort
+    self._gatewayPort = self.resolveGatewayPort(gatewayPort)
+    self._poolSize = poolSize
+    self._threadAffinity = threadAffinity
+    self._profiling = profiling
+    self._extensionsChecked = False
+    self._runtimeArguments = None
+    self._logicalStartTime = None
 
   def __getstate__(self):
-    return { "gatewayPort" : self._gatewayPort }
+    if self._allowCallback:
+      # Snapshot the immutable program information on the driver, so that executors never need to ask the JVM
+      self.getRuntimeArguments()
+      self.getLogicalStartTime()
+    return {
+      "gatewayPort" : self._gatewayPort,
+      "poolSize" : self._poolSize,
+      "threadAffinity" : self._threadAffinity,
+      "profiling" : self.isProfilingEnabled(),
+      "runtimeArguments" : self._runtimeArguments,
+      "logicalStartTime" : self._logicalStartTime
+    }
+
+  def __reduce__(self):
+    # Unpickled through the registry, so that all closures in a Python worker share one instance
+    return (_restoreSparkRuntimeContext, (self.__getstate__(),))
 
-  def __setstate__(self, state):
-    self.__init__(state["gatewayPort"], False)
+  @classmethod
+  def resolveGatewayPort(cls, gatewayPort = None):
+    """
+      Returns the port of the Java gateway to connect to. If the gateway port file is there, it is always used,
+      which is for distributed mode, where the port pickled by the driver is not the one of the executor.
+      Otherwise it is the given port, or the `PYSPARK_GATEWAY_PORT` environment variable. The file is only read
+      once in each Python process.
+    """
+    if not cls._portFileRead:
+      with cls._lock:
+        if not cls._portFileRead:
+          if os.path.isfile(GATEWAY_PORT_FILE):
+            with open(GATEWAY_PORT_FILE, "r") as fd:
+              cls._portFilePort = int(fd.read())
+          cls._portFileRead = True
+    if cls._portFilePort is not None:
+      return cls._portFilePort
+    if gatewayPort is not None:
+      return gatewayPort
+    if "PYSPARK_GATEWAY_PORT" in os.environ:
+      return int(os.environ["PYSPARK_GATEWAY_PORT"])
+    raise Exception("Cannot determine Py4j GatewayServer port")
+
+  @classmethod
+  def fromState(cls, state):
+    """
+      Returns the executor side instance for the given pickled state. There is one instance per gateway port in
+      each Python process, which is created when the first closure is unpickled. The registry is keyed by the
+      port resolved with :meth:`resolveGatewayPort`, so that it is the same instance as :meth:`forExecutor`.
+    """
+    gatewayPort = cls.resolveGatewayPort(state["gatewayPort"])
+    context = cls._registry.get(gatewayPort)
+    if context is None:
+      with cls._lock:
+        context = cls._registry.get(gatewayPort)
+        if context is None:
+          context = cls(gatewayPort, False, state.get("poolSize", 0), state.get("threadAffinity", False),
+                        state.get("profiling", False))
+          cls._registry[gatewayPort] = context
+    if context._runtimeArguments is None:
+      context._runtimeArguments = state.get("runtimeArguments")
+    if context._logicalStartTime is None:
+      context._logicalStartTime = state.get("logicalStartTime")
+    if state.get("poolSize", 0) > context._poolSize:
+      context._poolSize = state["poolSize"]
+      context._threadAffinity = state.get("threadAffinity", False)
+      context._extensionsChecked = False
+    if state.get("profiling") and not context._profiling:
+      context._profiling = True
+      context._extensionsChecked = False
+    return context
+
+  @classmethod
+  def forExecutor(cls):
+    """
+      Returns the executor side instance of the current Python process, which is the one shared by the closures
+      unpickled in the process. It is created and registered if no closure was unpickled yet.
+    """
+    gatewayPort = cls.resolveGatewayPort()
+    with cls._lock:
+      context = cls._registry.get(gatewayPort)
+      if context is None:
+        context = cls._registry[gatewayPort] = cls(gatewayPort, False)
+      return context
+
+  @classmethod
+  def prepareFork(cls):
+    """
+      Connects to the Java gateway and resolves the Java SparkRuntimeContext, then closes the gateway connections.
+      Processes forked afterwards inherit the initialized gateway and the context registry, and each of them opens
+      its own connection on first use. It is called by the fork server of the Python workers, which must not use
+      the gateway after this call, since a connection cannot be shared across processes.
+    """
+    context = cls.forExecutor()
+    cls.__ensureGatewayInit(context._gatewayPort, False)
+    cls._gateway._gateway_client.close()
 
   def getSparkRuntimeContext(self):
-    return self.__class__._runtimeContext
+    """
+      Returns the Java SparkRuntimeContext. The gateway is connected on the first call in the Python process.
+    """
+    cls = self.__class__
+    runtimeContext = cls._runtimeContext
+    if runtimeContext is None:
+      cls.__ensureGatewayInit(self._gatewayPort, self._allowCallback)
+      runtimeContext = cls._runtimeContext
+    if not self._extensionsChecked:
+      # Set first, since checking the runtime arguments may come back here
+      self._extensionsChecked = True
+      self.__ensureGatewayExtensions()
+    return runtimeContext
+
+  def isDriver(self):
+    """
+      Returns `True` if this context is used in the Spark driver.
+    """
+    return self._allowCallback
+
+  def isProfilingEnabled(self):
+    """
+      Returns `True` if the round trips to the Java gateway are profiled, either as requested when this context
+      was created or through the `system.pyspark.gateway.profiling.enabled` runtime argument.
+    """
+    if self._profiling:
+      return True
+    return self.getRuntimeArguments().get(PROFILING_ARGUMENT, "false").lower() == "true"
+
+  def getGatewayProfiler(self):
+    """
+      Returns the :class:`GatewayProfiler` of the current Python process, or `None` if profiling is not enabled.
+    """
+    self.getSparkRuntimeContext()
+    return self.__class__._profiler
+
+  def getJVM(self):
+    """
+      Returns the py4j JVM view, with the CDAP Spark runtime classes imported.
+    """
+    self.getSparkRuntimeContext()
+    return self.__class__._jvm
+
+  def getPythonUtil(self):
+    """
+      Returns the Java SparkPythonUtil class.
+    """
+    return self.getJVM().SparkPythonUtil
+
+  def getRuntimeArguments(self):
+    """
+      Returns the runtime arguments as a dictionary. It is fetched from the JVM with a single call on first use
+      and cached afterwards. The returned dictionary shouldn't be modified.
+    """
+    if self._runtimeArguments is None:
+      runtimeArguments = self.getSparkRuntimeContext().getRuntimeArguments()
+      self._runtimeArguments = json.loads(self.getPythonUtil().toJson(runtimeArguments))
+    return self._runtimeArguments
+
+  def getLogicalStartTime(self):
+    """
+      Returns the logical start time. It is fetched from the JVM on first use and cached afterwards.
+    """
+    if self._logicalStartTime is None:
+      self._logicalStartTime = self.getSparkRuntimeContext().getLogicalStartTime()
+    return self._logicalStartTime
+
+  def getWorkflowTokenContent(self):
+    """
+      Returns the user scope values of the workflow token, as sent by `SparkPythonUtil.getWorkflowToken`,
+      or `None` if the program is not running in a workflow.
+    """
+    content = self.getPythonUtil().getWorkflowToken(self.getSparkRuntimeContext())
+    return None if content is None else json.loads(content)
+
+  def getWorkflowToken(self):
+    """
+      Returns the :class:`WorkflowToken` shared by the current Python process, or `None` if the program is not
+      running in a workflow.
+    """
+    cls = self.__class__
+    with cls._lock:
+      if cls._workflowToken is None:
+        content = self.getWorkflowTokenContent()
+        # False marks that there is no workflow, so that the JVM is only asked once
+        if content is None:
+          cls._workflowToken = False
+        else:
+          from workflow import WorkflowToken
+          cls._workflowToken = WorkflowToken(self, content)
+      return cls._workflowToken or None
+
+  def getSecureData(self, namespace, key, ttl):
+    """
+      Returns the value of a secure key as a byte string, using the secure data cache of the current Python process.
+    """
+    def load():
+      # A Java byte[] is returned as a bytearray
+      return bytes(self.getPythonUtil().getSecureData(self.getSparkRuntimeContext(), namespace, key))
+
+    if ttl <= 0:
+      return load()
+    cls = self.__class__
+    with cls._lock:
+      if cls._secureDataCache is None:
+        from security import SecureDataCache
+        cls._secureDataCache = SecureDataCache()
+    return cls._secureDataCache.get((namespace, key), ttl, load)
+
+  def getServiceURLCache(self):
+    """
+      Returns the :class:`ServiceURLCache` shared by all :class:`ServiceDiscoverer` in the current Python process.
+    """
+    cls = self.__class__
+    with cls._lock:
+      if cls._serviceURLCache is None:
+        from discovery import ServiceURLCache
+        cls._serviceURLCache = ServiceURLCache()
+      return cls._serviceURLCache
+
+  def getMetricsBuffer(self):
+    """
+      Returns the :class:`MetricsBuffer` shared by all buffered :class:`Metrics` in the current Python process.
+    """
+    cls = self.__class__
+    with cls._lock:
+      if cls._metricsBuffer is None:
+        from metrics import MetricsBuffer
+        cls._metricsBuffer = MetricsBuffer(self._publishMetrics)
+      return cls._metricsBuffer
+
+  def _publishMetrics(self, counters, gauges):
+    # Sent as JSON since py4j would make one gateway call per entry to convert a dictionary into a Java map
+    runtimeContext = self.getSparkRuntimeContext()
+    profiler = self.__class__._profiler
+    if profiler is None:
+      self.getPythonUtil().updateMetrics(runtimeContext, json.dumps(counters), json.dumps(gauges))
+    else:
+      # Otherwise each publish would emit metrics about itself
+      with profiler.suspended():
+        self.getPythonUtil().updateMetrics(runtimeContext, json.dumps(counters), json.dumps(gauges))
+
+  def __ensureGatewayExtensions(self):
+    # Installed separately from the gateway initialization, since the gateway may have been initialized by another
+    # context, for example by the fork server of the Python workers
+    cls = self.__class__
+    with cls._lock:
+      if self._poolSize > 0 and cls._connectionPool is None:
+        from gateway import GatewayConnectionPool
+        cls._connectionPool = GatewayConnectionPool(cls._gateway._gateway_client, self._poolSize,
+                                                    self._threadAffinity)
+        cls._connectionPool.prestart()
+    if self.isProfilingEnabled():
+      self.__ensureProfilerInit()
+
+  def __ensureProfilerInit(self):
+    cls = self.__class__
+    with cls._lock:
+      if cls._profiler is None:
+        from profiler import GatewayProfiler
+        profiler = GatewayProfiler(cls._gateway._gateway_client, self.getMetricsBuffer())
+        if self._allowCallback:
+          # Registered after the metrics buffer, so that it runs before the final metrics flush
+          atexit.register(_printProfilerReport, profiler)
+        cls._profiler = profiler
 
   @classmethod
   def __ensureGatewayInit(cls, gatewayPort, driver):
     with cls._lock:
       if not cls._gateway:
+        from py4j.java_gateway import java_import, JavaGateway
+
         # Spark 1.6 and Spark 2 are using later verions of py4j (0.9 and 0.10+ respectively),
         # which has better control on gateway client and callback server using
         # GatewayParameters and CallbackServerParameters. Try to use those,
@@ -212,6 +817,7 @@ class SparkRuntimeContext(object):
           else:
             # For py4j 0.9 (used by Spark 1.6), it doesn't have way to set the dynamic port of the callback server,
             # hence we need the hack to call SparkPythonUtil to set it
+            from py4j.java_gateway import JavaObject
             callbackPort = gateway._callback_server.server_socket.getsockname()[1]
             gateway.jvm.SparkPythonUtil.setGatewayCallbackPort(JavaObject("GATEWAY_SERVER", gateway._gateway_client),
                                                                callbackPort)
@@ -220,3 +826,8 @@ class SparkRuntimeContext(object):
         cls._runtimeContext = cls._jvm.SparkRuntimeContextProvider.get()
         print "Java gateway initialized with gateway port ", gatewayPort
 
+def _restoreSparkRuntimeContext(state):
+  return SparkRuntimeContext.fromState(state)
+
+def _printProfilerReport(profiler):
+  print profiler.report()
@@ -0,0 +1,99 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Fork server of the PySpark Python workers with `cdap.pyspark` preloaded. Spark runs it in place of
+  `pyspark.daemon` when `spark.cdap.pyspark.daemon.enabled` is `true`. Before forking the first worker, it imports
+  pyspark, py4j, `cdap.pyspark` and the modules listed in the `CDAP_PYSPARK_PRELOAD` environment variable, and
+  initializes the Java gateway. Workers are forked from it by the `pyspark.daemon` manager, hence they share the
+  imported modules copy-on-write and skip the gateway setup, except for opening their own connection.
+  After each task, the log records buffered in the worker are sent to CDAP.
+"""
+
+import os
+import sys
+import traceback
+
+__all__ = ["preload", "main"]
+
+# Environment variable with a comma separated list of additional modules to import before forking workers
+PRELOAD_MODULES_ENV = "CDAP_PYSPARK_PRELOAD"
+
+# Modules imported by every Python worker that talks to CDAP
+_DEFAULT_MODULES = [
+  "pyspark.worker",
+  "py4j.java_gateway",
+  "cdap.pyspark.context",
+  "cdap.pyspark.profiler"
+]
+
+def preload(modules):
+  """
+    Imports the given modules. A module that fails to import is reported on the standard error and skipped,
+    so that the workers import it themselves and fail with the actual error if it is needed.
+
+    :return: the list of modules that were imported
+  """
+  loaded = []
+  for name in modules:
+    try:
+      __import__(name)
+      loaded.append(name)
+    except Exception:
+      sys.stderr.write("Failed to preload module %s in the PySpark fork server\n" % name)
+      traceback.print_exc()
+  return loaded
+
+def main():
+  modules = _DEFAULT_MODULES + [name.strip() for name in os.environ.get(PRELOAD_MODULES_ENV, "").split(",")
+                                if name.strip()]
+
+  # The pyspark daemon manager sends its port to the JVM through the standard output, hence nothing else may be
+  # written to it. Anything printed while preloading goes to the standard error instead.
+  sys.stdout.flush()
+  stdout = os.dup(1)
+  os.dup2(2, 1)
+  try:
+    preload(modules)
+    try:
+      from cdap.pyspark.context import SparkRuntimeContext
+      SparkRuntimeContext.prepareFork()
+    except Exception:
+      # The workers initialize the gateway themselves
+      sys.stderr.write("Failed to initialize the Java gateway in the PySpark fork server\n")
+      traceback.print_exc()
+    sys.stdout.flush()
+  finally:
+    os.dup2(stdout, 1)
+    os.close(stdout)
+
+  from pyspark import daemon
+  daemon.worker = _flushingWorker(daemon.worker)
+  daemon.manager()
+
+def _flushingWorker(worker):
+  # Forked workers leave through os._exit, which skips the exit handlers that would flush the buffered log records
+  def run(*args, **kwargs):
+    try:
+      return worker(*args, **kwargs)
+    finally:
+      log = sys.modules.get("cdap.pyspark.log")
+      if log is not None:
+        log.flushHandlers()
+  return run
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,38 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import sys
+
+__all__ = ["getSQLContext", "isPandasDataFrame"]
+
+def getSQLContext(sqlContext = None):
+  """
+    Returns the given SQLContext or SparkSession, or the SQLContext of the active SparkContext if it is `None`.
+  """
+  if sqlContext is not None:
+    return sqlContext
+
+  # Imported here so that pyspark is only loaded when DataFrames are used
+  from pyspark import SparkContext
+  from pyspark.sql import SQLContext
+  return SQLContext.getOrCreate(SparkContext.getOrCreate())
+
+def isPandasDataFrame(data):
+  """
+    Returns `True` if the given object is a pandas DataFrame, without importing pandas if it isn't loaded.
+  """
+  pandas = sys.modules.get("pandas")
+  return pandas is not None and isinstance(data, pandas.DataFrame)
@@ -0,0 +1,260 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+from collections import namedtuple
+from threading import BoundedSemaphore, RLock, Thread
+
+from cache import TTLCache
+
+# The networking modules are imported when a ServiceClient first sends a request, since on Python 2 the socket
+# module pulls in the ssl extension, which dominates the import time of this module.
+
+__all__ = ["ServiceURLCache", "ServiceClient", "ServiceResponse"]
+
+ServiceResponse = namedtuple("ServiceResponse", ["status", "reason", "headers", "body"])
+
+# Requests that can be sent again when it is unknown whether the service processed them
+_IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "DELETE"])
+
+def _httplib():
+  # Imported on first use, since httplib pulls in the email and ssl modules
+  try:
+    import httplib
+  except ImportError:
+    import http.client as httplib
+  return httplib
+
+class ServiceURLCache(TTLCache):
+  """
+    Process-wide cache of discovered service URLs. A `None` URL is cached as well, so that repeatedly looking up
+    a service that is not running doesn't go to the JVM every time.
+  """
+
+  def get(self, key, ttl, negativeTtl, loader):
+    """
+      Returns the cached URL for the given key if it is not expired, otherwise calls the loader to discover it.
+
+      :param key: the cache key
+      :param ttl: number of seconds a discovered URL stays valid
+      :param negativeTtl: number of seconds a `None` URL stays valid
+      :param loader: a function that takes no argument and returns the URL or `None`
+    """
+    return TTLCache.get(self, key, ttl, loader, negativeTtl)
+
+class ServiceClient(object):
+  """
+    HTTP client for calling a CDAP service discovered through a :class:`ServiceDiscoverer`. It keeps a pool of
+    persistent HTTP/1.1 connections to the service, so that consecutive requests reuse the same TCP connection.
+    The number of concurrent requests is bounded by the pool size. When connecting to the service fails, the
+    service is discovered again and the request is retried once. A request that fails after it was sent is
+    only retried if its method is idempotent (GET, HEAD, OPTIONS or DELETE), since the service may have
+    processed it already.
+
+    A client can be passed in closures. The connections are not pickled; each Python worker opens its own.
+  """
+
+  def __init__(self, discoverer, serviceId, appId = None, maxConnections = 4, timeout = 60):
+    """
+      :param discoverer: the :class:`ServiceDiscoverer` for discovering the service
+      :param serviceId: name of the service
+      :param appId: an optional application name that the service belongs to
+      :param maxConnections: maximum number of connections and concurrent requests
+      :param timeout: socket timeout in seconds
+    """
+    self._discoverer = discoverer
+    self._serviceId = serviceId
+    self._appId = appId
+    self._maxConnections = maxConnections
+    self._timeout = timeout
+    self._lock = RLock()
+    self._idle = []
+    self._permits = BoundedSemaphore(maxConnections)
+
+  def __getstate__(self):
+    return {
+      "discoverer" : self._discoverer,
+      "serviceId" : self._serviceId,
+      "appId" : self._appId,
+      "maxConnections" : self._maxConnections,
+      "timeout" : self._timeout
+    }
+
+  def __setstate__(self, state):
+    self.__init__(state["discoverer"], state["serviceId"], state["appId"], state["maxConnections"], state["timeout"])
+
+  def request(self, method, path, body = None, headers = None):
+    """
+      Sends a request to the service.
+
+      :param method: the HTTP method
+      :param path: path of the service endpoint, relative to the service base URL
+      :param body: an optional request body
+      :param headers: an optional dictionary of request headers
+      :return: a :class:`ServiceResponse`
+    """
+    import socket
+    httplib = _httplib()
+    with self._permits:
+      try:
+        connection, baseURL = self._connect()
+      except socket.timeout:
+        raise
+      except socket.error:
+        # The service may have moved. Nothing was sent, so discover it again and retry once.
+        self._rediscover()
+        connection, baseURL = self._connect()
+        return self._send(connection, baseURL, method, path, body, headers)
+
+      try:
+        return self._send(connection, baseURL, method, path, body, headers)
+      except socket.timeout:
+        raise
+      except (socket.error, httplib.HTTPException):
+        if method.upper() not in _IDEMPOTENT_METHODS:
+          raise
+        # The service may have closed the connection or moved
+        self._rediscover()
+        connection, baseURL = self._connect()
+        return self._send(connection, baseURL, method, path, body, headers)
+
+  def get(self, path, headers = None):
+    """
+      Sends a GET request to the service. See :meth:`request`.
+    """
+    return self.request("GET", path, headers = headers)
+
+  def post(self, path, body, headers = None):
+    """
+      Sends a POST request to the service. See :meth:`request`.
+    """
+    return self.request("POST", path, body, headers)
+
+  def requestAll(self, requests):
+    """
+      Sends a batch of requests to the service, using up to `maxConnections` requests in parallel.
+
+      :param requests: a list of `(method, path, body, headers)` tuples. Body and headers can be omitted.
+      :return: a list of :class:`ServiceResponse` or exceptions, in the same order as the requests
+    """
+    try:
+      from Queue import Queue, Empty
+    except ImportError:
+      from queue import Queue, Empty
+
+    results = [None] * len(requests)
+    pending = Queue()
+    for index, req in enumerate(requests):
+      pending.put((index, req))
+
+    def run():
+      while True:
+        try:
+          index, req = pending.get_nowait()
+        except Empty:
+          return
+        try:
+          results[index] = self.request(*req)
+        except Exception as e:
+          results[index] = e
+
+    workers = [Thread(target = run) for _ in range(min(self._maxConnections, len(requests)))]
+    for worker in workers:
+      worker.daemon = True
+      worker.start()
+    for worker in workers:
+      worker.join()
+    return results
+
+  def close(self):
+    """
+      Closes all idle connections.
+    """
+    with self._lock:
+      idle = self._idle
+      self._idle = []
+    for connection, _ in idle:
+      connection.close()
+
+  def _rediscover(self):
+    self._discoverer.invalidate(self._serviceId, self._appId)
+    self.close()
+
+  def _connect(self):
+    try:
+      from urlparse import urlparse
+    except ImportError:
+      from urllib.parse import urlparse
+
+    url = self._discoverer.getServiceURL(self._serviceId, self._appId)
+    if url is None:
+      raise IOError("Service %s is not available" % self._serviceId)
+
+    baseURL = urlparse(url)
+    connection = self._acquire(baseURL)
+    if connection.sock is None:
+      try:
+        connection.connect()
+      except:
+        connection.close()
+        raise
+    return connection, baseURL
+
+  def _send(self, connection, baseURL, method, path, body, headers):
+    try:
+      connection.request(method, baseURL.path.rstrip("/") + "/" + path.lstrip("/"), body, headers or {})
+      response = connection.getresponse()
+      # The response must be fully read before the connection can be reused
+      result = ServiceResponse(response.status, response.reason, dict(response.getheaders()), response.read())
+    except:
+      connection.close()
+      raise
+
+    if response.getheader("connection", "").lower() == "close":
+      connection.close()
+    else:
+      self._release(connection, baseURL)
+    return result
+
+  def _acquire(self, baseURL):
+    with self._lock:
+      while self._idle:
+        connection, connectionURL = self._idle.pop()
+        if connectionURL.netloc == baseURL.netloc and connectionURL.scheme == baseURL.scheme \
+            and self._isOpen(connection):
+          return connection
+        # The service moved to a different endpoint or closed the connection
+        connection.close()
+
+    httplib = _httplib()
+    if baseURL.scheme == "https":
+      return httplib.HTTPSConnection(baseURL.netloc, timeout = self._timeout)
+    return httplib.HTTPConnection(baseURL.netloc, timeout = self._timeout)
+
+  def _isOpen(self, connection):
+    # An idle connection has nothing to read, unless the service closed it
+    import select
+    try:
+      readable, _, _ = select.select([connection.sock], [], [], 0)
+    except Exception:
+      return False
+    return not readable
+
+  def _release(self, connection, baseURL):
+    with self._lock:
+      if len(self._idle) < self._maxConnections:
+        self._idle.append((connection, baseURL))
+        return
+    connection.close()
@@ -0,0 +1,28 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+__all__ = ["toBytes"]
+
+def toBytes(value):
+  """
+    Returns the given value as a byte string, for sending keys and values to the JVM or hashing them.
+    Byte strings are returned as they are, bytearrays are copied and unicode strings are encoded as UTF-8.
+  """
+  if isinstance(value, bytes):
+    return value
+  if isinstance(value, bytearray):
+    return bytes(value)
+  return value.encode("utf-8")
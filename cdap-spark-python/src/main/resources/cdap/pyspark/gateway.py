@@ -0,0 +1,152 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import select
+import threading
+
+__all__ = ["GatewayConnectionPool"]
+
+class GatewayConnectionPool(object):
+  """
+    Manages the connections of a py4j `GatewayClient`. The py4j client opens a new connection whenever
+    there is no idle one, which makes concurrent callers pay for connection setup. This pool pre-opens a
+    fixed number of connections, discards connections whose socket was closed by the gateway server before
+    handing them out and closes connections beyond the pool size. With thread affinity, each thread keeps
+    reusing the same connection, which is returned to the pool when the thread exits.
+
+    It works by replacing the `_get_connection` and `_give_back_connection` methods of the client instance,
+    which are present in all py4j versions used by Spark.
+  """
+
+  def __init__(self, gatewayClient, size, threadAffinity = False):
+    """
+      :param gatewayClient: the py4j `GatewayClient` to manage connections for
+      :param size: number of connections to pre-open and the maximum number of connections to keep, either idle
+                   or bound to a thread
+      :param threadAffinity: if `True`, a connection is bound to the thread that last used it
+    """
+    self._client = gatewayClient
+    self._size = size
+    self._threadAffinity = threadAffinity
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._bound = 0
+    self._getConnection = gatewayClient._get_connection
+    self._giveBackConnection = gatewayClient._give_back_connection
+
+    gatewayClient._get_connection = self._get
+    gatewayClient._give_back_connection = self._giveBack
+
+  def prestart(self):
+    """
+      Opens connections to the gateway server until there are `size` idle connections in the pool.
+    """
+    # New connections are created directly, since getting one from the client would take an idle one first
+    create = getattr(self._client, "_create_connection", None)
+    if create is None:
+      connections = [self._getConnection() for _ in range(self._size - len(self._client.deque))]
+    else:
+      connections = [create() for _ in range(self._size - len(self._client.deque))]
+    for connection in connections:
+      self._giveBackConnection(connection)
+
+  def _get(self):
+    if self._threadAffinity:
+      binding = getattr(self._local, "binding", None)
+      if binding is not None:
+        connection = binding.release()
+        self._local.binding = None
+        if self._isHealthy(connection):
+          return connection
+        self._close(connection)
+
+    while True:
+      # If the pool is empty, the original method creates a new connection
+      hasIdle = len(self._client.deque) > 0
+      connection = self._getConnection()
+      if not hasIdle or self._isHealthy(connection):
+        return connection
+      self._close(connection)
+
+  def _giveBack(self, connection):
+    if self._threadAffinity and getattr(self._local, "binding", None) is None:
+      with self._lock:
+        bind = self._bound + len(self._client.deque) < self._size
+        if bind:
+          self._bound += 1
+      if bind:
+        self._local.binding = _ThreadBinding(self, connection)
+        return
+    self._returnToPool(connection)
+
+  def _returnToPool(self, connection):
+    if self._bound + len(self._client.deque) >= self._size:
+      self._close(connection)
+    else:
+      self._giveBackConnection(connection)
+
+  def _unbind(self, connection, threadExited):
+    with self._lock:
+      self._bound -= 1
+    if threadExited:
+      # Let another thread use the connection of a thread that exited
+      self._returnToPool(connection)
+
+  def _isHealthy(self, connection):
+    # An idle connection has nothing to read, unless the gateway server closed it or it is in an unknown state
+    if not getattr(connection, "is_connected", True):
+      return False
+    sock = getattr(connection, "socket", None)
+    if sock is None:
+      return True
+    try:
+      readable, _, _ = select.select([sock], [], [], 0)
+    except Exception:
+      # The socket is closed
+      return False
+    return not readable
+
+  def _close(self, connection):
+    try:
+      connection.close()
+    except Exception:
+      pass
+
+class _ThreadBinding(object):
+  """
+    A connection bound to a thread through a thread local. It is collected when the thread exits, which gives
+    the connection back to the pool unless it was released before.
+  """
+
+  def __init__(self, pool, connection):
+    self._pool = pool
+    self._connection = connection
+
+  def release(self):
+    connection = self._connection
+    self._connection = None
+    self._pool._unbind(connection, False)
+    return connection
+
+  def __del__(self):
+    if self._connection is not None:
+      connection = self._connection
+      self._connection = None
+      try:
+        self._pool._unbind(connection, True)
+      except Exception:
+        # The interpreter may be shutting down
+        pass
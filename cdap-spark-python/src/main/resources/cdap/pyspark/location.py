@@ -0,0 +1,246 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import json
+import socket
+import struct
+from collections import namedtuple
+
+__all__ = ["Location", "LocationStatus", "LocationReader", "LocationWriter", "listLocations"]
+
+LocationStatus = namedtuple("LocationStatus", ["path", "name", "length", "directory", "lastModified"])
+
+# Default size of the buffer for reading from and writing to the local socket
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Maximum number of milliseconds to wait for the JVM to complete a transfer after the socket is done
+_AWAIT_MILLIS = 600000
+
+class Location(object):
+  """
+    A file or directory resolved through the CDAP location factory, which is HDFS in distributed mode.
+    The content is streamed between the JVM and Python through a local socket with large buffers,
+    instead of going through the Java gateway chunk by chunk.
+
+    A location can be passed in closures, for example to load a model on the executors.
+  """
+
+  def __init__(self, runtimeContext, path):
+    """
+      :param runtimeContext: the runtime context for talking to the JVM
+      :param path: a path relative to the root of the location factory, or an absolute URI
+    """
+    self._runtimeContext = runtimeContext
+    self.path = path
+
+  def __getstate__(self):
+    return { "context" : self._runtimeContext, "path" : self.path }
+
+  def __setstate__(self, state):
+    self.__init__(state["context"], state["path"])
+
+  def __repr__(self):
+    return "Location(%s)" % self.path
+
+  def open(self, offset = 0, length = -1, bufferSize = DEFAULT_BUFFER_SIZE):
+    """
+      Opens the location for reading.
+
+      :param offset: the position to start reading from
+      :param length: maximum number of bytes to read, or `-1` to read until the end of the file
+      :param bufferSize: size of the read buffer
+      :return: a :class:`LocationReader`
+    """
+    stream = self._runtimeContext.getJVM().PythonLocationStream.read(self._runtimeContext.getSparkRuntimeContext(),
+                                                                     self.path, offset, length)
+    return LocationReader(stream, bufferSize)
+
+  def read(self, offset = 0, length = -1, bufferSize = DEFAULT_BUFFER_SIZE):
+    """
+      Reads the content of the location. See :meth:`open`.
+
+      :return: the content as a byte string
+    """
+    with self.open(offset, length, bufferSize) as reader:
+      return reader.read()
+
+  def create(self, bufferSize = DEFAULT_BUFFER_SIZE):
+    """
+      Opens the location for writing. An existing file is overwritten.
+
+      :param bufferSize: size of the write buffer
+      :return: a :class:`LocationWriter`
+    """
+    stream = self._runtimeContext.getJVM().PythonLocationStream.write(self._runtimeContext.getSparkRuntimeContext(),
+                                                                      self.path)
+    return LocationWriter(stream, bufferSize)
+
+  def write(self, data, bufferSize = DEFAULT_BUFFER_SIZE):
+    """
+      Writes the given byte string to the location, replacing any existing content.
+
+      :return: the number of bytes written
+    """
+    with self.create(bufferSize) as writer:
+      writer.write(data)
+    return writer.bytesWritten
+
+  def list(self, recursive = False):
+    """
+      Lists the entries of this directory.
+
+      :param recursive: if `True`, sub-directories are listed recursively
+      :return: a list of :class:`LocationStatus`
+    """
+    return listLocations(self._runtimeContext, [self.path], recursive)[self.path]
+
+def listLocations(runtimeContext, paths, recursive = False):
+  """
+    Lists multiple directories in parallel in the JVM, with a single call through the Java gateway.
+
+    :param runtimeContext: the runtime context for talking to the JVM
+    :param paths: the paths to list
+    :param recursive: if `True`, sub-directories are listed recursively
+    :return: a dictionary from each path to the list of :class:`LocationStatus` under it
+  """
+  result = runtimeContext.getJVM().PythonLocationStream.list(runtimeContext.getSparkRuntimeContext(),
+                                                            json.dumps(list(paths)), recursive)
+  return dict((path, [LocationStatus(**entry) for entry in entries]) for path, entries in json.loads(result).items())
+
+class _LocationStream(object):
+
+  def __init__(self, stream):
+    self._stream = stream
+    self._socket = socket.create_connection(("localhost", stream.getPort()))
+    self._socket.sendall((stream.getSecret() + "\n").encode("utf-8"))
+
+  def __enter__(self):
+    return self
+
+  def _await(self):
+    # Raises the error of the JVM side if the transfer failed
+    return self._stream.await(_AWAIT_MILLIS)
+
+class LocationReader(_LocationStream):
+  """
+    A file-like object for reading the content of a :class:`Location`. Iterating over it returns the content
+    in chunks of the buffer size. It can be closed before all the content is read.
+  """
+
+  def __init__(self, stream, bufferSize = DEFAULT_BUFFER_SIZE):
+    _LocationStream.__init__(self, stream)
+    self._bufferSize = bufferSize
+    self._file = self._socket.makefile("rb", bufferSize)
+    self._closed = False
+    self._remaining = struct.unpack(">q", self._readFully(8))[0]
+
+  def __exit__(self, excType, excValue, traceback):
+    if excType is None:
+      self.close()
+      return
+    try:
+      self.close()
+    except Exception:
+      # The error raised in the with block is more relevant
+      pass
+
+  def __iter__(self):
+    while True:
+      chunk = self.read(self._bufferSize)
+      if not chunk:
+        return
+      yield chunk
+
+  def read(self, size = -1):
+    """
+      Reads up to `size` bytes, or until the end if `size` is negative. Returns an empty string at the end.
+    """
+    if size < 0 or size > self._remaining:
+      size = self._remaining
+    data = self._readFully(size)
+    self._remaining -= len(data)
+    return data
+
+  def close(self):
+    """
+      Closes the connection and waits for the JVM to complete the transfer. If the content was not read until
+      the end, the JVM stops sending it.
+    """
+    if self._closed:
+      return
+    self._closed = True
+    self._file.close()
+    self._socket.close()
+    self._await()
+
+  def _readFully(self, size):
+    data = self._file.read(size)
+    if len(data) < size:
+      self._await()
+      raise IOError("Unexpected end of stream while reading location content")
+    return data
+
+class LocationWriter(_LocationStream):
+  """
+    A file-like object for writing the content of a :class:`Location`. The content is only guaranteed to be
+    written when :meth:`close` returns.
+  """
+
+  def __init__(self, stream, bufferSize = DEFAULT_BUFFER_SIZE):
+    _LocationStream.__init__(self, stream)
+    # Buffered here instead of through makefile, since the file object would keep the socket open on abort
+    self._bufferSize = bufferSize
+    self._buffer = bytearray()
+    self.bytesWritten = 0
+
+  def __exit__(self, excType, excValue, traceback):
+    if excType is None:
+      self.close()
+    else:
+      self.abort()
+
+  def write(self, data):
+    if not self._buffer and len(data) >= self._bufferSize:
+      self._socket.sendall(data)
+      return
+    self._buffer += data
+    if len(self._buffer) >= self._bufferSize:
+      self._flushBuffer()
+
+  def abort(self):
+    """
+      Discards the content written so far. The location is left unchanged.
+    """
+    self._buffer = bytearray()
+    # Closing with a zero linger time resets the connection, which tells the JVM that the content is incomplete
+    self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    self._socket.close()
+
+  def close(self):
+    """
+      Flushes the buffer and waits for the JVM to write all the content to the location.
+    """
+    self._flushBuffer()
+    self._socket.shutdown(socket.SHUT_WR)
+    try:
+      self.bytesWritten = self._await()
+    finally:
+      self._socket.close()
+
+  def _flushBuffer(self):
+    if self._buffer:
+      self._socket.sendall(self._buffer)
+      self._buffer = bytearray()
@@ -14,14 +14,347 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
-from logging import Handler
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging import ERROR, Handler, NOTSET, makeLogRecord
+from threading import Event, Lock, Thread, local
+from weakref import WeakSet
 
-__all__ = ["CDAPLogHandler"]
+__all__ = ["CDAPLogHandler", "LogSampler", "flushHandlers"]
+
+# The handlers created in the current Python process, for flushing them before a Python worker exits
+_handlers = WeakSet()
+
+# Marks the threads that are calling the JVM on behalf of a handler
+_gatewayCall = local()
+
+def flushHandlers():
+  """
+    Sends the records buffered by all :class:`CDAPLogHandler` of the current Python process to the JVM. Python
+    workers forked by the fork server exit without running exit handlers, hence it is called after each task.
+  """
+  for handler in list(_handlers):
+    try:
+      handler.flush()
+    except Exception:
+      pass
+
+@contextmanager
+def _callingGateway():
+  # py4j logs its own debug records while talking to the JVM. If they reached a handler, the handler would call
+  # the JVM again from inside the call, hence records emitted by the thread in the meantime are ignored.
+  previous = getattr(_gatewayCall, "active", False)
+  _gatewayCall.active = True
+  try:
+    yield
+  finally:
+    _gatewayCall.active = previous
 
 class CDAPLogHandler(Handler):
+  """
+    A logging handler that sends Python log records to the CDAP logging pipeline, so that they are collected
+    with the logs of the Spark program.
+
+    Records are formatted in the calling thread and put in a bounded in-memory buffer. A background thread
+    sends them to the JVM in batches, hence logging never waits on the gateway. When the buffer is full,
+    either the oldest or the newest record is dropped, depending on the overflow policy.
+    The `shipped`, `dropped` and `failed` attributes count the records handled so far.
+
+    Before being buffered, records go through a :class:`LogSampler`, which can sample, rate limit and
+    deduplicate them. Unless one is given, the sampler is configured from the runtime arguments.
+
+    Records emitted by a thread while it is calling the JVM for a handler, such as the debug records of py4j,
+    are ignored. Python workers may exit as soon as a task ends, hence partition functions should flush the
+    handler at the end of the partition, for example by wrapping the partition iterator with :meth:`wrap`.
+    Workers forked by the `cdap.pyspark.daemon` fork server flush all handlers after each task.
+  """
+
+  DROP_OLDEST = "drop_oldest"
+  DROP_NEWEST = "drop_newest"
+
+  def __init__(self, level = NOTSET, capacity = 10000, batchSize = 500, flushInterval = 1.0,
+               overflowPolicy = DROP_OLDEST, runtimeContext = None, sampler = None):
+    """
+      :param level: the logging level of this handler
+      :param capacity: maximum number of records to buffer
+      :param batchSize: maximum number of records to send to the JVM in one call
+      :param flushInterval: maximum number of seconds a record stays in the buffer
+      :param overflowPolicy: either `CDAPLogHandler.DROP_OLDEST` or `CDAPLogHandler.DROP_NEWEST`
+      :param runtimeContext: the runtime context for talking to the JVM. If not provided, the one shared by the
+                             closures of the executor process is used. On the driver, use
+                             :meth:`SparkExecutionContext.getLogHandler`.
+      :param sampler: the :class:`LogSampler` to use. If not provided, it is created from the runtime arguments
+                      when the first record is emitted.
+    """
+    Handler.__init__(self, level)
+    if overflowPolicy not in (self.DROP_OLDEST, self.DROP_NEWEST):
+      raise ValueError("Unsupported overflow policy %s" % overflowPolicy)
+    self._capacity = capacity
+    self._batchSize = batchSize
+    self._flushInterval = flushInterval
+    self._dropNewest = overflowPolicy == self.DROP_NEWEST
+    self._runtimeContext = runtimeContext
+    self._sampler = sampler
+    self._records = deque(maxlen = capacity)
+    self._shipLock = Lock()
+    self._wakeup = Event()
+    self._stopped = Event()
+    self._shipper = None
+    self.shipped = 0
+    self.dropped = 0
+    self.failed = 0
+    _handlers.add(self)
+
+  def emit(self, record):
+    if getattr(_gatewayCall, "active", False):
+      return
+    if self._sampler is None:
+      try:
+        with _callingGateway():
+          arguments = self._getRuntimeContext().getRuntimeArguments()
+        self._sampler = LogSampler.fromArguments(arguments)
+      except Exception:
+        self._sampler = LogSampler()
+    for entry in self._sampler.filter(record):
+      self._enqueue(entry)
+
+  def wrap(self, iterator):
+    """
+      Returns a generator that yields all elements from the given iterator, and flushes this handler when the
+      iterator is exhausted. It is intended for `mapPartitions`, so that the records logged while processing
+      a partition are sent before the Python worker may be terminated:
+
+        rdd.mapPartitions(lambda iterator: handler.wrap(process(iterator)))
+    """
+    try:
+      for element in iterator:
+        yield element
+    finally:
+      self.flush()
+
+  def _enqueue(self, record):
+    try:
+      entry = { "logger" : record.name, "level" : record.levelno, "message" : self.format(record) }
+    except Exception:
+      self.handleError(record)
+      return
+
+    if len(self._records) >= self._capacity:
+      self.dropped += 1
+      if self._dropNewest:
+        return
+    # With a bounded deque, appending to a full buffer discards the oldest record
+    self._records.append(entry)
+
+    if self._shipper is None:
+      self._startShipper()
+    if len(self._records) >= self._batchSize:
+      self._wakeup.set()
+
+  def flush(self):
+    """
+      Sends all buffered records to the JVM.
+    """
+    self._enqueueSummaries()
+    while self._records:
+      if not self._ship():
+        break
+
+  def close(self):
+    _handlers.discard(self)
+    self._stopped.set()
+    self._wakeup.set()
+    if self._shipper is not None:
+      self._shipper.join(self._flushInterval)
+    try:
+      self.flush()
+    except Exception:
+      # The gateway may already be gone when the process is shutting down
+      pass
+    Handler.close(self)
+
+  def _startShipper(self):
+    with self._shipLock:
+      if self._shipper is None:
+        shipper = Thread(target = self._run, name = "cdap-log-shipper")
+        shipper.daemon = True
+        shipper.start()
+        self._shipper = shipper
+
+  def _run(self):
+    while not self._stopped.is_set():
+      self._wakeup.wait(self._flushInterval)
+      self._wakeup.clear()
+      self._enqueueSummaries()
+      while self._records and not self._stopped.is_set():
+        if not self._ship():
+          break
+
+  def _enqueueSummaries(self):
+    if self._sampler is not None:
+      for summary in self._sampler.summaries():
+        self._enqueue(summary)
+
+  def _ship(self):
+    """
+      Sends up to one batch of records to the JVM. Returns `False` if sending failed.
+    """
+    with self._shipLock:
+      batch = []
+      try:
+        while len(batch) < self._batchSize:
+          batch.append(self._records.popleft())
+      except IndexError:
+        pass
+      if not batch:
+        return True
+
+      try:
+        with _callingGateway():
+          runtimeContext = self._getRuntimeContext()
+          runtimeContext.getPythonUtil().log(runtimeContext.getSparkRuntimeContext(), json.dumps(batch))
+        self.shipped += len(batch)
+        return True
+      except Exception:
+        self.failed += len(batch)
+        return False
+
+  def _getRuntimeContext(self):
+    if self._runtimeContext is None:
+      # Imported here to avoid a circular import, since the context module imports this module
+      from context import SparkRuntimeContext
+      self._runtimeContext = SparkRuntimeContext.forExecutor()
+    return self._runtimeContext
+
+class LogSampler(object):
+  """
+    Bounds the volume of log records per logger. It supports emitting only one in every N records,
+    limiting the number of records per second with a token bucket, and collapsing consecutive identical
+    records into a "repeated N times" summary. Sampling and rate limiting don't apply to records at
+    `ERROR` level or above. The number of records filtered out is kept in the `suppressed` attribute.
+
+    It can be configured with these runtime arguments, where the value for a specific logger can be set by
+    appending `.<logger name>` to the key:
+
+      - `system.pyspark.log.sample.rate`: emit one in every N records, defaults to `1`
+      - `system.pyspark.log.rate.limit`: maximum number of records per second, defaults to `0` for unlimited
+      - `system.pyspark.log.dedup.enabled`: collapse repeated records if `true`, defaults to `false`
+  """
+
+  SAMPLE_RATE = "system.pyspark.log.sample.rate"
+  RATE_LIMIT = "system.pyspark.log.rate.limit"
+  DEDUP_ENABLED = "system.pyspark.log.dedup.enabled"
+
+  def __init__(self, sampleRate = 1, rateLimit = 0, dedup = False, loggerSampleRates = None,
+               loggerRateLimits = None):
+    """
+      :param sampleRate: emit one in every `sampleRate` records of a logger
+      :param rateLimit: maximum number of records per second for a logger, or `0` for unlimited
+      :param dedup: if `True`, consecutive identical records of a logger are collapsed into a summary
+      :param loggerSampleRates: an optional dictionary from logger name to the sample rate for that logger
+      :param loggerRateLimits: an optional dictionary from logger name to the rate limit for that logger
+    """
+    self._sampleRate = sampleRate
+    self._rateLimit = rateLimit
+    self._dedup = dedup
+    self._loggerSampleRates = loggerSampleRates or {}
+    self._loggerRateLimits = loggerRateLimits or {}
+    self._lock = Lock()
+    self._states = {}
+    self.suppressed = 0
+
+  @classmethod
+  def fromArguments(cls, arguments):
+    """
+      Creates a :class:`LogSampler` from the given runtime arguments.
+    """
+    loggerSampleRates = {}
+    loggerRateLimits = {}
+    for key, value in arguments.items():
+      if key.startswith(cls.SAMPLE_RATE + "."):
+        loggerSampleRates[key[len(cls.SAMPLE_RATE) + 1:]] = int(value)
+      elif key.startswith(cls.RATE_LIMIT + "."):
+        loggerRateLimits[key[len(cls.RATE_LIMIT) + 1:]] = float(value)
+
+    return cls(int(arguments.get(cls.SAMPLE_RATE, 1)), float(arguments.get(cls.RATE_LIMIT, 0)),
+               arguments.get(cls.DEDUP_ENABLED, "false").lower() == "true", loggerSampleRates, loggerRateLimits)
+
+  def filter(self, record):
+    """
+      Returns the list of records to emit for the given record. It is empty if the record is filtered out,
+      and it starts with a summary record if the record ends a run of repeated records.
+    """
+    with self._lock:
+      state = self._states.get(record.name)
+      if state is None:
+        state = self._states[record.name] = _LoggerState(self._loggerSampleRates.get(record.name, self._sampleRate),
+                                                         self._loggerRateLimits.get(record.name, self._rateLimit))
+      result = []
+      if self._dedup:
+        key = (record.levelno, record.msg, record.args)
+        if state.lastKey == key:
+          state.repeats += 1
+          self.suppressed += 1
+          return result
+        if state.repeats:
+          result.append(state.summary())
+        state.lastKey = key
+        state.lastRecord = record
+
+      if record.levelno < ERROR and not state.accept():
+        self.suppressed += 1
+        return result
+
+      result.append(record)
+      return result
+
+  def summaries(self):
+    """
+      Returns summary records for loggers that have repeated records which haven't been reported yet.
+    """
+    with self._lock:
+      return [state.summary() for state in self._states.values() if state.repeats]
+
+class _LoggerState(object):
+  """
+    Sampling, rate limiting and deduplication state of a logger.
+  """
+
+  def __init__(self, sampleRate, rateLimit):
+    self._sampleRate = sampleRate
+    self._rateLimit = rateLimit
+    self._count = 0
+    # The bucket holds at least one token, so that rates below one record per second still let records through
+    self._capacity = max(rateLimit, 1)
+    self._tokens = self._capacity
+    self._lastRefill = time.time()
+    self.lastKey = None
+    self.lastRecord = None
+    self.repeats = 0
 
-  def __init__(self):
-    Handler.__init__(self)
+  def accept(self):
+    self._count += 1
+    if self._sampleRate > 1 and (self._count - 1) % self._sampleRate:
+      return False
+    if self._rateLimit > 0:
+      now = time.time()
+      self._tokens = min(self._capacity, self._tokens + (now - self._lastRefill) * self._rateLimit)
+      self._lastRefill = now
+      if self._tokens < 1:
+        return False
+      self._tokens -= 1
+    return True
 
-  def emit(self, event):
-    print("Event", dir(event))
+  def summary(self):
+    record = self.lastRecord
+    summary = makeLogRecord({
+      "name" : record.name,
+      "levelno" : record.levelno,
+      "levelname" : record.levelname,
+      "msg" : "Previous message repeated %d times: %s",
+      "args" : (self.repeats, record.getMessage())
+    })
+    self.repeats = 0
+    return summary
@@ -0,0 +1,197 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+from array import array
+from zlib import crc32
+
+from encoding import toBytes
+
+__all__ = ["LookupTable", "DatasetLookup"]
+
+# Approximate number of bytes used by each entry on top of the key and value, for the size guard
+_ENTRY_OVERHEAD = 40
+
+class LookupTable(object):
+  """
+    A compact, read-only hash table from byte string keys to byte string values. All keys and values are stored
+    in one byte string, indexed by an open addressing hash table of integer arrays. Compared to a dictionary,
+    it uses a fraction of the memory and is pickled and unpickled as a handful of objects, which makes it cheap
+    to broadcast. Unicode keys and values are encoded as UTF-8.
+  """
+
+  def __init__(self, entries):
+    """
+      :param entries: an iterable of `(key, value)` pairs. For duplicate keys, the last value wins.
+    """
+    data = bytearray()
+    offsets = array("l")
+    keyLengths = array("l")
+    valueLengths = array("l")
+    positions = {}
+    for key, value in entries:
+      key = toBytes(key)
+      value = toBytes(value)
+      positions[key] = len(offsets)
+      offsets.append(len(data))
+      keyLengths.append(len(key))
+      valueLengths.append(len(value))
+      data += key
+      data += value
+
+    # Keep a load factor of at most one half, with a power of two size so that the slot is found by masking
+    size = 2
+    while size < 2 * len(positions):
+      size *= 2
+    slots = array("l", [-1]) * size
+    mask = size - 1
+    for key, index in positions.items():
+      slot = crc32(key) & mask
+      while slots[slot] >= 0:
+        slot = (slot + 1) & mask
+      slots[slot] = index
+
+    self._data = bytes(data)
+    self._offsets = offsets
+    self._keyLengths = keyLengths
+    self._valueLengths = valueLengths
+    self._slots = slots
+    self._size = len(positions)
+
+  def __len__(self):
+    return self._size
+
+  def __contains__(self, key):
+    return self._find(toBytes(key)) >= 0
+
+  def get(self, key, default = None):
+    """
+      Returns the value of the given key, or `default` if the key is not in the table.
+    """
+    index = self._find(toBytes(key))
+    if index < 0:
+      return default
+    start = self._offsets[index] + self._keyLengths[index]
+    return self._data[start:start + self._valueLengths[index]]
+
+  def _find(self, key):
+    slots = self._slots
+    mask = len(slots) - 1
+    slot = crc32(key) & mask
+    keyLength = len(key)
+    while True:
+      index = slots[slot]
+      if index < 0:
+        return -1
+      offset = self._offsets[index]
+      if self._keyLengths[index] == keyLength and self._data[offset:offset + keyLength] == key:
+        return index
+      slot = (slot + 1) & mask
+
+class DatasetLookup(object):
+  """
+    Enriches records with values looked up from a key/value CDAP Dataset, such as a `KeyValueTable`.
+
+    If the Dataset is small enough, it is loaded once in the driver into a :class:`LookupTable` and broadcasted
+    to the executors, where :meth:`get` is a local hash lookup. Otherwise, :meth:`join` falls back to a partitioned
+    join with the Dataset. The lookup can be passed in closures; only the broadcast reference is pickled.
+  """
+
+  def __init__(self, broadcast = None, dataFrame = None, keyColumn = "key", valueColumn = "value"):
+    """
+      :param broadcast: the broadcast of the :class:`LookupTable`, or `None` if the Dataset is too big
+      :param dataFrame: the DataFrame of the Dataset, used for joining if it is not broadcasted
+      :param keyColumn: name of the key column in the DataFrame
+      :param valueColumn: name of the value column in the DataFrame
+    """
+    self._broadcast = broadcast
+    self._dataFrame = dataFrame
+    self._keyColumn = keyColumn
+    self._valueColumn = valueColumn
+
+  def __getstate__(self):
+    # The DataFrame only lives in the driver
+    return { "broadcast" : self._broadcast }
+
+  def __setstate__(self, state):
+    self.__init__(state["broadcast"])
+
+  @classmethod
+  def load(cls, dataFrame, keyColumn = "key", valueColumn = "value", maxBroadcastBytes = 64 * 1024 * 1024):
+    """
+      Loads the key and value columns of the given DataFrame, broadcasting them if they are not bigger than
+      `maxBroadcastBytes`. The rows are streamed to the driver one partition at a time and loading stops as
+      soon as the limit is exceeded.
+    """
+    rows = dataFrame.select(keyColumn, valueColumn).rdd.toLocalIterator()
+    entries = []
+    totalBytes = 0
+    for key, value in rows:
+      key = toBytes(key)
+      value = toBytes(value)
+      totalBytes += len(key) + len(value) + _ENTRY_OVERHEAD
+      if totalBytes > maxBroadcastBytes:
+        return cls(None, dataFrame, keyColumn, valueColumn)
+      entries.append((key, value))
+
+    table = LookupTable(entries)
+    del entries
+    return cls(dataFrame.rdd.context.broadcast(table), dataFrame, keyColumn, valueColumn)
+
+  def isBroadcast(self):
+    """
+      Returns `True` if the Dataset is broadcasted, in which case :meth:`get` can be used.
+    """
+    return self._broadcast is not None
+
+  def get(self, key, default = None):
+    """
+      Returns the value of the given key as a byte string, or `default` if there is no such key.
+      It is only supported if the Dataset is broadcasted.
+    """
+    if self._broadcast is None:
+      raise RuntimeError("The dataset is too big to be broadcasted, use DatasetLookup.join instead")
+    return self._broadcast.value.get(key, default)
+
+  def join(self, rdd):
+    """
+      Looks up the key of each record of an RDD of `(key, record)` pairs, as in a left outer join.
+      It uses the broadcasted table if there is one, otherwise it joins with the Dataset.
+
+      :param rdd: an RDD of `(key, record)` pairs. Unicode keys are encoded as UTF-8.
+      :return: an RDD of `(key, (record, value))` pairs with byte string keys, where `value` is `None` if the key
+               is not in the Dataset
+    """
+    broadcast = self._broadcast
+    if broadcast is not None:
+      def lookup(pairs):
+        table = broadcast.value
+        for key, record in pairs:
+          key = toBytes(key)
+          yield key, (record, table.get(key))
+      return rdd.mapPartitions(lookup, preservesPartitioning = True)
+
+    if self._dataFrame is None:
+      raise RuntimeError("DatasetLookup.join can only be called in the driver")
+    table = self._dataFrame.select(self._keyColumn, self._valueColumn).rdd \
+                           .map(lambda row: (toBytes(row[0]), toBytes(row[1])))
+    return rdd.map(lambda pair: (toBytes(pair[0]), pair[1])).leftOuterJoin(table)
+
+  def unpersist(self):
+    """
+      Deletes the broadcasted copies of the table on the executors.
+    """
+    if self._broadcast is not None:
+      self._broadcast.unpersist()
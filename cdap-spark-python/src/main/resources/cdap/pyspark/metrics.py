@@ -0,0 +1,337 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import atexit
+import math
+import time
+from array import array
+from functools import wraps
+from threading import Event, Lock, RLock, Thread, local
+from timeit import default_timer
+
+__all__ = ["MetricsBuffer", "PartitionCounter", "Histogram", "Timer"]
+
+class MetricsBuffer(object):
+  """
+    Aggregates counter deltas and last gauge values in memory and publishes them with a single call to the
+    publisher function when either the number of buffered updates or the time since the last flush
+    exceeds the configured threshold. A daemon thread also flushes periodically so that an idle worker
+    doesn't hold on to metrics, and the buffer is flushed when the Python process exits normally. Workers
+    forked by `pyspark.daemon` exit without running exit handlers, hence the buffer is also flushed at the
+    end of each partition by :class:`PartitionCounter`, and partition functions that emit metrics otherwise
+    should call `flush` when they are done.
+
+    The publisher is called without holding the lock of the buffer, so that recording threads are not blocked
+    by the gateway call. If publishing fails, the metrics are kept in the buffer for the next flush.
+
+    Histogram values are recorded into a :class:`Histogram` per name. On flush, each histogram is published
+    as a `<name>.count` counter and `<name>.p50`, `<name>.p90`, `<name>.p99` and `<name>.max` gauges.
+  """
+
+  def __init__(self, publisher, maxSize = 10000, flushInterval = 5.0):
+    """
+      :param publisher: a function that takes a dictionary of counter deltas and a dictionary of gauge values
+      :param maxSize: maximum number of updates to buffer before flushing
+      :param flushInterval: maximum number of seconds to buffer updates before flushing
+    """
+    self._publisher = publisher
+    self._maxSize = maxSize
+    self._flushInterval = flushInterval
+    self._lock = RLock()
+    # Serializes publishing, so that the last gauge values are published last
+    self._publishLock = Lock()
+    self._counters = {}
+    self._gauges = {}
+    self._histograms = {}
+    self._pending = 0
+    self._lastFlush = time.time()
+    self._flusher = None
+    self._stopped = Event()
+    atexit.register(self.close)
+
+  def count(self, name, delta):
+    """
+      Adds the delta to the buffered value of the given counter.
+    """
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + delta
+      flush = self._updated()
+    if flush:
+      self._flushIfIdle()
+
+  def gauge(self, name, value):
+    """
+      Sets the buffered value of the given gauge. Only the last value is published.
+    """
+    with self._lock:
+      self._gauges[name] = value
+      flush = self._updated()
+    if flush:
+      self._flushIfIdle()
+
+  def histogram(self, name, value):
+    """
+      Records a value into the histogram of the given name.
+    """
+    with self._lock:
+      histogram = self._histograms.get(name)
+      if histogram is None:
+        histogram = self._histograms[name] = Histogram()
+      histogram.record(value)
+      # A histogram has a fixed size, hence only the time threshold applies
+      flush = self._checkInterval()
+    if flush:
+      self._flushIfIdle()
+
+  def flush(self):
+    """
+      Publishes all buffered metrics. Failures to publish are logged and the metrics are kept for the next flush.
+
+      :return: `True` if the buffered metrics were published
+    """
+    with self._publishLock:
+      return self._publish()
+
+  def close(self):
+    """
+      Stops the periodic flush thread and publishes all buffered metrics.
+    """
+    self._stopped.set()
+    if self._flusher is not None:
+      self._flusher.join(self._flushInterval)
+    self.flush()
+
+  def _publish(self):
+    with self._lock:
+      self._pending = 0
+      self._lastFlush = time.time()
+      histograms = [(name, histogram) for name, histogram in self._histograms.items() if histogram.count > 0]
+      if not (self._counters or self._gauges or histograms):
+        return True
+
+      # Swap out the buffered metrics, so that the publisher is called without holding the lock
+      counters = self._counters
+      gauges = self._gauges
+      self._counters = {}
+      self._gauges = {}
+      for name, histogram in histograms:
+        counters[name + ".count"] = counters.get(name + ".count", 0) + histogram.count
+        for percentile in (50, 90, 99):
+          gauges["%s.p%d" % (name, percentile)] = histogram.percentile(percentile)
+        gauges[name + ".max"] = histogram.max
+        histogram.reset()
+
+    try:
+      self._publisher(counters, gauges)
+      return True
+    except Exception:
+      # Put the metrics back, unless newer values were set in the meantime, and retry on next flush
+      with self._lock:
+        for name, delta in counters.items():
+          self._counters[name] = self._counters.get(name, 0) + delta
+        for name, value in gauges.items():
+          self._gauges.setdefault(name, value)
+      import logging
+      logging.getLogger(__name__).warn("Failed to publish metrics. They will be retried on next flush.",
+                                       exc_info = True)
+      return False
+
+  def _flushIfIdle(self):
+    # Called on the recording path. Skip if another thread is already publishing, since it will be
+    # followed by the periodic flush.
+    if self._publishLock.acquire(False):
+      try:
+        self._publish()
+      finally:
+        self._publishLock.release()
+
+  def _updated(self):
+    self._pending += 1
+    return self._pending >= self._maxSize or self._checkInterval()
+
+  def _checkInterval(self):
+    if self._flusher is None:
+      self._startFlusher()
+    return time.time() - self._lastFlush >= self._flushInterval
+
+  def _startFlusher(self):
+    self._flusher = Thread(target = self._periodicFlush, name = "cdap-metrics-flusher")
+    self._flusher.daemon = True
+    self._flusher.start()
+
+  def _periodicFlush(self):
+    while not self._stopped.wait(self._flushInterval):
+      self.flush()
+
+class PartitionCounter(object):
+  """
+    A counter that is incremented locally and only emits the accumulated value to the underlying metrics
+    once, when it is closed. It is intended to be used inside `mapPartitions`, so that per-record counting
+    costs a local integer addition and there is only one metrics emission per partition. Closing it also
+    flushes the metrics buffered in the Python process, since the partition end is the last point where
+    a Python worker is known to run before it may be terminated.
+
+    It can be used as a context manager:
+
+      def process(iterator):
+        with metrics.partitionCounter("records") as counter:
+          for record in iterator:
+            counter.increment()
+            yield transform(record)
+
+    or by wrapping the partition iterator, in which case it is closed when the iterator is exhausted:
+
+      rdd.mapPartitions(lambda iterator: metrics.partitionCounter("records").wrap(iterator))
+  """
+
+  def __init__(self, metrics, name):
+    self._metrics = metrics
+    self._name = name
+    self.value = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+
+  def increment(self, delta = 1):
+    """
+      Increases the local value of this counter by delta.
+    """
+    self.value += delta
+
+  def wrap(self, iterator):
+    """
+      Returns a generator that yields all elements from the given iterator and increments this counter by one
+      for each of them. The counter is closed when the iterator is exhausted.
+    """
+    try:
+      for element in iterator:
+        self.value += 1
+        yield element
+    finally:
+      self.close()
+
+  def close(self):
+    """
+      Emits the accumulated value, resets the local value to zero and flushes the buffered metrics.
+    """
+    value = self.value
+    self.value = 0
+    if value:
+      self._metrics.count(self._name, value)
+    self._metrics.flush()
+
+class Histogram(object):
+  """
+    A histogram of non-negative values with logarithmic buckets, kept in a compact array. Each power of two is
+    divided into a fixed number of sub-buckets, which bounds the relative error of the reported percentiles
+    to about 9%. Values smaller than one are counted in the first bucket.
+  """
+
+  _SUB_BUCKETS = 8
+  _MAX_EXPONENT = 48
+
+  def __init__(self):
+    self._counts = array("l", [0]) * (self._SUB_BUCKETS * self._MAX_EXPONENT + 1)
+    self.count = 0
+    self.max = 0
+
+  def record(self, value):
+    """
+      Records a value into this histogram.
+    """
+    if value < 1:
+      index = 0
+    else:
+      index = min(int(math.log(value, 2) * self._SUB_BUCKETS) + 1, len(self._counts) - 1)
+    self._counts[index] += 1
+    self.count += 1
+    if value > self.max:
+      self.max = int(math.ceil(value))
+
+  def percentile(self, percentile):
+    """
+      Returns the upper bound of the bucket that contains the given percentile, capped by the maximum value
+      recorded, or 0 if no value was recorded.
+    """
+    rank = int(math.ceil(self.count * percentile / 100.0))
+    seen = 0
+    for index, count in enumerate(self._counts):
+      seen += count
+      if count and seen >= rank:
+        return min(int(math.ceil(2 ** (float(index) / self._SUB_BUCKETS))), self.max)
+    return 0
+
+  def reset(self):
+    """
+      Clears all recorded values.
+    """
+    for index in range(len(self._counts)):
+      self._counts[index] = 0
+    self.count = 0
+    self.max = 0
+
+class Timer(object):
+  """
+    Measures elapsed time in microseconds and records it through the given function. It can be used as a
+    context manager:
+
+      with metrics.timer("parse"):
+        parse(record)
+
+    or as a function decorator:
+
+      @metrics.timer("parse")
+      def parse(record):
+        ...
+  """
+
+  def __init__(self, recorder, name):
+    self._recorder = recorder
+    self._name = name
+    # The same Timer can be entered by multiple threads, hence each thread keeps its own stack of start times
+    self._local = local()
+
+  def __getstate__(self):
+    return {
+      "recorder" : self._recorder,
+      "name" : self._name
+    }
+
+  def __setstate__(self, state):
+    self.__init__(state["recorder"], state["name"])
+
+  def __enter__(self):
+    starts = getattr(self._local, "starts", None)
+    if starts is None:
+      starts = self._local.starts = []
+    starts.append(default_timer())
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self._recorder(self._name, (default_timer() - self._local.starts.pop()) * 1000000)
+
+  def __call__(self, func):
+    @wraps(func)
+    def timed(*args, **kwargs):
+      start = default_timer()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        self._recorder(self._name, (default_timer() - start) * 1000000)
+    return timed
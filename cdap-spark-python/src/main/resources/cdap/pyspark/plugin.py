@@ -0,0 +1,152 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import json
+from threading import RLock
+
+__all__ = ["PluginContext", "PluginInvoker"]
+
+class PluginContext(object):
+  """
+    Provides access to the plugins used by the Spark program. It can be passed in closures.
+  """
+
+  def __init__(self, runtimeContext):
+    self._runtimeContext = runtimeContext
+
+  def __getstate__(self):
+    return { "context" : self._runtimeContext }
+
+  def __setstate__(self, state):
+    self.__init__(state["context"])
+
+  def getPluginProperties(self, pluginId):
+    """
+      Returns the properties of a plugin.
+
+      :param pluginId: the id of the plugin as used when the program was configured
+      :return: a dictionary from property name to value
+    """
+    runtimeContext = self._runtimeContext
+    return json.loads(runtimeContext.getPythonUtil().getPluginProperties(runtimeContext.getSparkRuntimeContext(),
+                                                                         pluginId))
+
+  def newPluginInstance(self, pluginId):
+    """
+      Creates a new instance of a plugin in the JVM.
+
+      :param pluginId: the id of the plugin as used when the program was configured
+      :return: the py4j proxy of the plugin instance. Each method call on it goes through the Java gateway.
+    """
+    return self._runtimeContext.getSparkRuntimeContext().newPluginInstance(pluginId)
+
+  def getInvoker(self, pluginId, methodName, arity = 1, batchSize = 1000):
+    """
+      Returns a :class:`PluginInvoker` for calling a method of a plugin in batches.
+
+      :param pluginId: the id of the plugin as used when the program was configured
+      :param methodName: name of the public method to call
+      :param arity: number of parameters of the method
+      :param batchSize: maximum number of calls sent to the JVM at once
+      :return: a :class:`PluginInvoker`
+    """
+    return PluginInvoker(self._runtimeContext, pluginId, methodName, arity, batchSize)
+
+class PluginInvoker(object):
+  """
+    Calls a method of a plugin instance in the JVM for batches of arguments, with one call through the Java
+    gateway per batch. Arguments and results are converted through JSON, hence the method parameters and return
+    type must be types that Gson can convert, such as strings, numbers, booleans, lists, maps and simple Java beans.
+
+    An invoker can be passed in closures. The plugin is instantiated on first use in each Python process
+    and reused by all invokers of the same plugin method in that process. As with
+    :meth:`PluginContext.newPluginInstance`, no lifecycle method such as `initialize` or `destroy` is called on
+    the plugin, hence plugins that need to set up resources must do it when they are instantiated or on first use.
+    Pipeline plugins such as ETL transforms, which need an initialized context and emit `StructuredRecord`s through
+    an `Emitter`, cannot be invoked this way.
+  """
+
+  _lock = RLock()
+  _instances = {}
+
+  def __init__(self, runtimeContext, pluginId, methodName, arity = 1, batchSize = 1000):
+    self._runtimeContext = runtimeContext
+    self._pluginId = pluginId
+    self._methodName = methodName
+    self._arity = arity
+    self._batchSize = batchSize
+
+  def __getstate__(self):
+    return {
+      "context" : self._runtimeContext,
+      "pluginId" : self._pluginId,
+      "methodName" : self._methodName,
+      "arity" : self._arity,
+      "batchSize" : self._batchSize
+    }
+
+  def __setstate__(self, state):
+    self.__init__(state["context"], state["pluginId"], state["methodName"], state["arity"], state["batchSize"])
+
+  def invoke(self, *args):
+    """
+      Calls the method once with the given arguments and returns the result.
+    """
+    return self.invokeAll([args])[0]
+
+  def invokeAll(self, argumentsList):
+    """
+      Calls the method once for each entry of the given list.
+
+      :param argumentsList: a list of argument tuples, one per call
+      :return: the list of results, in the same order
+    """
+    results = []
+    for start in range(0, len(argumentsList), self._batchSize):
+      results.extend(self._invokeBatch(argumentsList[start:start + self._batchSize]))
+    return results
+
+  def mapPartition(self, records):
+    """
+      Calls the method for each record of an iterator and yields the results, sending the records to the JVM
+      in batches. Each record is passed as the single argument of the method, unless the arity is greater than one,
+      in which case each record must be a tuple of arguments. It can be passed to `mapPartitions`.
+    """
+    batch = []
+    for record in records:
+      batch.append((record,) if self._arity == 1 else record)
+      if len(batch) >= self._batchSize:
+        for result in self._invokeBatch(batch):
+          yield result
+        batch = []
+    if batch:
+      for result in self._invokeBatch(batch):
+        yield result
+
+  def _invokeBatch(self, batch):
+    return json.loads(self._getInstance().invoke(json.dumps([list(args) for args in batch])))
+
+  def _getInstance(self):
+    key = (self._pluginId, self._methodName, self._arity)
+    cls = self.__class__
+    with cls._lock:
+      instance = cls._instances.get(key)
+      if instance is None:
+        runtimeContext = self._runtimeContext
+        instance = runtimeContext.getJVM().PythonPluginInvoker(runtimeContext.getSparkRuntimeContext(),
+                                                               self._pluginId, self._methodName, self._arity)
+        cls._instances[key] = instance
+      return instance
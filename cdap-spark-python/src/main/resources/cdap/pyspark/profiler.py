@@ -0,0 +1,228 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+
+from metrics import Histogram
+
+__all__ = ["GatewayProfiler", "MethodStats", "CallSiteStats"]
+
+MethodStats = namedtuple("MethodStats", ["method", "calls", "totalMicros", "p50", "p99", "max",
+                                         "bytesSent", "bytesReceived"])
+CallSiteStats = namedtuple("CallSiteStats", ["callSite", "calls", "totalMicros"])
+
+# Names of the py4j protocol commands other than method calls, keyed by the first line of the command
+_COMMAND_NAMES = {
+  "a" : "array",
+  "d" : "dir",
+  "f" : "field",
+  "h" : "help",
+  "j" : "import",
+  "l" : "list",
+  "m" : "memory",
+  "p" : "exception",
+  "r" : "reflection",
+  "s" : "shutdown",
+  "S" : "stream"
+}
+
+# Maximum number of distinct call sites to track. Further call sites are aggregated under one entry.
+_MAX_CALL_SITES = 1000
+_OTHER_CALL_SITE = "<other>"
+
+# Files in this directory are part of the library, not call sites
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class GatewayProfiler(object):
+  """
+    Measures the round trips made through a py4j `GatewayClient`. For each Java method it counts the calls,
+    the bytes sent and received and records the latencies into a :class:`Histogram`. Each round trip is also
+    attributed to the first Python frame outside of this library and py4j, so that the report shows which
+    lines of the program talk to the JVM the most.
+
+    When a metrics recorder is given, the totals are also emitted as the `pyspark.gateway.calls`,
+    `pyspark.gateway.calls.<method>`, `pyspark.gateway.bytes.sent` and `pyspark.gateway.bytes.received`
+    counters and the `pyspark.gateway.latency` histogram, in microseconds. In the per method counter names, each
+    run of characters other than letters and digits in the method name is replaced by an underscore, such as
+    `pyspark.gateway.calls.SparkPythonUtil_toJson` or `pyspark.gateway.calls.new_PythonPluginInvoker`.
+
+    It works by replacing the `send_command` method of the client instance, hence there is no cost at all
+    unless the profiler is installed.
+  """
+
+  def __init__(self, gatewayClient, recorder = None):
+    """
+      :param gatewayClient: the py4j `GatewayClient` to profile
+      :param recorder: an optional :class:`MetricsBuffer` to emit the totals to
+    """
+    self._client = gatewayClient
+    self._recorder = recorder
+    self._sendCommand = gatewayClient.send_command
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._methods = {}
+    self._callSites = {}
+    self._libraryFiles = {}
+    self._libraryDirs = [_PACKAGE_DIR]
+    py4jModule = sys.modules.get(type(gatewayClient).__module__)
+    if py4jModule is not None and getattr(py4jModule, "__file__", None):
+      self._libraryDirs.append(os.path.dirname(os.path.abspath(py4jModule.__file__)))
+
+    gatewayClient.send_command = self._send
+
+  def uninstall(self):
+    """
+      Restores the original `send_command` method of the client. The statistics collected so far are kept.
+    """
+    self._client.send_command = self._sendCommand
+
+  @contextmanager
+  def suspended(self):
+    """
+      Returns a context manager during which the round trips of the current thread are not recorded.
+      It is used when publishing the metrics of the profiler itself.
+    """
+    depth = getattr(self._local, "suspended", 0)
+    self._local.suspended = depth + 1
+    try:
+      yield self
+    finally:
+      self._local.suspended = depth
+
+  def getMethodStats(self):
+    """
+      Returns a list of :class:`MethodStats`, sorted by decreasing total time.
+    """
+    with self._lock:
+      stats = [MethodStats(method, entry[0], int(entry[1]), entry[4].percentile(50), entry[4].percentile(99),
+                           entry[4].max, entry[2], entry[3]) for method, entry in self._methods.items()]
+    return sorted(stats, key = lambda s: s.totalMicros, reverse = True)
+
+  def getCallSiteStats(self):
+    """
+      Returns a list of :class:`CallSiteStats`, sorted by decreasing total time.
+    """
+    with self._lock:
+      stats = [CallSiteStats(callSite, entry[0], int(entry[1])) for callSite, entry in self._callSites.items()]
+    return sorted(stats, key = lambda s: s.totalMicros, reverse = True)
+
+  def report(self, limit = 20):
+    """
+      Returns a human readable summary of the round trips, with the `limit` most expensive methods and call sites.
+    """
+    methods = self.getMethodStats()
+    callSites = self.getCallSiteStats()
+    lines = ["Java gateway round trips: %d calls, %.1f ms, %d bytes sent, %d bytes received"
+             % (sum(s.calls for s in methods), sum(s.totalMicros for s in methods) / 1000.0,
+                sum(s.bytesSent for s in methods), sum(s.bytesReceived for s in methods))]
+    if methods:
+      lines.append("%-60s %10s %12s %10s %10s %10s %12s %12s"
+                   % ("Method", "Calls", "Total (ms)", "p50 (us)", "p99 (us)", "Max (us)", "Sent", "Received"))
+      for s in methods[:limit]:
+        lines.append("%-60s %10d %12.1f %10d %10d %10d %12d %12d"
+                     % (s.method[:60], s.calls, s.totalMicros / 1000.0, s.p50, s.p99, s.max,
+                        s.bytesSent, s.bytesReceived))
+    if callSites:
+      lines.append("%-83s %10s %12s" % ("Call site", "Calls", "Total (ms)"))
+      for s in callSites[:limit]:
+        lines.append("%-83s %10d %12.1f" % (s.callSite[-83:], s.calls, s.totalMicros / 1000.0))
+    return "\n".join(lines)
+
+  def _send(self, command, *args, **kwargs):
+    if getattr(self._local, "suspended", 0):
+      return self._sendCommand(command, *args, **kwargs)
+
+    start = default_timer()
+    response = None
+    try:
+      response = self._sendCommand(command, *args, **kwargs)
+      return response
+    finally:
+      micros = (default_timer() - start) * 1000000
+      # With binary transfer, py4j returns the response together with the connection
+      received = len(response) if isinstance(response, basestring) else 0
+      self._record(_methodName(command), self._callSite(), micros, len(command), received)
+
+  def _record(self, method, callSite, micros, sent, received):
+    with self._lock:
+      entry = self._methods.get(method)
+      if entry is None:
+        entry = self._methods[method] = [0, 0.0, 0, 0, Histogram(), "pyspark.gateway.calls." + _metricName(method)]
+      entry[0] += 1
+      entry[1] += micros
+      entry[2] += sent
+      entry[3] += received
+      entry[4].record(micros)
+
+      site = self._callSites.get(callSite)
+      if site is None:
+        if len(self._callSites) >= _MAX_CALL_SITES:
+          callSite = _OTHER_CALL_SITE
+        site = self._callSites.setdefault(callSite, [0, 0.0])
+      site[0] += 1
+      site[1] += micros
+      methodMetric = entry[5]
+
+    recorder = self._recorder
+    if recorder is not None:
+      # Publishing the metrics makes round trips too, which must not be recorded again
+      with self.suspended():
+        recorder.count("pyspark.gateway.calls", 1)
+        recorder.count(methodMetric, 1)
+        recorder.count("pyspark.gateway.bytes.sent", sent)
+        recorder.count("pyspark.gateway.bytes.received", received)
+        recorder.histogram("pyspark.gateway.latency", micros)
+
+  def _callSite(self):
+    # Skips the frames of this profiler
+    frame = sys._getframe(2)
+    while frame is not None:
+      code = frame.f_code
+      if not self._isLibraryFile(code.co_filename):
+        return "%s:%d (%s)" % (code.co_filename, frame.f_lineno, code.co_name)
+      frame = frame.f_back
+    return _OTHER_CALL_SITE
+
+  def _isLibraryFile(self, filename):
+    library = self._libraryFiles.get(filename)
+    if library is None:
+      directory = os.path.dirname(os.path.abspath(filename))
+      library = self._libraryFiles[filename] = directory in self._libraryDirs
+    return library
+
+def _metricName(method):
+  # Method names have spaces and dots, which are not valid in a single level of a metric name
+  return re.sub(r"[^A-Za-z0-9]+", "_", method).strip("_")
+
+def _methodName(command):
+  # A py4j command is a sequence of lines. A call is "c", the target object id and the method name.
+  lines = command.split("\n", 3)
+  commandType = lines[0]
+  if commandType == "c" and len(lines) > 2:
+    target = lines[1]
+    if target.startswith("z:"):
+      # A static method, for which the target is the class name
+      return "%s.%s" % (target.rsplit(".", 1)[-1], lines[2])
+    return lines[2]
+  if commandType == "i" and len(lines) > 1:
+    return "new " + lines[1].rsplit(".", 1)[-1]
+  return _COMMAND_NAMES.get(commandType, commandType)
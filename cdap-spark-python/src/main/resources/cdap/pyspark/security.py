@@ -0,0 +1,86 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+from cache import TTLCache
+
+__all__ = ["SecureData", "SecureDataCache", "SecureDataBroadcast"]
+
+class SecureData(object):
+  """
+    A value read from the CDAP secure store. It cannot be pickled, so that it is never captured in a closure
+    by accident; use :meth:`SparkExecutionContext.broadcastSecureData` to make secure data available to executors.
+  """
+
+  __slots__ = ["_name", "_value"]
+
+  def __init__(self, name, value):
+    self._name = name
+    self._value = value
+
+  def get(self):
+    """
+      Returns the secure value as a byte string.
+    """
+    return self._value
+
+  def __repr__(self):
+    return "SecureData(name=%s, value=*****)" % self._name
+
+  def __reduce__(self):
+    raise TypeError("SecureData %s cannot be pickled. Use SparkExecutionContext.broadcastSecureData to pass "
+                    "secure data to executors." % self._name)
+
+class SecureDataCache(TTLCache):
+  """
+    Process-wide cache of values read from the secure store. Values are evicted once their TTL has passed.
+  """
+
+class SecureDataBroadcast(object):
+  """
+    Secure data read in the driver and shipped to executors once through a Spark broadcast variable.
+    Only the broadcast reference is pickled with closures; each Python worker reads the values from the
+    broadcast on first use, without calling the secure store.
+
+    The values are not encrypted. On Spark 1.6 and 2.1, PySpark pickles the broadcast value in the clear to a
+    temporary file, and Spark sends the broadcast blocks to the executors and stores them as they are, unless
+    the cluster enables the encryption of the network traffic. Only broadcast secure data where that is
+    acceptable.
+  """
+
+  def __init__(self, broadcast, namespace):
+    """
+      :param broadcast: a broadcast of a dictionary from `(namespace, key)` to the secure value
+      :param namespace: the namespace used when none is given to :meth:`getSecureData`
+    """
+    self._broadcast = broadcast
+    self._namespace = namespace
+
+  def getSecureData(self, key, namespace = None):
+    """
+      Returns the :class:`SecureData` of the given key.
+
+      :param key: the secure key
+      :param namespace: an optional namespace of the key. Defaults to the namespace of the program.
+      :raise KeyError: if the key was not broadcasted
+    """
+    namespace = namespace or self._namespace
+    return SecureData(key, self._broadcast.value[(namespace, key)])
+
+  def unpersist(self):
+    """
+      Deletes the cached copies of the broadcast on the executors.
+    """
+    self._broadcast.unpersist()
@@ -0,0 +1,156 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import json
+import mmap
+import os
+import struct
+from array import array
+
+__all__ = ["StreamEventBatch", "StreamEventView"]
+
+# Timestamp and headers length of an event, followed by the body length after the headers
+_EVENT_HEADER = struct.Struct(">qi")
+_BODY_LENGTH = struct.Struct(">i")
+
+class StreamEventBatch(object):
+  """
+    A batch of stream events written by the JVM to a local file and memory mapped in the Python process.
+    Event bodies are exposed as views over the mapped memory, hence they are never copied into Python strings
+    unless requested. The file is deleted once it is mapped; the memory is released when the batch and all
+    views on it are garbage collected, or when :meth:`close` is called.
+  """
+
+  def __init__(self, path):
+    """
+      :param path: path of the batch file, as written by the JVM
+    """
+    if isinstance(path, (bytes, bytearray)):
+      path = path.decode("utf-8")
+    with open(path, "rb") as f:
+      try:
+        size = os.fstat(f.fileno()).st_size
+        self._mmap = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) if size else None
+      finally:
+        # The mapping stays valid after the file is removed
+        os.remove(path)
+
+    self._timestamps = array("l")
+    self._headerOffsets = array("l")
+    self._headerLengths = array("l")
+    self._bodyOffsets = array("l")
+    self._bodyLengths = array("l")
+    self._index(size)
+
+  def __len__(self):
+    return len(self._timestamps)
+
+  def __iter__(self):
+    for i in range(len(self._timestamps)):
+      yield self[i]
+
+  def __getitem__(self, i):
+    return StreamEventView(self, i)
+
+  def timestamps(self):
+    """
+      Returns the timestamps of all events as an `array` of longs.
+    """
+    return self._timestamps
+
+  def body(self, i):
+    """
+      Returns a zero-copy view of the body of the `i`-th event. It is a `memoryview` on Python 3 and a `buffer`
+      on Python 2. Use `bytes(view)` to copy the body into a string.
+    """
+    return _view(self._mmap, self._bodyOffsets[i], self._bodyLengths[i])
+
+  def headers(self, i):
+    """
+      Returns the headers of the `i`-th event as a dictionary.
+    """
+    length = self._headerLengths[i]
+    if length == 0:
+      return {}
+    offset = self._headerOffsets[i]
+    return json.loads(self._mmap[offset:offset + length].decode("utf-8"))
+
+  def toNumPy(self):
+    """
+      Returns the batch as NumPy arrays without copying the bodies. It returns a tuple of a `uint8` array over
+      the whole mapped file, followed by `int64` arrays of the event timestamps, body offsets and body lengths.
+      The body of the `i`-th event is `data[offsets[i]:offsets[i] + lengths[i]]`.
+    """
+    import numpy
+    data = numpy.frombuffer(self._mmap, dtype = numpy.uint8) if self._mmap is not None \
+           else numpy.zeros(0, dtype = numpy.uint8)
+    return (data, numpy.array(self._timestamps, dtype = numpy.int64),
+            numpy.array(self._bodyOffsets, dtype = numpy.int64), numpy.array(self._bodyLengths, dtype = numpy.int64))
+
+  def close(self):
+    """
+      Unmaps the batch file. Views returned by this batch must not be used afterwards.
+    """
+    if self._mmap is not None:
+      self._mmap.close()
+      self._mmap = None
+
+  def _index(self, size):
+    offset = 0
+    data = self._mmap
+    while offset < size:
+      timestamp, headersLength = _EVENT_HEADER.unpack_from(data, offset)
+      offset += _EVENT_HEADER.size
+      self._headerOffsets.append(offset)
+      self._headerLengths.append(headersLength)
+      offset += headersLength
+      bodyLength = _BODY_LENGTH.unpack_from(data, offset)[0]
+      offset += _BODY_LENGTH.size
+      self._timestamps.append(timestamp)
+      self._bodyOffsets.append(offset)
+      self._bodyLengths.append(bodyLength)
+      offset += bodyLength
+
+class StreamEventView(object):
+  """
+    A stream event in a :class:`StreamEventBatch`. The body is a zero-copy view and the headers are only
+    decoded when accessed.
+  """
+
+  __slots__ = ["_batch", "_index"]
+
+  def __init__(self, batch, index):
+    self._batch = batch
+    self._index = index
+
+  @property
+  def timestamp(self):
+    return self._batch._timestamps[self._index]
+
+  @property
+  def headers(self):
+    return self._batch.headers(self._index)
+
+  @property
+  def body(self):
+    return self._batch.body(self._index)
+
+def _view(data, offset, length):
+  try:
+    return memoryview(data)[offset:offset + length]
+  except TypeError:
+    # On Python 2, mmap only supports the old buffer interface
+    return buffer(data, offset, length)
@@ -0,0 +1,125 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+__all__ = ["vectorizedUDF"]
+
+# Columns of the pandas DataFrame passed to the function of a vectorized UDF
+COLUMNS = ("timestamp", "headers", "body")
+
+def vectorizedUDF(func, metrics = None, counterName = None, batchSize = 10000, columns = COLUMNS):
+  """
+    Creates a vectorized UDF over stream events, which is a partition function for `mapPartitions`. It calls
+    `func` once per batch of events, with a pandas DataFrame that has one row per event and the `timestamp`,
+    `headers` and `body` columns. Compared to a row-at-a-time function, the Python call overhead and the metrics
+    emission are paid once per batch, and columns can be processed with pandas and NumPy operations.
+
+    The partitions can either contain :class:`StreamEventBatch`, as returned by
+    :meth:`SparkExecutionContext.fromStreamBatches`, in which case each batch of the JVM is passed as is, or any
+    stream events, such as the rows of :meth:`SparkExecutionContext.fromStream`, which are grouped in batches
+    of `batchSize` events. For example, to keep the events whose number is even:
+
+      isEven = vectorizedUDF(lambda events: events[events.body.str.split(" ").str[1].astype(int) % 2 == 0],
+                             metrics, "body")
+      evens = sec.fromStreamBatches("stream").mapPartitions(isEven)
+
+    The function returns either a sequence with one value per event, such as a pandas Series or a NumPy array,
+    whose values are yielded, or a pandas DataFrame, whose rows are yielded as tuples. It runs on Spark 1.6
+    and later and requires pandas on the executors.
+
+    :param func: a function that takes a pandas DataFrame of events and returns a sequence or a DataFrame
+    :param metrics: an optional :class:`Metrics` for counting the events processed
+    :param counterName: name of the counter that is increased by the batch size, once per batch
+    :param batchSize: maximum number of events in a batch, when the partitions don't contain
+                      :class:`StreamEventBatch`
+    :param columns: the columns to build. Leaving out `headers` saves decoding them.
+    :return: a function that takes an iterator over the events of a partition and returns an iterator
+             over the results
+  """
+  unknown = set(columns) - set(COLUMNS)
+  if unknown:
+    raise ValueError("Unsupported columns %s, the columns are %s" % (sorted(unknown), list(COLUMNS)))
+
+  def process(iterator):
+    for batch in _batches(iterator, batchSize):
+      events = _toDataFrame(batch, columns)
+      result = func(events)
+      if metrics is not None and counterName is not None:
+        metrics.count(counterName, len(events))
+      for value in _values(result):
+        yield value
+      if not isinstance(batch, list):
+        # The bodies were copied into the DataFrame, hence the mapped file is not needed anymore
+        batch.close()
+
+  return process
+
+def _batches(iterator, batchSize):
+  """
+    Yields the :class:`StreamEventBatch` of the iterator as they are, and groups other events in lists.
+  """
+  # Imported here so that the module is only loaded when a vectorized UDF runs
+  from streams import StreamEventBatch
+
+  events = []
+  for element in iterator:
+    if isinstance(element, StreamEventBatch):
+      if events:
+        yield events
+        events = []
+      yield element
+      continue
+    events.append(element)
+    if len(events) >= batchSize:
+      yield events
+      events = []
+  if events:
+    yield events
+
+def _toDataFrame(batch, columns):
+  import numpy
+  import pandas
+
+  data = {}
+  if isinstance(batch, list):
+    if "timestamp" in columns:
+      data["timestamp"] = numpy.array([_timestamp(event) for event in batch], dtype = numpy.int64)
+    if "headers" in columns:
+      data["headers"] = [event.headers for event in batch]
+    if "body" in columns:
+      data["body"] = [bytes(event.body) for event in batch]
+  else:
+    if "timestamp" in columns:
+      timestamps = batch.timestamps()
+      data["timestamp"] = numpy.frombuffer(timestamps, dtype = "i%d" % timestamps.itemsize).astype(numpy.int64) \
+                          if len(timestamps) else numpy.zeros(0, dtype = numpy.int64)
+    if "headers" in columns:
+      data["headers"] = [batch.headers(i) for i in range(len(batch))]
+    if "body" in columns:
+      data["body"] = [bytes(batch.body(i)) for i in range(len(batch))]
+  return pandas.DataFrame(data, columns = [column for column in COLUMNS if column in columns])
+
+def _timestamp(event):
+  # The rows of the cdapstream data source name it "ts"
+  timestamp = getattr(event, "timestamp", None)
+  return event.ts if timestamp is None else timestamp
+
+def _values(result):
+  import pandas
+
+  if isinstance(result, pandas.DataFrame):
+    return result.itertuples(index = False)
+  # Converts NumPy scalars to Python values
+  return result.tolist() if hasattr(result, "tolist") else result
@@ -0,0 +1,124 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import atexit
+import json
+from threading import RLock
+
+__all__ = ["WorkflowToken"]
+
+class WorkflowToken(object):
+  """
+    Provides access to the user scope values of the workflow token of the workflow that the Spark program
+    is running in. All values are strings.
+
+    The token is read from the JVM once and reads are served locally afterwards. Puts are only allowed in the driver.
+    They are visible to :meth:`get` right away and are sent to the JVM together, when :meth:`flush` is called or
+    when the Python program exits, with the last value put for a key winning.
+
+    A token can be passed in closures for reading; it carries the values read in the driver.
+  """
+
+  def __init__(self, runtimeContext, content = None):
+    """
+      :param runtimeContext: the runtime context for talking to the JVM
+      :param content: the token content as returned by the JVM, or `None` to read it on first use
+    """
+    self._runtimeContext = runtimeContext
+    self._content = content
+    self._lock = RLock()
+    self._pending = {}
+    self._flushRegistered = False
+
+  def __getstate__(self):
+    with self._lock:
+      content = self._getContent()
+      values = dict((key, list(nodeValues)) for key, nodeValues in content["values"].items())
+      # Include values that haven't been flushed yet, so that they are visible to closures
+      for key, value in self._pending.items():
+        values.setdefault(key, []).append([content["nodeName"], value])
+      return { "context" : self._runtimeContext, "content" : { "nodeName" : content["nodeName"], "values" : values } }
+
+  def __setstate__(self, state):
+    self.__init__(state["context"], state["content"])
+
+  def get(self, key, nodeName = None):
+    """
+      Returns the most recent value of the given key.
+
+      :param key: the key to look up
+      :param nodeName: an optional workflow node name. If provided, returns the most recent value put by that node.
+      :return: the value as a string, or `None` if there is no such value
+    """
+    with self._lock:
+      content = self._getContent()
+      if key in self._pending and nodeName in (None, content["nodeName"]):
+        return self._pending[key]
+      for valueNodeName, value in reversed(content["values"].get(key, [])):
+        if nodeName is None or valueNodeName == nodeName:
+          return value
+      return None
+
+  def getAll(self, key):
+    """
+      Returns all the values of the given key as a list of `(nodeName, value)` tuples, in the order they were put.
+    """
+    with self._lock:
+      content = self._getContent()
+      values = [tuple(nodeValue) for nodeValue in content["values"].get(key, [])]
+      if key in self._pending:
+        values.append((content["nodeName"], self._pending[key]))
+      return values
+
+  def put(self, key, value):
+    """
+      Puts a value for the given key. It can only be called in the driver.
+
+      :param key: the key
+      :param value: the value. Non-string values are converted to strings, with booleans as `true` or `false`.
+    """
+    if not self._runtimeContext.isDriver():
+      raise RuntimeError("The workflow token can only be updated in the Spark driver")
+    if isinstance(value, bool):
+      value = "true" if value else "false"
+    elif not isinstance(value, basestring):
+      value = str(value)
+
+    with self._lock:
+      self._pending[key] = value
+      if not self._flushRegistered:
+        atexit.register(self.flush)
+        self._flushRegistered = True
+
+  def flush(self):
+    """
+      Sends all pending puts to the JVM in one call.
+    """
+    with self._lock:
+      if not self._pending:
+        return
+      runtimeContext = self._runtimeContext
+      runtimeContext.getPythonUtil().putWorkflowToken(runtimeContext.getSparkRuntimeContext(),
+                                                      json.dumps(self._pending))
+      content = self._getContent()
+      for key, value in self._pending.items():
+        content["values"].setdefault(key, []).append([content["nodeName"], value])
+      self._pending = {}
+
+  def _getContent(self):
+    if self._content is None:
+      self._content = self._runtimeContext.getWorkflowTokenContent()
+    return self._content
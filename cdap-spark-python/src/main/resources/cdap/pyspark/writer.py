@@ -0,0 +1,141 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import json
+import struct
+import sys
+import traceback
+
+from encoding import toBytes
+
+__all__ = ["TransactionalWriter"]
+
+class TransactionalWriter(object):
+  """
+    Writes key/value pairs to a CDAP Dataset in a transaction. The Dataset must be a `BatchWritable` of
+    `byte[]` keys and values, such as a `KeyValueTable`.
+
+    Writes are buffered in the Python process and sent to the JVM in large batches, all within one transaction
+    that is started when entering the `with` block and committed when leaving it. If the block raises,
+    the transaction is aborted. A writer can be passed in closures and used once per partition::
+
+      writer = sec.getTransactionalWriter("kvTable")
+      rdd.foreachPartition(writer.writePartition)
+
+    The transaction of the partition is then retried as a whole if the Spark task is retried.
+  """
+
+  def __init__(self, runtimeContext, datasetName, namespace = None, arguments = None, batchSize = 4 * 1024 * 1024):
+    """
+      :param runtimeContext: the runtime context for talking to the JVM
+      :param datasetName: name of the Dataset
+      :param namespace: an optional namespace of the Dataset. Defaults to the namespace of the program.
+      :param arguments: an optional dictionary of Dataset arguments
+      :param batchSize: number of buffered bytes that triggers sending the writes to the JVM
+    """
+    self._runtimeContext = runtimeContext
+    self._datasetName = datasetName
+    self._namespace = namespace
+    self._arguments = arguments
+    self._batchSize = batchSize
+    self._buffer = bytearray()
+    self._writer = None
+
+  def __getstate__(self):
+    return {
+      "context" : self._runtimeContext,
+      "datasetName" : self._datasetName,
+      "namespace" : self._namespace,
+      "arguments" : self._arguments,
+      "batchSize" : self._batchSize
+    }
+
+  def __setstate__(self, state):
+    self.__init__(state["context"], state["datasetName"], state["namespace"], state["arguments"], state["batchSize"])
+
+  def __enter__(self):
+    if self._writer is not None:
+      raise RuntimeError("Transaction already started for dataset %s" % self._datasetName)
+    runtimeContext = self._runtimeContext.getSparkRuntimeContext()
+    jvm = self._runtimeContext.getJVM()
+    self._writer = jvm.PythonDatasetWriter(runtimeContext, self._namespace, self._datasetName,
+                                           json.dumps(self._arguments or {}))
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    writer = self._writer
+    self._writer = None
+    if excType is not None:
+      del self._buffer[:]
+      _abort(writer)
+      return False
+
+    try:
+      self._send(writer)
+    except:
+      _abort(writer)
+      raise
+    writer.commit()
+    return False
+
+  def write(self, key, value):
+    """
+      Buffers a write of the given key and value. Unicode strings are encoded as UTF-8.
+      It must be called inside the `with` block of this writer.
+
+      :param key: the key as a byte string
+      :param value: the value as a byte string
+    """
+    if self._writer is None:
+      raise RuntimeError("Writes to dataset %s must be done in a transaction" % self._datasetName)
+    key = toBytes(key)
+    value = toBytes(value)
+    buffer = self._buffer
+    buffer += struct.pack(">i", len(key))
+    buffer += key
+    buffer += struct.pack(">i", len(value))
+    buffer += value
+    if len(buffer) >= self._batchSize:
+      self._send(self._writer)
+
+  def writeAll(self, pairs):
+    """
+      Buffers writes for all `(key, value)` pairs from the given iterable. See :meth:`write`.
+    """
+    for key, value in pairs:
+      self.write(key, value)
+
+  def writePartition(self, iterator):
+    """
+      Writes all `(key, value)` pairs of a partition in one transaction. It can be passed to `foreachPartition`.
+    """
+    with self:
+      self.writeAll(iterator)
+
+  def _send(self, writer):
+    if self._buffer:
+      # A bytearray is passed to Java as a byte[] in one gateway call
+      batch = self._buffer
+      self._buffer = bytearray()
+      writer.write(batch)
+
+def _abort(writer):
+  # Called while an exception is propagating, which must not be masked by a failure to abort
+  try:
+    writer.abort()
+  except Exception:
+    sys.stderr.write("Failed to abort the transaction\n")
+    traceback.print_exc()
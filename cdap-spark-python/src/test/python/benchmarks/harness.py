@@ -0,0 +1,133 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Measurement helpers for the `cdap.pyspark` benchmarks. Each benchmark runs an operation repeatedly and reports
+  the throughput, the latency percentiles and the allocations that each operation leaves behind, which catches
+  caches and leaks that grow with the number of calls. Python 2 has no allocation tracing, hence the allocations
+  are counted as the number of objects tracked by the garbage collector. The number of bytes is also reported
+  when `tracemalloc` is available.
+"""
+
+import gc
+import json
+from array import array
+from collections import namedtuple
+from timeit import default_timer
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+__all__ = ["BenchmarkResult", "measure", "fromSamples", "formatResults", "saveResults", "loadResults",
+           "findRegressions"]
+
+BenchmarkResult = namedtuple("BenchmarkResult", ["name", "iterations", "opsPerSecond", "p50", "p90", "p99", "max",
+                                                 "retainedBytes", "retainedObjects"])
+
+def measure(name, operation, iterations = 10000, warmup = 100):
+  """
+    Runs an operation and measures it.
+
+    :param name: name of the benchmark
+    :param operation: a function without arguments
+    :param iterations: number of measured calls
+    :param warmup: number of calls before measuring, for filling caches and opening connections
+    :return: a :class:`BenchmarkResult`, with latencies in microseconds
+  """
+  for _ in range(warmup):
+    operation()
+
+  samples = array("d", [0.0]) * iterations
+  timer = default_timer
+  gc.collect()
+  objectsBefore = len(gc.get_objects())
+  if tracemalloc is not None:
+    tracemalloc.start()
+
+  for i in range(iterations):
+    start = timer()
+    operation()
+    samples[i] = timer() - start
+
+  gc.collect()
+  retainedObjects = float(len(gc.get_objects()) - objectsBefore) / iterations
+  retainedBytes = None
+  if tracemalloc is not None:
+    retainedBytes = float(tracemalloc.get_traced_memory()[0]) / iterations
+    tracemalloc.stop()
+  return fromSamples(name, samples, retainedBytes, retainedObjects)
+
+def fromSamples(name, samples, retainedBytes = None, retainedObjects = None):
+  """
+    Creates a :class:`BenchmarkResult` from latencies measured by the caller, in seconds.
+  """
+  latencies = sorted(sample * 1000000 for sample in samples)
+  total = sum(samples)
+
+  def percentile(p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+  return BenchmarkResult(name, len(latencies), len(latencies) / total if total > 0 else float("inf"),
+                         percentile(50), percentile(90), percentile(99), latencies[-1],
+                         retainedBytes, retainedObjects)
+
+def formatResults(results):
+  """
+    Returns the results as a table.
+  """
+  lines = ["%-48s %10s %12s %10s %10s %10s %10s %12s %12s"
+           % ("Benchmark", "Iterations", "Ops/sec", "p50 (us)", "p90 (us)", "p99 (us)", "Max (us)",
+              "Kept B/op", "Kept obj/op")]
+  for r in results:
+    lines.append("%-48s %10d %12.0f %10.1f %10.1f %10.1f %10.1f %12s %12.3f"
+                 % (r.name, r.iterations, r.opsPerSecond, r.p50, r.p90, r.p99, r.max,
+                    "-" if r.retainedBytes is None else "%.0f" % r.retainedBytes,
+                    r.retainedObjects or 0.0))
+  return "\n".join(lines)
+
+def saveResults(results, path):
+  """
+    Writes the results as JSON, for comparing later runs with :func:`findRegressions`.
+  """
+  with open(path, "w") as f:
+    json.dump([r._asdict() for r in results], f, indent = 2, sort_keys = True)
+
+def loadResults(path):
+  with open(path) as f:
+    return [BenchmarkResult(**entry) for entry in json.load(f)]
+
+def findRegressions(results, baseline, tolerance = 0.2):
+  """
+    Compares results with a baseline of the same benchmarks.
+
+    :param results: the list of :class:`BenchmarkResult` to check
+    :param baseline: the list of :class:`BenchmarkResult` to compare with
+    :param tolerance: the fraction by which the throughput may drop or the median latency may increase
+    :return: a list of messages, one per regressed benchmark
+  """
+  baselineByName = dict((r.name, r) for r in baseline)
+  regressions = []
+  for r in results:
+    base = baselineByName.get(r.name)
+    if base is None:
+      continue
+    if r.opsPerSecond < base.opsPerSecond * (1 - tolerance):
+      regressions.append("%s: %.0f ops/sec, was %.0f" % (r.name, r.opsPerSecond, base.opsPerSecond))
+    elif r.p50 > base.p50 * (1 + tolerance):
+      regressions.append("%s: p50 %.1f us, was %.1f" % (r.name, r.p50, base.p50))
+  return regressions
@@ -0,0 +1,285 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Offline benchmark suite of `cdap.pyspark`. The library talks to a :class:`StandInGateway` in the same process
+  instead of a CDAP Spark program, hence it runs on any machine with Python and py4j, for example with the
+  `python/lib/py4j-*-src.zip` of a Spark distribution on the `PYTHONPATH`.
+
+  Usage: python run.py [-n ITERATIONS] [--save FILE] [--baseline FILE] [--tolerance FRACTION]
+                       [--import-budget MILLIS] [GROUP ...]
+
+  The groups are `import`, `context`, `metrics`, `discovery`, `pickling` and `udf`; all groups run by default.
+  The `udf` group also needs pandas.
+  With `--baseline`, the results are compared with the ones saved by an earlier run with `--save`, and the
+  exit code is `1` if any benchmark regressed by more than the tolerance. The `import` group also fails if
+  importing `cdap.pyspark` loads py4j, pyspark or the modules of the individual features, if the service URL
+  cache loads the socket modules, or if the median import time exceeds the import budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+try:
+  # PySpark uses cPickle on Python 2
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+_RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir,
+                              "main", "resources")
+sys.path.insert(0, _RESOURCES_DIR)
+
+from harness import findRegressions, formatResults, fromSamples, loadResults, measure, saveResults
+from standin import StandInGateway, StandInRuntimeContext
+
+# Number of runtime arguments of the stand-in program, which is typical for a program in a workflow
+_RUNTIME_ARGUMENTS = dict(("argument.%d" % i, "value.%d" % i) for i in range(50))
+
+# Modules that importing cdap.pyspark must not load, since they are only needed by the features that use them
+_LAZY_MODULES = ["py4j", "pyspark"] + ["cdap.pyspark." + name for name in [
+  "cache", "dataframes", "discovery", "encoding", "gateway", "location", "log", "lookup", "plugin", "profiler",
+  "security", "streams", "workflow", "writer"]]
+
+# Modules that the service URL cache must not load, since only the ServiceClient talks to services directly
+_NETWORK_MODULES = ["_ssl", "select", "socket"]
+
+def importBenchmarks(iterations):
+  """
+    Measures importing `cdap.pyspark` in a new Python process, which every Python worker does.
+  """
+  script = "import sys, timeit; start = timeit.default_timer(); import cdap.pyspark; " \
+           "sys.stdout.write(repr(timeit.default_timer() - start))"
+  samples = [float(_runPython(script)) for _ in range(max(10, iterations // 1000))]
+  return [fromSamples("import.cdap.pyspark", samples)]
+
+def checkImport(results, budget):
+  """
+    Checks that importing `cdap.pyspark` stays cheap.
+
+    :param results: the results of :func:`importBenchmarks`
+    :param budget: maximum median time of the import in milliseconds
+    :return: a list of messages, one per violation
+  """
+  regressions = ["import.cdap.pyspark: loads " + name for name in _loadedModules("cdap.pyspark", _LAZY_MODULES)]
+  regressions.extend("import.cdap.pyspark.discovery: loads " + name
+                     for name in _loadedModules("cdap.pyspark.discovery", _NETWORK_MODULES))
+  for r in results:
+    if r.name == "import.cdap.pyspark" and r.p50 > budget * 1000:
+      regressions.append("%s: p50 %.1f ms, budget is %.1f ms" % (r.name, r.p50 / 1000, budget))
+  return regressions
+
+def _loadedModules(module, names):
+  script = "import sys; import %s; " \
+           "sys.stdout.write(' '.join(name for name in %r if sys.modules.get(name) is not None))" % (module, names)
+  return _runPython(script).split()
+
+def _runPython(script):
+  env = dict(os.environ)
+  env["PYTHONPATH"] = os.pathsep.join([_RESOURCES_DIR] + [path for path in sys.path if path])
+  return subprocess.check_output([sys.executable, "-c", script], env = env)
+
+def contextBenchmarks(sec, iterations):
+  """
+    Measures plain gateway round trips and the program information methods of the `SparkExecutionContext`.
+  """
+  from cdap.pyspark.context import SparkRuntimeContext
+  from cdap.pyspark.profiler import GatewayProfiler
+
+  runtimeContext = sec._runtimeContext
+  javaContext = runtimeContext.getSparkRuntimeContext()
+  results = [
+    measure("gateway.call", javaContext.getNamespace, iterations),
+    # Resolving the class through the JVM view takes two more round trips
+    measure("gateway.call.static", lambda: runtimeContext.getPythonUtil().getWorkflowToken(javaContext), iterations),
+    measure("context.getLogicalStartTime", sec.getLogicalStartTime, iterations),
+    measure("context.getRuntimeArguments", sec.getRuntimeArguments, iterations)
+  ]
+
+  profiler = GatewayProfiler(SparkRuntimeContext._gateway._gateway_client)
+  try:
+    results.append(measure("gateway.call.profiled", javaContext.getNamespace, iterations))
+  finally:
+    profiler.uninstall()
+  return results
+
+def metricsBenchmarks(sec, iterations):
+  """
+    Measures emitting metrics, directly to the JVM and through the buffer of the Python process.
+  """
+  metrics = sec.getMetrics()
+  buffered = sec.getMetrics(buffered = True)
+
+  def partition():
+    with metrics.partitionCounter("records") as counter:
+      for _ in range(1000):
+        counter.increment()
+
+  def countAndFlush():
+    buffered.count("records", 1)
+    buffered.flush()
+
+  return [
+    measure("metrics.count", lambda: metrics.count("records", 1), iterations),
+    measure("metrics.count.buffered", lambda: buffered.count("records", 1), iterations),
+    measure("metrics.histogram", lambda: metrics.histogram("latency", 1234), iterations),
+    measure("metrics.partitionCounter.1000", partition, iterations),
+    measure("metrics.flush", countAndFlush, iterations)
+  ]
+
+def discoveryBenchmarks(sec, iterations):
+  """
+    Measures discovering services, with and without the cache of the Python process.
+  """
+  cached = sec.getServiceDiscoverer()
+  uncached = sec.getServiceDiscoverer(cacheTTL = 0, negativeCacheTTL = 0)
+  return [
+    measure("discovery.getServiceURL.cached", lambda: cached.getServiceURL("service"), iterations),
+    measure("discovery.getServiceURL.uncached", lambda: uncached.getServiceURL("service"), iterations),
+    measure("discovery.getServiceURL.missing", lambda: cached.getServiceURL("missing"), iterations)
+  ]
+
+def picklingBenchmarks(sec, iterations):
+  """
+    Measures pickling the CDAP objects captured by closures in the driver, and unpickling task closures
+    on the executors.
+  """
+  import unpickling
+
+  metrics = sec.getMetrics()
+  discoverer = sec.getServiceDiscoverer()
+  pickledMetrics = pickle.dumps(metrics, pickle.HIGHEST_PROTOCOL)
+  return [
+    measure("pickling.dumps.Metrics", lambda: pickle.dumps(metrics, pickle.HIGHEST_PROTOCOL), iterations),
+    measure("pickling.dumps.ServiceDiscoverer", lambda: pickle.dumps(discoverer, pickle.HIGHEST_PROTOCOL),
+            iterations),
+    measure("pickling.loads.Metrics", lambda: pickle.loads(pickledMetrics), iterations)
+  ] + unpickling.run(iterations)
+
+def udfBenchmarks(sec, iterations):
+  """
+    Measures the Python side of the `testPySpark.py` workload, which keeps the stream events whose number is even
+    and counts the events, for a batch of events. The row-at-a-time function is called once per event and emits
+    the counter for each event, while the function of a :func:`vectorizedUDF` is called once per batch with a
+    pandas DataFrame of the events, and emits the counter once. The batch file variant also includes writing
+    and memory mapping the batch file, as done for :meth:`SparkExecutionContext.fromStreamBatches`. The transfer
+    of the events between the JVM and the Python worker is not included.
+  """
+  try:
+    import pandas
+  except ImportError:
+    sys.stderr.write("Skipping the udf benchmarks, which require pandas\n")
+    return []
+  import struct
+  import tempfile
+  from collections import namedtuple
+  from cdap.pyspark import vectorizedUDF
+  from cdap.pyspark.streams import StreamEventBatch
+
+  # The rows of the cdapstream data source
+  StreamRow = namedtuple("StreamRow", ["ts", "headers", "body"])
+  rows = [StreamRow(1000 + i, {}, "Event %d" % i) for i in range(1000)]
+  batchContent = b"".join(struct.pack(">qi", row.ts, 0) + struct.pack(">i", len(row.body)) + row.body
+                          for row in rows)
+  batchDirectory = tempfile.mkdtemp()
+  batchPath = os.path.join(batchDirectory, "batch")
+
+  metrics = sec.getMetrics()
+
+  def isEven(row):
+    metrics.count("body", 1)
+    return int(row.body.split(" ")[1]) % 2 == 0
+
+  isEvenBatch = vectorizedUDF(lambda events: events[events.body.str.split(" ").str[1].astype(int) % 2 == 0],
+                              metrics, "body", columns = ("timestamp", "body"))
+
+  def fromBatchFile():
+    with open(batchPath, "wb") as f:
+      f.write(batchContent)
+    return list(isEvenBatch(iter([StreamEventBatch(batchPath)])))
+
+  batches = max(10, iterations // 1000)
+  try:
+    return [
+      measure("udf.row.isEven.1000", lambda: [row for row in rows if isEven(row)], batches, 1),
+      measure("udf.vectorized.isEven.1000", lambda: list(isEvenBatch(iter(rows))), batches, 1),
+      measure("udf.vectorized.batchFile.isEven.1000", fromBatchFile, batches, 1)
+    ]
+  finally:
+    os.rmdir(batchDirectory)
+
+_GROUPS = [
+  ("context", contextBenchmarks),
+  ("metrics", metricsBenchmarks),
+  ("discovery", discoveryBenchmarks),
+  ("pickling", picklingBenchmarks),
+  ("udf", udfBenchmarks)
+]
+
+def startGateway():
+  """
+    Starts a :class:`StandInGateway` and points `cdap.pyspark` to it.
+  """
+  runtimeContext = StandInRuntimeContext(_RUNTIME_ARGUMENTS, services = { "service" : "http://127.0.0.1:10000/" })
+  gateway = StandInGateway(runtimeContext).start()
+  os.environ["PYSPARK_GATEWAY_PORT"] = str(gateway.port)
+  return gateway
+
+def main(args):
+  parser = argparse.ArgumentParser(description = "Runs the cdap.pyspark benchmarks against a stand-in gateway")
+  parser.add_argument("groups", nargs = "*", help = "the groups of benchmarks to run")
+  parser.add_argument("-n", "--iterations", type = int, default = 10000, help = "number of calls per benchmark")
+  parser.add_argument("--save", help = "file to save the results to, as JSON")
+  parser.add_argument("--baseline", help = "file of saved results to compare with")
+  parser.add_argument("--tolerance", type = float, default = 0.2,
+                      help = "fraction by which a benchmark may be slower than the baseline")
+  parser.add_argument("--import-budget", type = float, default = 15,
+                      help = "maximum median time of importing cdap.pyspark in milliseconds")
+  options = parser.parse_args(args)
+
+  try:
+    import py4j
+  except ImportError:
+    sys.stderr.write("py4j is required, for example from the python/lib directory of a Spark distribution\n")
+    return 2
+
+  groups = options.groups or ["import"] + [name for name, _ in _GROUPS]
+  results = []
+  regressions = []
+  if "import" in groups:
+    results.extend(importBenchmarks(options.iterations))
+    regressions.extend(checkImport(results, options.import_budget))
+
+  startGateway()
+  from cdap.pyspark import SparkExecutionContext
+  sec = SparkExecutionContext()
+  for name, benchmarks in _GROUPS:
+    if name in groups:
+      results.extend(benchmarks(sec, options.iterations))
+
+  print formatResults(results)
+  if options.save:
+    saveResults(results, options.save)
+  if options.baseline:
+    regressions.extend(findRegressions(results, loadResults(options.baseline), options.tolerance))
+  for regression in regressions:
+    print "Regression: " + regression
+  return 1 if regressions else 0
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
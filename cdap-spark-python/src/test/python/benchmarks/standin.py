@@ -0,0 +1,255 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  A stand-in for the JVM side of the Java gateway, for running `cdap.pyspark` without CDAP and Spark.
+  It is a local server that speaks the subset of the py4j protocol used by `cdap.pyspark`, with Python
+  implementations of the CDAP Java classes. Since the real py4j client talks to it over a local socket,
+  the measured costs include the command encoding, the round trips and the answer decoding, but not
+  the work done by CDAP in the JVM.
+"""
+
+import base64
+import itertools
+import json
+import socket
+import threading
+
+__all__ = ["StandInGateway", "StandInRuntimeContext"]
+
+# Package of the CDAP classes, as imported by cdap.pyspark with java_import
+_PACKAGE = "co.cask.cdap.app.runtime.spark"
+
+class StandInURL(object):
+
+  def __init__(self, url):
+    self._url = url
+
+  def toString(self):
+    return self._url
+
+class StandInRuntimeContext(object):
+  """
+    Stand-in for the Java `SparkRuntimeContext`. Metrics are aggregated in memory, so that benchmarks can
+    check what was published.
+  """
+
+  def __init__(self, runtimeArguments = None, logicalStartTime = 1500000000000, namespace = "default",
+               services = None):
+    self.runtimeArguments = dict(runtimeArguments or {})
+    self.logicalStartTime = logicalStartTime
+    self.namespace = namespace
+    self.services = dict(services or {})
+    self.counters = {}
+    self.gauges = {}
+
+  def getRuntimeArguments(self):
+    return self.runtimeArguments
+
+  def getLogicalStartTime(self):
+    return self.logicalStartTime
+
+  def getNamespace(self):
+    return self.namespace
+
+  def getServiceURL(self, *args):
+    # Either (serviceId) for the current application, or (appId, serviceId)
+    key = args[0] if len(args) == 1 else "%s.%s" % args
+    url = self.services.get(key)
+    return None if url is None else StandInURL(url)
+
+  def count(self, name, delta):
+    self.counters[name] = self.counters.get(name, 0) + delta
+
+  def gauge(self, name, value):
+    self.gauges[name] = value
+
+class StandInPythonUtil(object):
+  """
+    Stand-in for the static methods of the Java `SparkPythonUtil` used by `cdap.pyspark`.
+  """
+
+  @staticmethod
+  def setGatewayCallbackPort(gatewayServer, port):
+    pass
+
+  @staticmethod
+  def toJson(obj):
+    return json.dumps(obj)
+
+  @staticmethod
+  def updateMetrics(runtimeContext, countersJson, gaugesJson):
+    for name, delta in json.loads(countersJson).items():
+      runtimeContext.count(name, delta)
+    for name, value in json.loads(gaugesJson).items():
+      runtimeContext.gauge(name, value)
+
+  @staticmethod
+  def getWorkflowToken(runtimeContext):
+    return None
+
+class StandInGateway(object):
+  """
+    A local server answering py4j commands. Static methods are looked up on the stand-in classes, keyed by the
+    simple Java class name, and objects returned to Python are kept in a registry until py4j releases them.
+    Each client connection is served by its own daemon thread, as the py4j gateway server does.
+  """
+
+  def __init__(self, runtimeContext = None):
+    """
+      :param runtimeContext: the :class:`StandInRuntimeContext` returned by `SparkRuntimeContextProvider.get()`
+    """
+    self.runtimeContext = runtimeContext or StandInRuntimeContext()
+    runtimeContextProvider = type("StandInRuntimeContextProvider", (object,),
+                                  { "get" : staticmethod(lambda: self.runtimeContext) })
+    self._classes = {
+      "SparkPythonUtil" : StandInPythonUtil,
+      "SparkRuntimeContextProvider" : runtimeContextProvider
+    }
+    self._objects = {}
+    self._ids = itertools.count()
+    self._lock = threading.Lock()
+    self.commands = 0
+    self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self._server.bind(("127.0.0.1", 0))
+    self._server.listen(16)
+    self.port = self._server.getsockname()[1]
+
+  def addClass(self, name, cls):
+    """
+      Makes the static methods of a Python class callable from py4j as the Java class of the given simple name.
+    """
+    self._classes[name] = cls
+
+  def start(self):
+    thread = threading.Thread(target = self._accept, name = "standin-gateway")
+    thread.daemon = True
+    thread.start()
+    return self
+
+  def _accept(self):
+    while True:
+      try:
+        connection, _ = self._server.accept()
+      except socket.error:
+        return
+      connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      thread = threading.Thread(target = self._serve, args = (connection,), name = "standin-gateway-connection")
+      thread.daemon = True
+      thread.start()
+
+  def _serve(self, connection):
+    reader = connection.makefile("rb")
+    try:
+      while True:
+        command = reader.readline()
+        if not command:
+          return
+        parts = []
+        while True:
+          line = reader.readline()
+          if not line:
+            return
+          line = line[:-1]
+          if line == "e":
+            break
+          parts.append(line)
+        self.commands += 1
+        connection.sendall("!" + self._answer(command[:-1], parts) + "\n")
+    except socket.error:
+      pass
+    finally:
+      reader.close()
+      connection.close()
+
+  def _answer(self, command, parts):
+    try:
+      if command == "c":
+        return self._call(parts[0], parts[1], [self._decode(part) for part in parts[2:]])
+      if command == "r":
+        return self._reflect(parts)
+      if command == "m" or command == "j":
+        # Releasing an object and importing a package
+        if command == "m" and parts[0] == "d":
+          with self._lock:
+            self._objects.pop(parts[1], None)
+        return "yv"
+      return "xs" + _escape("Unsupported command " + command)
+    except Exception as e:
+      return "xs" + _escape("%s: %s" % (type(e).__name__, e))
+
+  def _reflect(self, parts):
+    if parts[0] == "u":
+      # Resolving a name on the JVM view. The stand-in classes are in the CDAP package, other names are packages.
+      name = parts[1]
+      if name in self._classes:
+        return "yc%s.%s" % (_PACKAGE, name)
+      return "yp"
+    if parts[0] == "m":
+      # Looking up a static member of a class
+      cls = self._classes.get(parts[1].rsplit(".", 1)[-1])
+      return "ym" if cls is not None and hasattr(cls, parts[2]) else "yo"
+    return "xs" + _escape("Unsupported reflection " + parts[0])
+
+  def _call(self, target, method, args):
+    if target.startswith("z:"):
+      obj = self._classes[target[2:].rsplit(".", 1)[-1]]
+    else:
+      obj = self._objects[target]
+    return self._encode(getattr(obj, method)(*args))
+
+  def _decode(self, part):
+    kind, value = part[0], part[1:]
+    if kind == "s":
+      return _unescape(value)
+    if kind == "i" or kind == "L":
+      return int(value)
+    if kind == "d":
+      return float(value)
+    if kind == "b":
+      return value.lower() == "true"
+    if kind == "n":
+      return None
+    if kind == "j":
+      return bytearray(base64.b64decode(value))
+    if kind == "r":
+      return self._objects.get(value)
+    raise ValueError("Unsupported argument type " + kind)
+
+  def _encode(self, value):
+    if value is None:
+      return "yn"
+    if isinstance(value, bool):
+      return "yb" + ("true" if value else "false")
+    if isinstance(value, (int, long)):
+      return ("yi%d" if -2 ** 31 <= value < 2 ** 31 else "yL%d") % value
+    if isinstance(value, float):
+      return "yd%r" % value
+    if isinstance(value, basestring):
+      return "ys" + _escape(value)
+    if isinstance(value, (bytes, bytearray)):
+      return "yj" + base64.b64encode(bytes(value))
+    objectId = "o%d" % next(self._ids)
+    with self._lock:
+      self._objects[objectId] = value
+    return "yr" + objectId
+
+def _escape(value):
+  return value.replace("\\", "\\\\").replace("\r", "\\r").replace("\n", "\\n")
+
+def _unescape(value):
+  return "\\".join("\n".join("\r".join(p.split("\\r")).split("\\n")) for p in value.split("\\\\"))
@@ -0,0 +1,109 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Micro-benchmark of the cost of unpickling a task closure that captures `Metrics` and `ServiceDiscoverer` on
+  an executor. It compares creating a new `SparkRuntimeContext` per unpickled object, which reads the gateway port
+  file every time, with the process-wide registry keyed by gateway port.
+
+  It is also part of the benchmark suite in `run.py`.
+
+  Usage: python unpickling.py [iterations]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+try:
+  # PySpark uses cPickle on Python 2
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.context import Metrics, ServiceDiscoverer, SparkRuntimeContext
+from harness import formatResults, measure
+
+def _legacyFromState(cls, state):
+  # What unpickling did before the registry: a new instance, reading the gateway port file again
+  cls._portFileRead = False
+  context = cls(state["gatewayPort"], False, state.get("poolSize", 0), state.get("threadAffinity", False))
+  context._runtimeArguments = state.get("runtimeArguments")
+  context._logicalStartTime = state.get("logicalStartTime")
+  return context
+
+def createClosure():
+  """
+    Returns the pickled form of a closure that captures typical CDAP objects, as sent with each task.
+  """
+  context = SparkRuntimeContext(12345, driver = False)
+  context._runtimeArguments = dict(("argument.%d" % i, "value.%d" % i) for i in range(20))
+  context._logicalStartTime = 1500000000000
+  # Each object is pickled separately, as when they are captured by different closures of the same stage
+  return [pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+          for obj in (Metrics(context), Metrics(context, True), ServiceDiscoverer(context))]
+
+@contextmanager
+def executorDirectory():
+  """
+    Simulates an executor, where the gateway port file is in the working directory.
+  """
+  workDir = tempfile.mkdtemp()
+  cwd = os.getcwd()
+  try:
+    os.chdir(workDir)
+    with open("cdap.py4j.gateway.port.txt", "w") as f:
+      f.write("12345")
+    yield workDir
+  finally:
+    os.chdir(cwd)
+    shutil.rmtree(workDir)
+
+def run(iterations = 10000):
+  """
+    Measures unpickling a task closure, without and with the registry.
+
+    :return: a list of two :class:`BenchmarkResult`, where each operation unpickles the whole closure
+  """
+  with executorDirectory():
+    pickles = createClosure()
+
+    def unpickle():
+      for data in pickles:
+        pickle.loads(data)
+
+    registryFromState = SparkRuntimeContext.__dict__["fromState"]
+    SparkRuntimeContext.fromState = classmethod(_legacyFromState)
+    try:
+      before = measure("pickling.unpickleClosure.newContext", unpickle, iterations)
+    finally:
+      SparkRuntimeContext.fromState = registryFromState
+    after = measure("pickling.unpickleClosure.registry", unpickle, iterations)
+    return [before, after]
+
+def main(iterations = 10000):
+  before, after = run(iterations)
+  print "Unpickling %d objects per task" % len(createClosure())
+  print formatResults([before, after])
+  print "Speedup: %.2fx" % (after.opsPerSecond / before.opsPerSecond)
+
+if __name__ == "__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
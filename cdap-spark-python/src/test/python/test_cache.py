@@ -0,0 +1,101 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the TTL cache shared by the secure data and the service discovery of `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.cache import TTLCache
+from cdap.pyspark.security import SecureDataCache
+
+class Loader(object):
+
+  def __init__(self, value):
+    self.value = value
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    return self.value
+
+def waitFor(condition, timeout = 5):
+  deadline = time.time() + timeout
+  while not condition() and time.time() < deadline:
+    time.sleep(0.01)
+  return condition()
+
+class TTLCacheTest(unittest.TestCase):
+
+  def testCallerTTL(self):
+    cache = TTLCache()
+    loader = Loader("value")
+    self.assertEqual("value", cache.get("key", 60, loader))
+    time.sleep(0.05)
+
+    # Callers with different TTLs share the entry
+    self.assertEqual("value", cache.get("key", 60, loader))
+    self.assertEqual("value", cache.get("key", 0.01, loader))
+    self.assertEqual(2, loader.calls)
+    self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+  def testNegativeTTL(self):
+    cache = TTLCache()
+    loader = Loader(None)
+    cache.get("key", 60, loader, negativeTtl = 0.01)
+    time.sleep(0.05)
+    cache.get("key", 60, loader, negativeTtl = 0.01)
+    self.assertEqual(2, loader.calls)
+
+  def testDisabled(self):
+    cache = TTLCache()
+    loader = Loader("value")
+    cache.get("key", 0, loader)
+    cache.get("key", 0, loader)
+    self.assertEqual(2, loader.calls)
+    self.assertEqual(0, len(cache))
+
+  def testEviction(self):
+    cache = SecureDataCache()
+    cache.get("short", 0.05, Loader(b"secret"))
+    cache.get("long", 60, Loader(b"other"))
+    self.assertEqual(2, len(cache))
+
+    # Evicted without any further lookup
+    self.assertTrue(waitFor(lambda: len(cache) == 1))
+    self.assertEqual(b"other", cache.get("long", 60, Loader(None)))
+
+  def testInvalidate(self):
+    cache = TTLCache()
+    loader = Loader("value")
+    cache.get("a", 60, loader)
+    cache.get("b", 60, loader)
+    cache.invalidate("a")
+    self.assertEqual(1, len(cache))
+    cache.invalidate()
+    self.assertEqual(0, len(cache))
+
+if __name__ == "__main__":
+  unittest.main()
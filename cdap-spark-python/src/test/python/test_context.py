@@ -0,0 +1,112 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the executor side registry of runtime contexts in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.context import GATEWAY_PORT_FILE, SparkRuntimeContext
+
+def writePortFile(port):
+  with open(GATEWAY_PORT_FILE, "w") as f:
+    f.write(str(port))
+
+def newProcess():
+  # Resets the state that is per Python process
+  SparkRuntimeContext._registry = {}
+  SparkRuntimeContext._portFileRead = False
+  SparkRuntimeContext._portFilePort = None
+
+def pickledContext(gatewayPort):
+  context = SparkRuntimeContext(gatewayPort, driver = False)
+  context._runtimeArguments = { "argument" : "value" }
+  context._logicalStartTime = 1500000000000
+  return pickle.dumps(context, pickle.HIGHEST_PROTOCOL)
+
+class SparkRuntimeContextRegistryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cwd = os.getcwd()
+    self.workDir = tempfile.mkdtemp()
+    os.chdir(self.workDir)
+    self.environ = os.environ.pop("PYSPARK_GATEWAY_PORT", None)
+    newProcess()
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.workDir)
+    if self.environ is not None:
+      os.environ["PYSPARK_GATEWAY_PORT"] = self.environ
+    newProcess()
+
+  def testDistributed(self):
+    # The driver pickles the port of its own gateway, while the executor uses the one in the port file
+    data = pickledContext(5000)
+    newProcess()
+    writePortFile(6000)
+
+    context = pickle.loads(data)
+    self.assertTrue(context is pickle.loads(data))
+    self.assertTrue(context is SparkRuntimeContext.forExecutor())
+    self.assertEqual(6000, context._gatewayPort)
+    self.assertEqual({ "argument" : "value" }, context._runtimeArguments)
+    self.assertEqual(1500000000000, context._logicalStartTime)
+    self.assertEqual([6000], list(SparkRuntimeContext._registry))
+
+  def testExecutorFirst(self):
+    data = pickledContext(5000)
+    newProcess()
+    writePortFile(6000)
+
+    context = SparkRuntimeContext.forExecutor()
+    self.assertTrue(context is pickle.loads(data))
+    # The state of the first unpickled closure fills in what the executor instance doesn't have
+    self.assertEqual({ "argument" : "value" }, context._runtimeArguments)
+
+  def testLocal(self):
+    data = pickledContext(5000)
+    newProcess()
+    os.environ["PYSPARK_GATEWAY_PORT"] = "5000"
+    try:
+      context = pickle.loads(data)
+      self.assertTrue(context is SparkRuntimeContext.forExecutor())
+      self.assertEqual(5000, context._gatewayPort)
+    finally:
+      del os.environ["PYSPARK_GATEWAY_PORT"]
+
+  def testPortFileReadOnce(self):
+    writePortFile(6000)
+    self.assertEqual(6000, SparkRuntimeContext.resolveGatewayPort(5000))
+    writePortFile(7000)
+    self.assertEqual(6000, SparkRuntimeContext.resolveGatewayPort())
+
+  def testNoPort(self):
+    self.assertRaises(Exception, SparkRuntimeContext.resolveGatewayPort)
+
+if __name__ == "__main__":
+  unittest.main()
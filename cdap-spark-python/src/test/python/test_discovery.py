@@ -0,0 +1,351 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the service discovery in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+try:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+except ImportError:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.context import ServiceDiscoverer
+from cdap.pyspark.discovery import ServiceClient, ServiceURLCache
+
+class StandInURL(object):
+
+  def __init__(self, url):
+    self._url = url
+
+  def toString(self):
+    return self._url
+
+class StandInJavaContext(object):
+  """
+    Stand-in for the Java `SparkRuntimeContext`, which records the service lookups.
+  """
+
+  def __init__(self, services = None):
+    self.services = dict(services or {})
+    self.lookups = []
+
+  def getServiceURL(self, *args):
+    # Either (serviceId) for the current application, or (appId, serviceId)
+    self.lookups.append(args)
+    url = self.services.get(args)
+    return None if url is None else StandInURL(url)
+
+class StandInRuntimeContext(object):
+  """
+    The part of the Python `SparkRuntimeContext` used by :class:`ServiceDiscoverer`.
+  """
+
+  def __init__(self, javaContext):
+    self._javaContext = javaContext
+    self._serviceURLCache = ServiceURLCache()
+
+  def getSparkRuntimeContext(self):
+    return self._javaContext
+
+  def getServiceURLCache(self):
+    return self._serviceURLCache
+
+class StubHandler(BaseHTTPRequestHandler):
+  """
+    Responds with the method and path of the request. Requests to the `/drop` path close the connection
+    without responding as many times as the server `drops` count. Connections are closed after responding
+    without telling the client if the server `closeAfterResponse` is set.
+  """
+
+  protocol_version = "HTTP/1.1"
+
+  def do_GET(self):
+    self._respond()
+
+  def do_POST(self):
+    self._respond()
+
+  def _respond(self):
+    body = self.rfile.read(int(self.headers.get("content-length", 0)))
+    server = self.server
+    with server.lock:
+      server.requests.append((self.command, self.path, body, self.client_address))
+      drop = self.path.endswith("/drop") and server.drops > 0
+      if drop:
+        server.drops -= 1
+    if drop:
+      self.close_connection = True
+      return
+
+    payload = ("%s %s" % (self.command, self.path)).encode("utf-8")
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+    self.close_connection = server.closeAfterResponse
+
+  def log_message(self, *args):
+    pass
+
+class StubServer(ThreadingMixIn, HTTPServer):
+
+  daemon_threads = True
+
+  def __init__(self):
+    HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+    self.lock = threading.Lock()
+    self.requests = []
+    self.drops = 0
+    self.closeAfterResponse = False
+    thread = threading.Thread(target = self.serve_forever, args = (0.05,))
+    thread.daemon = True
+    thread.start()
+
+  def url(self):
+    return "http://127.0.0.1:%d/v3/namespaces/default/apps/app/services/service/methods" % self.server_address[1]
+
+def unusedURL():
+  sock = socket.socket()
+  sock.bind(("127.0.0.1", 0))
+  port = sock.getsockname()[1]
+  sock.close()
+  return "http://127.0.0.1:%d/service" % port
+
+class Loader(object):
+
+  def __init__(self, url):
+    self.url = url
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    return self.url
+
+class ServiceURLCacheTest(unittest.TestCase):
+
+  def testHit(self):
+    cache = ServiceURLCache()
+    loader = Loader("http://host:1000/service")
+    self.assertEqual(loader.url, cache.get("service", 60, 5, loader))
+    self.assertEqual(loader.url, cache.get("service", 60, 5, loader))
+    self.assertEqual(1, loader.calls)
+    self.assertEqual(1, cache.hits)
+    self.assertEqual(1, cache.misses)
+
+  def testExpiry(self):
+    cache = ServiceURLCache()
+    loader = Loader("http://host:1000/service")
+    cache.get("service", 0.05, 5, loader)
+    time.sleep(0.1)
+    cache.get("service", 0.05, 5, loader)
+    self.assertEqual(2, loader.calls)
+
+    # The expiry is decided by the caller
+    self.assertEqual(loader.url, cache.get("service", 60, 5, loader))
+    self.assertEqual(2, loader.calls)
+
+  def testNegativeResult(self):
+    cache = ServiceURLCache()
+    loader = Loader(None)
+    self.assertIsNone(cache.get("service", 60, 0.05, loader))
+    self.assertIsNone(cache.get("service", 60, 0.05, loader))
+    self.assertEqual(1, loader.calls)
+
+    # A missing service expires based on the negative TTL
+    time.sleep(0.1)
+    loader.url = "http://host:1000/service"
+    self.assertEqual(loader.url, cache.get("service", 60, 0.05, loader))
+    self.assertEqual(2, loader.calls)
+
+  def testInvalidate(self):
+    cache = ServiceURLCache()
+    first = Loader("http://host:1000/first")
+    second = Loader("http://host:1000/second")
+    cache.get("first", 60, 5, first)
+    cache.get("second", 60, 5, second)
+
+    cache.invalidate("first")
+    cache.get("first", 60, 5, first)
+    cache.get("second", 60, 5, second)
+    self.assertEqual((2, 1), (first.calls, second.calls))
+
+    cache.invalidate()
+    cache.get("first", 60, 5, first)
+    cache.get("second", 60, 5, second)
+    self.assertEqual((3, 2), (first.calls, second.calls))
+
+class ServiceDiscovererTest(unittest.TestCase):
+
+  def testDiscover(self):
+    javaContext = StandInJavaContext({
+      ("service",) : "http://host:1000/current",
+      ("app", "service") : "http://host:1000/app"
+    })
+    discoverer = ServiceDiscoverer(StandInRuntimeContext(javaContext))
+
+    # Without an application, the service is discovered from the application of the program
+    self.assertEqual("http://host:1000/current", discoverer.getServiceURL("service"))
+    self.assertEqual("http://host:1000/app", discoverer.getServiceURL("service", "app"))
+    self.assertEqual([("service",), ("app", "service")], javaContext.lookups)
+    self.assertTrue(isinstance(discoverer.getServiceURL("service"), str))
+
+  def testCache(self):
+    javaContext = StandInJavaContext({ ("service",) : "http://host:1000/service" })
+    runtimeContext = StandInRuntimeContext(javaContext)
+    discoverer = ServiceDiscoverer(runtimeContext)
+    discoverer.getServiceURL("service")
+    discoverer.getServiceURL("service")
+    self.assertEqual(1, len(javaContext.lookups))
+
+    # Discoverers of the same process share the cache
+    ServiceDiscoverer(runtimeContext).getServiceURL("service")
+    self.assertEqual(1, len(javaContext.lookups))
+
+    discoverer.invalidate("service")
+    discoverer.getServiceURL("service")
+    self.assertEqual(2, len(javaContext.lookups))
+
+    # The current application and an application with the same name are cached separately
+    discoverer.getServiceURL("service", "service")
+    self.assertEqual(3, len(javaContext.lookups))
+
+  def testExpiry(self):
+    javaContext = StandInJavaContext({ ("service",) : "http://host:1000/service" })
+    discoverer = ServiceDiscoverer(StandInRuntimeContext(javaContext), cacheTTL = 0.05)
+    discoverer.getServiceURL("service")
+    time.sleep(0.1)
+    javaContext.services[("service",)] = "http://host:2000/service"
+    self.assertEqual("http://host:2000/service", discoverer.getServiceURL("service"))
+    self.assertEqual(2, len(javaContext.lookups))
+
+  def testMissingService(self):
+    javaContext = StandInJavaContext()
+    discoverer = ServiceDiscoverer(StandInRuntimeContext(javaContext), negativeCacheTTL = 0.05)
+    self.assertIsNone(discoverer.getServiceURL("service"))
+    self.assertIsNone(discoverer.getServiceURL("service"))
+    self.assertEqual(1, len(javaContext.lookups))
+
+    # The service is found once it is started and the negative result expired
+    javaContext.services[("service",)] = "http://host:1000/service"
+    time.sleep(0.1)
+    self.assertEqual("http://host:1000/service", discoverer.getServiceURL("service"))
+
+class ServiceClientTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = StubServer()
+    self.javaContext = StandInJavaContext({ ("service",) : self.server.url() })
+    self.discoverer = ServiceDiscoverer(StandInRuntimeContext(self.javaContext))
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def testRequest(self):
+    client = self.discoverer.getClient("service")
+    response = client.post("/ping", "data")
+    self.assertEqual(200, response.status)
+    self.assertEqual(b"POST /v3/namespaces/default/apps/app/services/service/methods/ping", response.body)
+    self.assertEqual(b"data", self.server.requests[0][2])
+    client.close()
+
+  def testKeepAlive(self):
+    client = self.discoverer.getClient("service")
+    for _ in range(3):
+      self.assertEqual(200, client.get("ping").status)
+
+    # All requests are sent over the same connection
+    self.assertEqual(1, len(set(request[3] for request in self.server.requests)))
+    client.close()
+
+  def testClosedByService(self):
+    client = self.discoverer.getClient("service")
+    self.server.closeAfterResponse = True
+    client.get("ping")
+    time.sleep(0.1)
+
+    # The idle connection closed by the service is not reused, hence even a POST succeeds without retrying
+    self.server.closeAfterResponse = False
+    self.assertEqual(200, client.post("ping", "data").status)
+    self.assertEqual(2, len(self.server.requests))
+    self.assertEqual(2, len(set(request[3] for request in self.server.requests)))
+    self.assertEqual(1, len(self.javaContext.lookups))
+    client.close()
+
+  def testRetry(self):
+    client = self.discoverer.getClient("service")
+    client.get("ping")
+
+    # The connection is closed after the request is sent, and an idempotent request is retried
+    self.server.drops = 1
+    self.assertEqual(200, client.get("drop").status)
+    self.assertEqual(3, len(self.server.requests))
+    self.assertEqual(2, len(self.javaContext.lookups))
+
+    # Other requests are not retried, since the service may have processed them
+    self.server.drops = 1
+    self.assertRaises(Exception, client.post, "drop", "data")
+    self.assertEqual(4, len(self.server.requests))
+    self.assertEqual(200, client.post("drop", "data").status)
+    client.close()
+
+  def testServiceMoved(self):
+    # The cached URL is of a service that is not running anymore
+    self.javaContext.services[("service",)] = unusedURL()
+    self.discoverer.getServiceURL("service")
+    self.javaContext.services[("service",)] = self.server.url()
+
+    # Connecting fails, so the service is discovered again, whatever the method is
+    client = self.discoverer.getClient("service")
+    self.assertEqual(200, client.post("ping", "data").status)
+    self.assertEqual(2, len(self.javaContext.lookups))
+    self.assertEqual(self.server.url(), self.discoverer.getServiceURL("service"))
+    client.close()
+
+  def testRequestAll(self):
+    client = self.discoverer.getClient("service", maxConnections = 2)
+    responses = client.requestAll([("GET", "item/%d" % i) for i in range(10)] + [("POST", "items", "data", {})])
+    self.assertEqual(11, len(responses))
+    for i in range(10):
+      self.assertTrue(responses[i].body.startswith(b"GET "))
+      self.assertTrue(responses[i].body.endswith(("/item/%d" % i).encode("utf-8")))
+    self.assertTrue(responses[10].body.startswith(b"POST "))
+
+    # Requests are sent over at most two connections
+    self.assertTrue(len(set(request[3] for request in self.server.requests)) <= 2)
+
+    # Failures are returned in place of the response
+    missing = self.discoverer.getClient("missing", "app")
+    self.assertTrue(isinstance(missing.requestAll([("GET", "ping")])[0], IOError))
+    client.close()
+
+if __name__ == "__main__":
+  unittest.main()
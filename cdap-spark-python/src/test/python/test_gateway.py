@@ -0,0 +1,168 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the gateway connection pool in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import collections
+import gc
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.gateway import GatewayConnectionPool
+
+class StandInConnection(object):
+  """
+    A connection with the attributes of a py4j `GatewayConnection`, backed by a socket pair.
+  """
+
+  def __init__(self):
+    self.socket, self.peer = socket.socketpair()
+    self.is_connected = True
+
+  def close(self):
+    self.is_connected = False
+    self.socket.close()
+    self.peer.close()
+
+class StandInClient(object):
+  """
+    The connection handling of a py4j `GatewayClient`.
+  """
+
+  def __init__(self):
+    self.deque = collections.deque()
+    self.created = []
+
+  def _create_connection(self):
+    connection = StandInConnection()
+    self.created.append(connection)
+    return connection
+
+  def _get_connection(self):
+    try:
+      return self.deque.pop()
+    except IndexError:
+      return self._create_connection()
+
+  def _give_back_connection(self, connection):
+    self.deque.appendleft(connection)
+
+  def call(self):
+    connection = self._get_connection()
+    self._give_back_connection(connection)
+    return connection
+
+def waitForUnbind(pool, timeout = 5):
+  # Thread locals are cleared after `join` returns, when the interpreter deletes the thread state
+  deadline = time.time() + timeout
+  while pool._bound > 0 and time.time() < deadline:
+    gc.collect()
+    time.sleep(0.01)
+
+class GatewayConnectionPoolTest(unittest.TestCase):
+
+  def testPrestart(self):
+    client = StandInClient()
+    client._give_back_connection(client._create_connection())
+    GatewayConnectionPool(client, 3).prestart()
+    self.assertEqual(3, len(client.deque))
+    self.assertEqual(3, len(set(client.deque)))
+
+  def testClosedByServer(self):
+    client = StandInClient()
+    pool = GatewayConnectionPool(client, 2)
+    pool.prestart()
+    stale = client.deque[-1]
+    stale.peer.close()
+
+    connection = client.call()
+    self.assertNotEqual(stale, connection)
+    self.assertFalse(stale.is_connected)
+    self.assertTrue(connection.is_connected)
+
+  def testSizeBound(self):
+    client = StandInClient()
+    pool = GatewayConnectionPool(client, 2)
+    connections = [client._get_connection() for _ in range(4)]
+    for connection in connections:
+      client._give_back_connection(connection)
+    self.assertEqual(2, len(client.deque))
+    self.assertEqual(2, len([c for c in connections if not c.is_connected]))
+
+  def testThreadAffinity(self):
+    client = StandInClient()
+    pool = GatewayConnectionPool(client, 2, threadAffinity = True)
+    pool.prestart()
+
+    used = []
+    def run():
+      used.append(client.call())
+      used.append(client.call())
+
+    # A thread keeps using the same connection
+    thread = threading.Thread(target = run)
+    thread.start()
+    thread.join()
+    waitForUnbind(pool)
+    self.assertEqual(used[0], used[1])
+
+    # The connection is returned to the pool when the thread exits
+    self.assertEqual(0, pool._bound)
+    self.assertEqual(2, len(client.deque))
+    self.assertTrue(used[0] in client.deque)
+
+  def testThreadAffinityBound(self):
+    client = StandInClient()
+    pool = GatewayConnectionPool(client, 2, threadAffinity = True)
+    pool.prestart()
+
+    barrier = threading.Semaphore(0)
+    release = threading.Event()
+    def run():
+      client.call()
+      barrier.release()
+      release.wait()
+
+    threads = [threading.Thread(target = run) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for _ in threads:
+      barrier.acquire()
+
+    # Connections beyond the pool size are neither bound nor kept
+    self.assertTrue(pool._bound + len(client.deque) <= 2)
+    release.set()
+    for thread in threads:
+      thread.join()
+    waitForUnbind(pool)
+    self.assertEqual(0, pool._bound)
+    self.assertTrue(len(client.deque) <= 2)
+    self.assertEqual(len(client.created) - len(client.deque),
+                     len([c for c in client.created if not c.is_connected]))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,161 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the location streams in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import errno
+import os
+import socket
+import struct
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.location import LocationReader, LocationWriter
+
+class StandInLocationStream(object):
+  """
+    Stand-in for the Java `PythonLocationStream`, serving one connection with the same protocol.
+  """
+
+  def __init__(self, handler):
+    self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self._server.bind(("localhost", 0))
+    self._server.listen(1)
+    self._handler = handler
+    self.bytes = 0
+    self.failure = None
+    self._thread = threading.Thread(target = self._serve)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def getPort(self):
+    return self._server.getsockname()[1]
+
+  def getSecret(self):
+    return "secret"
+
+  def await(self, timeoutMillis):
+    self._thread.join(5)
+    if self._thread.is_alive():
+      raise IOError("Location transfer did not complete")
+    if self.failure is not None:
+      raise self.failure
+    return self.bytes
+
+  def _serve(self):
+    connection, _ = self._server.accept()
+    self._server.close()
+    try:
+      connection.settimeout(5)
+      received = b""
+      while not received.endswith(b"\n"):
+        received += connection.recv(1)
+      self._handler(self, connection)
+    except Exception as e:
+      self.failure = e
+    finally:
+      connection.close()
+
+def reading(content, failure = None):
+  def handle(stream, connection):
+    try:
+      connection.sendall(struct.pack(">q", len(content)))
+      connection.sendall(content)
+      stream.bytes = len(content)
+    except socket.error:
+      # The client closed the connection before reading all the content
+      stream.bytes = -1
+    if failure is not None:
+      raise failure
+  return handle
+
+def writing(sink):
+  def handle(stream, connection):
+    while True:
+      chunk = connection.recv(65536)
+      if not chunk:
+        break
+      sink.append(chunk)
+    stream.bytes = sum(len(chunk) for chunk in sink)
+  return handle
+
+class LocationReaderTest(unittest.TestCase):
+
+  def testRead(self):
+    content = os.urandom(100000)
+    with LocationReader(StandInLocationStream(reading(content)), bufferSize = 4096) as reader:
+      chunks = list(reader)
+
+    self.assertEqual(content, b"".join(chunks))
+    self.assertEqual(4096, len(chunks[0]))
+
+  def testPartialRead(self):
+    stream = StandInLocationStream(reading(b"x" * (16 * 1024 * 1024)))
+    reader = LocationReader(stream, bufferSize = 4096)
+    self.assertEqual(b"x" * 10, reader.read(10))
+    reader.close()
+
+    # The transfer completed without an error, since the client stopped reading
+    self.assertEqual(-1, stream.bytes)
+    reader.close()
+
+  def testFailureReportedOnClose(self):
+    reader = LocationReader(StandInLocationStream(reading(b"content", IOError("Failed to close"))))
+    self.assertEqual(b"content", reader.read())
+    self.assertRaises(IOError, reader.close)
+
+  def testFailureInWithBlock(self):
+    stream = StandInLocationStream(reading(b"content", IOError("Failed to close")))
+    with self.assertRaises(ValueError):
+      with LocationReader(stream):
+        raise ValueError("Failed to parse")
+
+class LocationWriterTest(unittest.TestCase):
+
+  def testWrite(self):
+    sink = []
+    writer = LocationWriter(StandInLocationStream(writing(sink)), bufferSize = 1024)
+    writer.write(b"a" * 100)
+    writer.write(b"b" * 5000)
+    writer.write(b"c" * 100)
+    writer.close()
+
+    self.assertEqual(b"a" * 100 + b"b" * 5000 + b"c" * 100, b"".join(sink))
+    self.assertEqual(5200, writer.bytesWritten)
+
+  def testAbort(self):
+    sink = []
+    stream = StandInLocationStream(writing(sink))
+    writer = LocationWriter(stream, bufferSize = 1024)
+    writer.write(b"a" * 5000)
+    writer.write(b"b" * 100)
+    writer.abort()
+
+    # The connection is reset instead of being closed normally, hence the content is not taken as complete
+    with self.assertRaises(socket.error) as context:
+      stream.await(5000)
+    self.assertEqual(errno.ECONNRESET, context.exception.errno)
+
+if __name__ == "__main__":
+  unittest.main()
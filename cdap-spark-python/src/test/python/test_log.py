@@ -0,0 +1,258 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the logging handler and the log sampler in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import json
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.log import CDAPLogHandler, LogSampler, flushHandlers
+
+class StandInPythonUtil(object):
+  """
+    Stand-in for the Java `SparkPythonUtil`, which records the batches of log records sent to it.
+  """
+
+  def __init__(self, logger = None):
+    self.batches = []
+    self.failures = 0
+    self._logger = logger
+
+  def log(self, javaContext, batch):
+    if self._logger is not None:
+      # py4j logs debug records while it talks to the JVM
+      self._logger.debug("Sending command")
+    if self.failures > 0:
+      self.failures -= 1
+      raise IOError("Gateway is down")
+    self.batches.append(json.loads(batch))
+
+class StandInRuntimeContext(object):
+  """
+    The part of the Python `SparkRuntimeContext` used by :class:`CDAPLogHandler`.
+  """
+
+  def __init__(self, arguments = None, logger = None):
+    self.pythonUtil = StandInPythonUtil(logger)
+    self._arguments = arguments or {}
+    self._logger = logger
+
+  def getRuntimeArguments(self):
+    if self._logger is not None:
+      self._logger.debug("Fetching runtime arguments")
+    return self._arguments
+
+  def getPythonUtil(self):
+    return self.pythonUtil
+
+  def getSparkRuntimeContext(self):
+    return None
+
+  def messages(self):
+    return [entry["message"] for batch in self.pythonUtil.batches for entry in batch]
+
+def newLogger(name, handler):
+  logger = logging.getLogger(name)
+  logger.propagate = False
+  logger.setLevel(logging.DEBUG)
+  for existing in list(logger.handlers):
+    logger.removeHandler(existing)
+  logger.addHandler(handler)
+  return logger
+
+class CDAPLogHandlerTest(unittest.TestCase):
+
+  def newHandler(self, runtimeContext, **kwargs):
+    # Nothing is shipped in the background, so that the tests decide when records are sent
+    handler = CDAPLogHandler(runtimeContext = runtimeContext, flushInterval = 60, sampler = LogSampler(), **kwargs)
+    self.addCleanup(handler.close)
+    return handler
+
+  def testBatches(self):
+    runtimeContext = StandInRuntimeContext()
+    handler = self.newHandler(runtimeContext, batchSize = 100)
+    logger = newLogger("test.batches", handler)
+    for i in range(250):
+      logger.info("Record %d", i)
+    handler.flush()
+
+    self.assertEqual(["Record %d" % i for i in range(250)], runtimeContext.messages())
+    self.assertEqual(250, handler.shipped)
+    self.assertTrue(all(len(batch) <= 100 for batch in runtimeContext.pythonUtil.batches))
+    entry = runtimeContext.pythonUtil.batches[0][0]
+    self.assertEqual("test.batches", entry["logger"])
+    self.assertEqual(logging.INFO, entry["level"])
+
+  def testDropOldest(self):
+    runtimeContext = StandInRuntimeContext()
+    handler = self.newHandler(runtimeContext, capacity = 10, batchSize = 100)
+    logger = newLogger("test.dropOldest", handler)
+    for i in range(15):
+      logger.info("Record %d", i)
+    handler.flush()
+
+    self.assertEqual(["Record %d" % i for i in range(5, 15)], runtimeContext.messages())
+    self.assertEqual(5, handler.dropped)
+
+  def testDropNewest(self):
+    runtimeContext = StandInRuntimeContext()
+    handler = self.newHandler(runtimeContext, capacity = 10, batchSize = 100,
+                              overflowPolicy = CDAPLogHandler.DROP_NEWEST)
+    logger = newLogger("test.dropNewest", handler)
+    for i in range(15):
+      logger.info("Record %d", i)
+    handler.flush()
+
+    self.assertEqual(["Record %d" % i for i in range(10)], runtimeContext.messages())
+    self.assertEqual(5, handler.dropped)
+
+  def testUnsupportedOverflowPolicy(self):
+    self.assertRaises(ValueError, CDAPLogHandler, overflowPolicy = "block")
+
+  def testFailure(self):
+    runtimeContext = StandInRuntimeContext()
+    runtimeContext.pythonUtil.failures = 1
+    handler = self.newHandler(runtimeContext)
+    logger = newLogger("test.failure", handler)
+    logger.info("Lost")
+    handler.flush()
+    logger.info("Shipped")
+    handler.flush()
+
+    self.assertEqual(1, handler.failed)
+    self.assertEqual(["Shipped"], runtimeContext.messages())
+
+  def testGatewayLogging(self):
+    # The stand-in logs through the logger of the handler whenever the handler calls it
+    logger = logging.getLogger("test.gateway")
+    runtimeContext = StandInRuntimeContext({ LogSampler.SAMPLE_RATE : "1" }, logger)
+    handler = CDAPLogHandler(runtimeContext = runtimeContext, flushInterval = 60)
+    self.addCleanup(handler.close)
+    newLogger("test.gateway", handler)
+
+    logger.info("First")
+    handler.flush()
+    logger.info("Second")
+    handler.flush()
+
+    self.assertEqual(["First", "Second"], runtimeContext.messages())
+    self.assertEqual(0, handler.dropped)
+
+  def testWrap(self):
+    runtimeContext = StandInRuntimeContext()
+    handler = self.newHandler(runtimeContext)
+    logger = newLogger("test.wrap", handler)
+
+    def process(iterator):
+      for element in iterator:
+        logger.info("Element %d", element)
+        yield element
+
+    self.assertEqual([1, 2, 3], list(handler.wrap(process(iter([1, 2, 3])))))
+    self.assertEqual(["Element 1", "Element 2", "Element 3"], runtimeContext.messages())
+
+  def testFlushHandlers(self):
+    runtimeContext = StandInRuntimeContext()
+    handler = self.newHandler(runtimeContext)
+    logger = newLogger("test.flushHandlers", handler)
+    logger.info("Buffered")
+    flushHandlers()
+
+    self.assertEqual(["Buffered"], runtimeContext.messages())
+
+def newRecord(name, msg, level = logging.INFO, *args):
+  return logging.makeLogRecord({ "name" : name, "levelno" : level, "levelname" : logging.getLevelName(level),
+                                 "msg" : msg, "args" : args })
+
+class LogSamplerTest(unittest.TestCase):
+
+  def testSampleRate(self):
+    sampler = LogSampler(sampleRate = 3)
+    emitted = [len(sampler.filter(newRecord("test", "Record %d", logging.INFO, i))) for i in range(9)]
+
+    self.assertEqual([1, 0, 0] * 3, emitted)
+    self.assertEqual(6, sampler.suppressed)
+
+  def testErrorsAreNotSampled(self):
+    sampler = LogSampler(sampleRate = 10, rateLimit = 1)
+    emitted = [len(sampler.filter(newRecord("test", "Failure %d", logging.ERROR, i))) for i in range(5)]
+
+    self.assertEqual([1] * 5, emitted)
+    self.assertEqual(0, sampler.suppressed)
+
+  def testRateLimit(self):
+    sampler = LogSampler(rateLimit = 5)
+    emitted = sum(len(sampler.filter(newRecord("test", "Record %d", logging.INFO, i))) for i in range(20))
+
+    # The bucket starts full and refills at five tokens per second, which is negligible within the loop
+    self.assertEqual(5, emitted)
+    self.assertEqual(15, sampler.suppressed)
+
+  def testRateLimitRefill(self):
+    sampler = LogSampler(rateLimit = 1)
+    self.assertEqual(1, len(sampler.filter(newRecord("test", "First"))))
+    self.assertEqual(0, len(sampler.filter(newRecord("test", "Second"))))
+
+    # Let a second pass without sleeping
+    state = sampler._states["test"]
+    state._lastRefill -= 1
+    self.assertEqual(1, len(sampler.filter(newRecord("test", "Third"))))
+
+  def testDedup(self):
+    sampler = LogSampler(dedup = True)
+    for _ in range(4):
+      sampler.filter(newRecord("test", "Same"))
+    result = sampler.filter(newRecord("test", "Different"))
+
+    self.assertEqual(2, len(result))
+    self.assertEqual("Previous message repeated 3 times: Same", result[0].getMessage())
+    self.assertEqual("Different", result[1].getMessage())
+    self.assertEqual(3, sampler.suppressed)
+
+  def testDedupSummaries(self):
+    sampler = LogSampler(dedup = True)
+    for _ in range(3):
+      sampler.filter(newRecord("test", "Same"))
+
+    summaries = sampler.summaries()
+    self.assertEqual(["Previous message repeated 2 times: Same"], [r.getMessage() for r in summaries])
+    # Reported only once
+    self.assertEqual([], sampler.summaries())
+
+  def testPerLoggerSettings(self):
+    sampler = LogSampler.fromArguments({
+      LogSampler.SAMPLE_RATE : "2",
+      LogSampler.SAMPLE_RATE + ".noisy" : "4",
+      LogSampler.DEDUP_ENABLED : "true"
+    })
+    noisy = sum(len(sampler.filter(newRecord("noisy", "Record %d", logging.INFO, i))) for i in range(8))
+    other = sum(len(sampler.filter(newRecord("other", "Record %d", logging.INFO, i))) for i in range(8))
+
+    self.assertEqual(2, noisy)
+    self.assertEqual(4, other)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,152 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the Dataset lookups in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import os
+import pickle
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.lookup import DatasetLookup, LookupTable
+
+class StandInBroadcast(object):
+  """
+    Stand-in for the PySpark `Broadcast`, which holds a pickled copy of the value like an executor does.
+  """
+
+  def __init__(self, value):
+    self._pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+  @property
+  def value(self):
+    return pickle.loads(self._pickled)
+
+class StandInSparkContext(object):
+
+  def broadcast(self, value):
+    return StandInBroadcast(value)
+
+class StandInRDD(object):
+  """
+    Stand-in for the PySpark `RDD`, evaluated eagerly in a single partition.
+  """
+
+  def __init__(self, items):
+    self.items = list(items)
+    self.context = StandInSparkContext()
+
+  def map(self, func):
+    return StandInRDD(func(item) for item in self.items)
+
+  def mapPartitions(self, func, preservesPartitioning = False):
+    return StandInRDD(func(iter(self.items)))
+
+  def leftOuterJoin(self, other):
+    values = {}
+    for key, value in other.items:
+      values.setdefault(key, []).append(value)
+    return StandInRDD((key, (record, value)) for key, record in self.items for value in values.get(key, [None]))
+
+  def toLocalIterator(self):
+    return iter(self.items)
+
+  def collect(self):
+    return list(self.items)
+
+class StandInDataFrame(object):
+  """
+    Stand-in for the PySpark `DataFrame` of a key/value Dataset.
+  """
+
+  def __init__(self, rows):
+    self.rdd = StandInRDD(rows)
+
+  def select(self, *columns):
+    return self
+
+ROWS = [(b"a", b"1"), (u"café", u"crème"), (bytearray(b"b"), b"2")]
+
+class LookupTableTest(unittest.TestCase):
+
+  def testGet(self):
+    table = LookupTable(ROWS)
+
+    self.assertEqual(3, len(table))
+    self.assertEqual(b"1", table.get(b"a"))
+    self.assertEqual(u"crème".encode("utf-8"), table.get(u"café"))
+    self.assertEqual(u"crème".encode("utf-8"), table.get(u"café".encode("utf-8")))
+    self.assertEqual(b"2", table.get(bytearray(b"b")))
+    self.assertEqual(None, table.get(b"missing"))
+    self.assertEqual(b"", table.get(b"missing", b""))
+    self.assertTrue(u"café" in table)
+    self.assertFalse(b"missing" in table)
+
+  def testDuplicates(self):
+    table = LookupTable([(b"a", b"1"), (b"a", b"2")])
+    self.assertEqual(1, len(table))
+    self.assertEqual(b"2", table.get(b"a"))
+
+  def testEmpty(self):
+    table = LookupTable([])
+    self.assertEqual(0, len(table))
+    self.assertEqual(None, table.get(b"a"))
+
+  def testPickle(self):
+    entries = [(str(i).encode("utf-8"), (u"value %d" % i).encode("utf-8")) for i in range(1000)]
+    table = pickle.loads(pickle.dumps(LookupTable(entries), pickle.HIGHEST_PROTOCOL))
+
+    self.assertEqual(1000, len(table))
+    for key, value in entries:
+      self.assertEqual(value, table.get(key))
+
+class DatasetLookupTest(unittest.TestCase):
+
+  def testBroadcast(self):
+    lookup = DatasetLookup.load(StandInDataFrame(ROWS))
+
+    self.assertTrue(lookup.isBroadcast())
+    self.assertEqual(b"1", lookup.get(b"a"))
+    self.assertEqual(u"crème".encode("utf-8"), lookup.get(u"café"))
+    # Only the broadcast is pickled for closures
+    self.assertEqual(b"2", pickle.loads(pickle.dumps(lookup)).get(b"b"))
+
+  def testTooBig(self):
+    lookup = DatasetLookup.load(StandInDataFrame(ROWS), maxBroadcastBytes = 50)
+
+    self.assertFalse(lookup.isBroadcast())
+    self.assertRaises(RuntimeError, lookup.get, b"a")
+    self.assertRaises(RuntimeError, pickle.loads(pickle.dumps(lookup)).join, StandInRDD([]))
+
+  def testJoin(self):
+    records = [(b"a", 1), (u"café", 2), (bytearray(b"b"), 3), (u"missing", 4)]
+    expected = [(b"a", (1, b"1")), (u"café".encode("utf-8"), (2, u"crème".encode("utf-8"))),
+                (b"b", (3, b"2")), (b"missing", (4, None))]
+
+    # The broadcast and the partitioned join give the same result, including for unicode keys
+    for maxBroadcastBytes in (1024, 50):
+      lookup = DatasetLookup.load(StandInDataFrame(ROWS), maxBroadcastBytes = maxBroadcastBytes)
+      self.assertEqual(expected, lookup.join(StandInRDD(records)).collect())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,201 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the metrics buffering in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import os
+import pickle
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.metrics import MetricsBuffer, PartitionCounter, Timer
+
+class RecordingPublisher(object):
+
+  def __init__(self):
+    self.published = []
+    self.failures = 0
+    self.delay = 0
+
+  def __call__(self, counters, gauges):
+    if self.failures > 0:
+      self.failures -= 1
+      raise RuntimeError("Gateway is down")
+    if self.delay:
+      time.sleep(self.delay)
+    self.published.append((dict(counters), dict(gauges)))
+
+class BufferedMetrics(object):
+  """
+    The part of the `Metrics` interface used by :class:`PartitionCounter`, on top of a :class:`MetricsBuffer`.
+  """
+
+  def __init__(self, buffer):
+    self._buffer = buffer
+
+  def count(self, name, delta):
+    self._buffer.count(name, delta)
+
+  def flush(self):
+    self._buffer.flush()
+
+class MetricsBufferTest(unittest.TestCase):
+
+  def testAggregation(self):
+    publisher = RecordingPublisher()
+    buffer = MetricsBuffer(publisher, maxSize = 1000, flushInterval = 60)
+    buffer.count("records", 2)
+    buffer.count("records", 3)
+    buffer.gauge("size", 1)
+    buffer.gauge("size", 7)
+    self.assertEqual([], publisher.published)
+
+    self.assertTrue(buffer.flush())
+    self.assertEqual([({ "records" : 5 }, { "size" : 7 })], publisher.published)
+
+    # Nothing left to publish
+    buffer.flush()
+    self.assertEqual(1, len(publisher.published))
+    buffer.close()
+
+  def testSizeThreshold(self):
+    publisher = RecordingPublisher()
+    buffer = MetricsBuffer(publisher, maxSize = 3, flushInterval = 60)
+    buffer.count("records", 1)
+    buffer.count("records", 1)
+    self.assertEqual([], publisher.published)
+    buffer.count("records", 1)
+    self.assertEqual([({ "records" : 3 }, {})], publisher.published)
+    buffer.close()
+
+  def testPublishFailure(self):
+    publisher = RecordingPublisher()
+    publisher.failures = 1
+    buffer = MetricsBuffer(publisher, maxSize = 2, flushInterval = 60)
+
+    # The failure is not raised to the recording code and the metrics are kept
+    buffer.count("records", 1)
+    buffer.gauge("size", 1)
+    self.assertEqual([], publisher.published)
+
+    # Newer gauge values win over the ones that failed to publish
+    buffer.gauge("size", 2)
+    self.assertTrue(buffer.flush())
+    self.assertEqual([({ "records" : 1 }, { "size" : 2 })], publisher.published)
+    buffer.close()
+
+  def testRecordingDuringPublish(self):
+    publisher = RecordingPublisher()
+    publisher.delay = 0.5
+    buffer = MetricsBuffer(publisher, maxSize = 1000, flushInterval = 60)
+    buffer.count("records", 1)
+
+    flusher = threading.Thread(target = buffer.flush)
+    flusher.start()
+    time.sleep(0.1)
+
+    # Recording is not blocked by the slow publisher
+    start = time.time()
+    buffer.count("records", 1)
+    self.assertTrue(time.time() - start < 0.25)
+
+    flusher.join()
+    buffer.flush()
+    self.assertEqual([({ "records" : 1 }, {}), ({ "records" : 1 }, {})], publisher.published)
+    buffer.close()
+
+  def testHistogram(self):
+    publisher = RecordingPublisher()
+    buffer = MetricsBuffer(publisher, maxSize = 1000, flushInterval = 60)
+    for value in range(1, 101):
+      buffer.histogram("latency", value)
+    buffer.flush()
+
+    counters, gauges = publisher.published[0]
+    self.assertEqual({ "latency.count" : 100 }, counters)
+    self.assertEqual(100, gauges["latency.max"])
+    self.assertTrue(45 <= gauges["latency.p50"] <= 55)
+    buffer.close()
+
+class PartitionCounterTest(unittest.TestCase):
+
+  def testFlushAtPartitionEnd(self):
+    publisher = RecordingPublisher()
+    buffer = MetricsBuffer(publisher, maxSize = 1000, flushInterval = 60)
+    metrics = BufferedMetrics(buffer)
+
+    self.assertEqual(range(5), list(PartitionCounter(metrics, "records").wrap(iter(range(5)))))
+    self.assertEqual([({ "records" : 5 }, {})], publisher.published)
+
+    with PartitionCounter(metrics, "records") as counter:
+      counter.increment(3)
+    self.assertEqual(({ "records" : 3 }, {}), publisher.published[-1])
+    buffer.close()
+
+class TimerTest(unittest.TestCase):
+
+  def testOverlappingThreads(self):
+    recorded = {}
+    timer = Timer(lambda name, value: recorded.setdefault(threading.current_thread().name, value), "call")
+    firstEntered = threading.Event()
+    secondEntered = threading.Event()
+    firstExited = threading.Event()
+
+    def first():
+      with timer:
+        firstEntered.set()
+        secondEntered.wait()
+      firstExited.set()
+
+    def second():
+      firstEntered.wait()
+      time.sleep(0.2)
+      with timer:
+        secondEntered.set()
+        firstExited.wait()
+
+    threads = [threading.Thread(target = first, name = "first"), threading.Thread(target = second, name = "second")]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    # The first thread exits while the second one is inside the timer, so it must not pick up the second start
+    self.assertTrue(recorded["first"] >= 200000)
+    self.assertTrue(recorded["second"] < recorded["first"])
+
+  def testPickle(self):
+    timer = pickle.loads(pickle.dumps(Timer(_record, "call")))
+    with timer:
+      pass
+    self.assertEqual("call", _recorded[-1][0])
+
+_recorded = []
+
+def _record(name, value):
+  _recorded.append((name, value))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,141 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the plugin access in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import json
+import os
+import pickle
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.plugin import PluginContext, PluginInvoker
+
+class StandInPluginInvoker(object):
+  """
+    Stand-in for the Java `PythonPluginInvoker`, which calls a Python function and records the batch sizes.
+  """
+
+  def __init__(self, method):
+    self._method = method
+    self.batches = []
+
+  def invoke(self, argumentsJson):
+    batch = json.loads(argumentsJson)
+    self.batches.append(len(batch))
+    return json.dumps([self._method(*arguments) for arguments in batch])
+
+class StandInJVM(object):
+  """
+    Stand-in for the py4j JVM view, with the plugin methods that can be invoked.
+  """
+
+  METHODS = {
+    "upper" : lambda value: value.upper(),
+    "add" : lambda a, b: a + b
+  }
+
+  def __init__(self):
+    self.invokers = []
+
+  def PythonPluginInvoker(self, sparkRuntimeContext, pluginId, methodName, arity):
+    invoker = StandInPluginInvoker(self.METHODS[methodName])
+    self.invokers.append((pluginId, methodName, arity, invoker))
+    return invoker
+
+class StandInPythonUtil(object):
+
+  def getPluginProperties(self, sparkRuntimeContext, pluginId):
+    return json.dumps({ "id" : pluginId })
+
+class StandInRuntimeContext(object):
+  """
+    The part of the Python `SparkRuntimeContext` used by :class:`PluginContext`. All copies share the same JVM,
+    like the copies unpickled in one Python process share its gateway.
+  """
+
+  jvm = StandInJVM()
+
+  def __getstate__(self):
+    return {}
+
+  def getJVM(self):
+    return self.jvm
+
+  def getPythonUtil(self):
+    return StandInPythonUtil()
+
+  def getSparkRuntimeContext(self):
+    return None
+
+class PluginInvokerTest(unittest.TestCase):
+
+  def setUp(self):
+    StandInRuntimeContext.jvm = StandInJVM()
+    PluginInvoker._instances.clear()
+
+  def invokerBatches(self):
+    return [invoker.batches for _, _, _, invoker in StandInRuntimeContext.jvm.invokers]
+
+  def testInvokeAll(self):
+    invoker = PluginContext(StandInRuntimeContext()).getInvoker("plugin", "add", 2, batchSize = 2)
+
+    self.assertEqual(3, invoker.invoke(1, 2))
+    self.assertEqual([3, 7, 11, 15, 19], invoker.invokeAll([(i, i + 1) for i in range(1, 10, 2)]))
+    self.assertEqual([], invoker.invokeAll([]))
+    # One gateway call per batch, with a single plugin instance
+    self.assertEqual([[1, 2, 2, 1]], self.invokerBatches())
+
+  def testMapPartition(self):
+    invoker = PluginContext(StandInRuntimeContext()).getInvoker("plugin", "upper", batchSize = 3)
+
+    words = [u"café", u"a", u"b", u"c", u"d"]
+    self.assertEqual([word.upper() for word in words], list(invoker.mapPartition(iter(words))))
+    self.assertEqual([], list(invoker.mapPartition(iter([]))))
+    self.assertEqual([[3, 2]], self.invokerBatches())
+
+  def testMapPartitionArguments(self):
+    invoker = PluginContext(StandInRuntimeContext()).getInvoker("plugin", "add", 2)
+    self.assertEqual([3, 5], list(invoker.mapPartition(iter([(1, 2), (2, 3)]))))
+
+  def testSharedInstance(self):
+    context = PluginContext(StandInRuntimeContext())
+    invoker = context.getInvoker("plugin", "upper")
+    invoker.invoke(u"a")
+    pickle.loads(pickle.dumps(invoker)).invoke(u"b")
+    pickle.loads(pickle.dumps(context)).getInvoker("plugin", "upper").invoke(u"c")
+
+    # Invokers of another method or plugin have their own instance
+    context.getInvoker("plugin", "add", 2).invoke(1, 2)
+    context.getInvoker("other", "upper").invoke(u"d")
+    self.assertEqual([("plugin", "upper", 1), ("plugin", "add", 2), ("other", "upper", 1)],
+                     [(pluginId, methodName, arity) for pluginId, methodName, arity, _ in
+                      StandInRuntimeContext.jvm.invokers])
+    self.assertEqual([[1, 1, 1], [1], [1]], self.invokerBatches())
+
+  def testPluginProperties(self):
+    context = PluginContext(StandInRuntimeContext())
+    self.assertEqual({ "id" : "plugin" }, context.getPluginProperties("plugin"))
+
+if __name__ == "__main__":
+  unittest.main()
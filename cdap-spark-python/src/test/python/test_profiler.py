@@ -0,0 +1,107 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the gateway profiler in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.profiler import GatewayProfiler
+
+class StandInClient(object):
+  """
+    The command sending of a py4j `GatewayClient`, which answers every command with the same response.
+  """
+
+  def send_command(self, command):
+    return "yv"
+
+class StandInRecorder(object):
+  """
+    The part of the :class:`MetricsBuffer` used by :class:`GatewayProfiler`.
+  """
+
+  def __init__(self):
+    self.counters = {}
+    self.histograms = {}
+
+  def count(self, name, delta):
+    self.counters[name] = self.counters.get(name, 0) + delta
+
+  def histogram(self, name, value):
+    self.histograms.setdefault(name, []).append(value)
+
+COMMANDS = [
+  "c\nz:co.cask.cdap.app.runtime.spark.python.SparkPythonUtil\ntoJson\nro0\ne\n",
+  "c\nz:co.cask.cdap.app.runtime.spark.python.SparkPythonUtil\ntoJson\nro1\ne\n",
+  "i\nco.cask.cdap.app.runtime.spark.python.PythonPluginInvoker\nro0\ne\n",
+  "c\no12\ninvoke\ns[]\ne\n",
+  "j\nco.cask.cdap.app.runtime.spark.python.*\ne\n"
+]
+
+class GatewayProfilerTest(unittest.TestCase):
+
+  def testMethodStats(self):
+    client = StandInClient()
+    profiler = GatewayProfiler(client)
+    for command in COMMANDS:
+      client.send_command(command)
+
+    stats = dict((s.method, s) for s in profiler.getMethodStats())
+    self.assertEqual(set(["SparkPythonUtil.toJson", "new PythonPluginInvoker", "invoke", "import"]), set(stats))
+    self.assertEqual(2, stats["SparkPythonUtil.toJson"].calls)
+    self.assertEqual(len(COMMANDS[0]) + len(COMMANDS[1]), stats["SparkPythonUtil.toJson"].bytesSent)
+    self.assertEqual(4, stats["SparkPythonUtil.toJson"].bytesReceived)
+    self.assertEqual(5, sum(s.calls for s in profiler.getCallSiteStats()))
+
+  def testMetricNames(self):
+    client = StandInClient()
+    recorder = StandInRecorder()
+    GatewayProfiler(client, recorder)
+    for command in COMMANDS:
+      client.send_command(command)
+
+    self.assertEqual({
+      "pyspark.gateway.calls" : 5,
+      "pyspark.gateway.calls.SparkPythonUtil_toJson" : 2,
+      "pyspark.gateway.calls.new_PythonPluginInvoker" : 1,
+      "pyspark.gateway.calls.invoke" : 1,
+      "pyspark.gateway.calls.import" : 1,
+      "pyspark.gateway.bytes.sent" : sum(len(command) for command in COMMANDS),
+      "pyspark.gateway.bytes.received" : 10
+    }, recorder.counters)
+    self.assertEqual(["pyspark.gateway.latency"], list(recorder.histograms))
+    for name in recorder.counters:
+      self.assertTrue(re.match(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$", name), name)
+
+  def testUninstall(self):
+    client = StandInClient()
+    profiler = GatewayProfiler(client)
+    profiler.uninstall()
+    client.send_command(COMMANDS[0])
+    self.assertEqual([], profiler.getMethodStats())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,111 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the stream event batches in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.streams import StreamEventBatch
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Events of a batch file, as written by the Java PythonStreamBatches
+EVENTS = [
+  (1500000000000, { "host" : "a", "path" : u"/café" }, b"Event 0"),
+  (1500000000001, {}, b""),
+  (1500000000002, {}, b"\x00\x01\xff")
+]
+
+def writeBatch(path, events):
+  with open(path, "wb") as f:
+    for timestamp, headers, body in events:
+      encoded = json.dumps(headers).encode("utf-8") if headers else b""
+      f.write(struct.pack(">qi", timestamp, len(encoded)) + encoded + struct.pack(">i", len(body)) + body)
+
+class StreamEventBatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "batch")
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testDecode(self):
+    writeBatch(self.path, EVENTS)
+    batch = StreamEventBatch(self.path)
+
+    self.assertEqual(3, len(batch))
+    self.assertEqual([timestamp for timestamp, _, _ in EVENTS], list(batch.timestamps()))
+    self.assertEqual([body for _, _, body in EVENTS], [bytes(batch.body(i)) for i in range(len(batch))])
+    self.assertEqual([headers for _, headers, _ in EVENTS], [batch.headers(i) for i in range(len(batch))])
+    batch.close()
+
+  def testEventViews(self):
+    writeBatch(self.path, EVENTS)
+    batch = StreamEventBatch(self.path)
+
+    self.assertEqual(EVENTS, [(event.timestamp, event.headers, bytes(event.body)) for event in batch])
+    batch.close()
+
+  def testFileRemoved(self):
+    writeBatch(self.path, EVENTS)
+    batch = StreamEventBatch(self.path.encode("utf-8"))
+
+    # The file is removed once it is mapped, and the mapping stays readable
+    self.assertFalse(os.path.exists(self.path))
+    self.assertEqual(b"Event 0", bytes(batch.body(0)))
+    batch.close()
+
+  def testEmpty(self):
+    writeBatch(self.path, [])
+    batch = StreamEventBatch(self.path)
+
+    self.assertEqual(0, len(batch))
+    self.assertEqual([], list(batch))
+    self.assertFalse(os.path.exists(self.path))
+    batch.close()
+
+  @unittest.skipIf(numpy is None, "NumPy is not installed")
+  def testToNumPy(self):
+    writeBatch(self.path, EVENTS)
+    batch = StreamEventBatch(self.path)
+    data, timestamps, offsets, lengths = batch.toNumPy()
+
+    self.assertEqual([timestamp for timestamp, _, _ in EVENTS], timestamps.tolist())
+    self.assertEqual([body for _, _, body in EVENTS],
+                     [data[offset:offset + length].tostring() for offset, length in zip(offsets, lengths)])
+    del data
+    batch.close()
+
+if __name__ == "__main__":
+  unittest.main()
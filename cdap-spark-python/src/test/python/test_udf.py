@@ -0,0 +1,123 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the vectorized UDFs in `cdap.pyspark`. Most of them need pandas and are skipped without it.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.streams import StreamEventBatch
+from cdap.pyspark.udf import vectorizedUDF
+
+try:
+  import pandas
+except ImportError:
+  pandas = None
+
+# The rows of the cdapstream data source
+StreamRow = namedtuple("StreamRow", ["ts", "headers", "body"])
+
+class RecordingMetrics(object):
+
+  def __init__(self):
+    self.counts = []
+
+  def count(self, name, delta):
+    self.counts.append((name, delta))
+
+def writeBatch(path, events):
+  with open(path, "wb") as f:
+    for timestamp, headers, body in events:
+      encoded = json.dumps(headers).encode("utf-8") if headers else b""
+      f.write(struct.pack(">qi", timestamp, len(encoded)) + encoded + struct.pack(">i", len(body)) + body)
+
+class VectorizedUDFTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testUnsupportedColumn(self):
+    self.assertRaises(ValueError, vectorizedUDF, len, columns = ("body", "partition"))
+
+  @unittest.skipIf(pandas is None, "pandas is not installed")
+  def testRows(self):
+    metrics = RecordingMetrics()
+    sizes = []
+
+    def parse(events):
+      sizes.append(len(events))
+      return events.body.str.split(" ").str[1].astype(int) * 10 + events.timestamp
+
+    process = vectorizedUDF(parse, metrics, "events", batchSize = 3)
+    rows = [StreamRow(i, {}, b"Event %d" % i) for i in range(7)]
+
+    self.assertEqual([i * 11 for i in range(7)], list(process(iter(rows))))
+    self.assertEqual([3, 3, 1], sizes)
+    self.assertEqual([("events", 3), ("events", 3), ("events", 1)], metrics.counts)
+
+  @unittest.skipIf(pandas is None, "pandas is not installed")
+  def testStreamEventBatches(self):
+    metrics = RecordingMetrics()
+    frames = []
+
+    def keep(events):
+      frames.append(events)
+      return events[events.timestamp > 1]
+
+    process = vectorizedUDF(keep, metrics, "events", batchSize = 1)
+    paths = [os.path.join(self.directory, name) for name in ["first", "second"]]
+    writeBatch(paths[0], [(1, { "k" : "v" }, b"a"), (2, {}, b"bc")])
+    writeBatch(paths[1], [(3, {}, b"")])
+    batches = [StreamEventBatch(path) for path in paths]
+
+    # Each batch of the JVM is passed as is, regardless of the batch size
+    self.assertEqual([(2, {}, b"bc"), (3, {}, b"")], list(process(iter(batches))))
+    self.assertEqual(["timestamp", "headers", "body"], list(frames[0].columns))
+    self.assertEqual("int64", str(frames[0].timestamp.dtype))
+    self.assertEqual([{ "k" : "v" }, {}], list(frames[0].headers))
+    self.assertEqual([("events", 2), ("events", 1)], metrics.counts)
+    self.assertTrue(all(batch._mmap is None for batch in batches))
+
+  @unittest.skipIf(pandas is None, "pandas is not installed")
+  def testColumns(self):
+    frames = []
+
+    def record(events):
+      frames.append(events)
+      return events.body.str.len()
+
+    process = vectorizedUDF(record, columns = ("body",))
+    self.assertEqual([5], list(process(iter([StreamRow(0, { "k" : "v" }, b"Event")]))))
+    self.assertEqual(["body"], list(frames[0].columns))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,123 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the workflow token in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import json
+import os
+import pickle
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.workflow import WorkflowToken
+
+class StandInPythonUtil(object):
+  """
+    Stand-in for the Java `SparkPythonUtil`, which records the puts sent to it.
+  """
+
+  def __init__(self):
+    self.puts = []
+
+  def putWorkflowToken(self, javaContext, values):
+    self.puts.append(json.loads(values))
+
+class StandInRuntimeContext(object):
+  """
+    The part of the Python `SparkRuntimeContext` used by :class:`WorkflowToken`.
+  """
+
+  def __init__(self, driver = True):
+    self.pythonUtil = StandInPythonUtil()
+    self.contentReads = 0
+    self._driver = driver
+
+  def __getstate__(self):
+    return { "driver" : False }
+
+  def __setstate__(self, state):
+    self.__init__(state["driver"])
+
+  def isDriver(self):
+    return self._driver
+
+  def getPythonUtil(self):
+    return self.pythonUtil
+
+  def getSparkRuntimeContext(self):
+    return None
+
+  def getWorkflowTokenContent(self):
+    self.contentReads += 1
+    return { "nodeName" : "spark", "values" : { "input" : [["source", "a"], ["spark", "b"]] } }
+
+class WorkflowTokenTest(unittest.TestCase):
+
+  def testGet(self):
+    runtimeContext = StandInRuntimeContext()
+    token = WorkflowToken(runtimeContext)
+
+    self.assertEqual("b", token.get("input"))
+    self.assertEqual("a", token.get("input", "source"))
+    self.assertEqual(None, token.get("missing"))
+    self.assertEqual([("source", "a"), ("spark", "b")], token.getAll("input"))
+    # The content is read from the JVM once
+    self.assertEqual(1, runtimeContext.contentReads)
+
+  def testCoalescedPuts(self):
+    runtimeContext = StandInRuntimeContext()
+    token = WorkflowToken(runtimeContext)
+    token.put("count", 1)
+    token.put("count", 2)
+    token.put("done", True)
+
+    # Puts are visible before they are sent
+    self.assertEqual("2", token.get("count"))
+    self.assertEqual("2", token.get("count", "spark"))
+    self.assertEqual(None, token.get("count", "source"))
+    self.assertEqual([], runtimeContext.pythonUtil.puts)
+
+    token.flush()
+    token.flush()
+    self.assertEqual([{ "count" : "2", "done" : "true" }], runtimeContext.pythonUtil.puts)
+    self.assertEqual([("spark", "2")], token.getAll("count"))
+
+  def testDriverOnly(self):
+    token = WorkflowToken(StandInRuntimeContext(driver = False))
+    self.assertRaises(RuntimeError, token.put, "key", "value")
+
+  def testPickle(self):
+    runtimeContext = StandInRuntimeContext()
+    token = WorkflowToken(runtimeContext)
+    token.put("output", "c")
+    copy = pickle.loads(pickle.dumps(token))
+
+    # Closures see the values read and put in the driver, and cannot put
+    self.assertEqual("c", copy.get("output"))
+    self.assertEqual("b", copy.get("input"))
+    self.assertEqual(0, copy._runtimeContext.contentReads)
+    self.assertRaises(RuntimeError, copy.put, "key", "value")
+    token.flush()
+
+if __name__ == "__main__":
+  unittest.main()
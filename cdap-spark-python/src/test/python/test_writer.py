@@ -0,0 +1,190 @@
+# coding=utf-8
+#
+# Copyright © 2018 Cask Data, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+  Unit tests of the transactional writer in `cdap.pyspark`.
+
+  Usage: python -m unittest discover -s src/test/python -p "test_*.py"
+"""
+
+import json
+import os
+import pickle
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                "main", "resources"))
+
+from cdap.pyspark.writer import TransactionalWriter
+
+class StandInDatasetWriter(object):
+  """
+    Stand-in for the Java `PythonDatasetWriter`, which decodes the batches of writes it receives.
+  """
+
+  def __init__(self, namespace, datasetName, arguments):
+    self.namespace = namespace
+    self.datasetName = datasetName
+    self.arguments = json.loads(arguments)
+    self.batches = []
+    self.committed = False
+    self.aborted = False
+    self.writeFailure = None
+    self.abortFailure = None
+
+  def write(self, batch):
+    if self.writeFailure is not None:
+      raise self.writeFailure
+    batch = bytes(batch)
+    pairs = []
+    offset = 0
+    while offset < len(batch):
+      keyLength = struct.unpack_from(">i", batch, offset)[0]
+      key = batch[offset + 4:offset + 4 + keyLength]
+      offset += 4 + keyLength
+      valueLength = struct.unpack_from(">i", batch, offset)[0]
+      value = batch[offset + 4:offset + 4 + valueLength]
+      offset += 4 + valueLength
+      pairs.append((key, value))
+    self.batches.append(pairs)
+
+  def commit(self):
+    self.committed = True
+
+  def abort(self):
+    self.aborted = True
+    if self.abortFailure is not None:
+      raise self.abortFailure
+
+  def pairs(self):
+    return [pair for batch in self.batches for pair in batch]
+
+class StandInJVM(object):
+
+  def __init__(self):
+    self.writers = []
+    self.writeFailure = None
+    self.abortFailure = None
+
+  def PythonDatasetWriter(self, javaContext, namespace, datasetName, arguments):
+    writer = StandInDatasetWriter(namespace, datasetName, arguments)
+    writer.writeFailure = self.writeFailure
+    writer.abortFailure = self.abortFailure
+    self.writers.append(writer)
+    return writer
+
+class StandInRuntimeContext(object):
+  """
+    The part of the Python `SparkRuntimeContext` used by :class:`TransactionalWriter`.
+  """
+
+  def __init__(self):
+    self.jvm = StandInJVM()
+
+  def getSparkRuntimeContext(self):
+    return None
+
+  def getJVM(self):
+    return self.jvm
+
+class TransactionalWriterTest(unittest.TestCase):
+
+  def testBatches(self):
+    runtimeContext = StandInRuntimeContext()
+    # Each pair takes 8 bytes of lengths and 4 bytes of data
+    writer = TransactionalWriter(runtimeContext, "table", "ns", { "ttl" : "10" }, batchSize = 30)
+    with writer:
+      writer.writeAll((b"k%d" % i, b"v%d" % i) for i in range(5))
+
+    javaWriter = runtimeContext.jvm.writers[0]
+    self.assertEqual(("ns", "table", { "ttl" : "10" }),
+                     (javaWriter.namespace, javaWriter.datasetName, javaWriter.arguments))
+    self.assertEqual([(b"k%d" % i, b"v%d" % i) for i in range(5)], javaWriter.pairs())
+    self.assertEqual([3, 2], [len(batch) for batch in javaWriter.batches])
+    self.assertTrue(javaWriter.committed)
+    self.assertFalse(javaWriter.aborted)
+
+  def testUnicode(self):
+    runtimeContext = StandInRuntimeContext()
+    writer = TransactionalWriter(runtimeContext, "table")
+    with writer:
+      writer.write(u"clé", bytearray(b"\x00\xff"))
+
+    self.assertEqual([(u"clé".encode("utf-8"), b"\x00\xff")], runtimeContext.jvm.writers[0].pairs())
+
+  def testWriteOutsideTransaction(self):
+    writer = TransactionalWriter(StandInRuntimeContext(), "table")
+    self.assertRaises(RuntimeError, writer.write, b"key", b"value")
+
+  def testNestedTransaction(self):
+    writer = TransactionalWriter(StandInRuntimeContext(), "table")
+    with writer:
+      self.assertRaises(RuntimeError, writer.__enter__)
+
+  def testAbort(self):
+    runtimeContext = StandInRuntimeContext()
+    writer = TransactionalWriter(runtimeContext, "table")
+    try:
+      with writer:
+        writer.write(b"key", b"value")
+        raise ValueError("Failed to process")
+    except ValueError:
+      pass
+
+    javaWriter = runtimeContext.jvm.writers[0]
+    self.assertTrue(javaWriter.aborted)
+    self.assertFalse(javaWriter.committed)
+    self.assertEqual([], javaWriter.batches)
+
+    # The writer can be used again, without the writes of the aborted transaction
+    with writer:
+      writer.write(b"other", b"value")
+    self.assertEqual([(b"other", b"value")], runtimeContext.jvm.writers[1].pairs())
+
+  def testAbortFailureKeepsError(self):
+    runtimeContext = StandInRuntimeContext()
+    runtimeContext.jvm.abortFailure = IOError("Gateway is down")
+    writer = TransactionalWriter(runtimeContext, "table")
+    with self.assertRaises(ValueError):
+      with writer:
+        raise ValueError("Failed to process")
+
+  def testSendFailure(self):
+    runtimeContext = StandInRuntimeContext()
+    runtimeContext.jvm.writeFailure = KeyError("Write failed")
+    runtimeContext.jvm.abortFailure = IOError("Gateway is down")
+    writer = TransactionalWriter(runtimeContext, "table")
+    with self.assertRaises(KeyError):
+      with writer:
+        writer.write(b"key", b"value")
+
+    javaWriter = runtimeContext.jvm.writers[0]
+    self.assertTrue(javaWriter.aborted)
+    self.assertFalse(javaWriter.committed)
+
+  def testWritePartition(self):
+    runtimeContext = StandInRuntimeContext()
+    writer = pickle.loads(pickle.dumps(TransactionalWriter(runtimeContext, "table", batchSize = 1024)))
+    writer.writePartition(iter([(b"a", b"1"), (b"b", b"2")]))
+
+    javaWriter = writer._runtimeContext.jvm.writers[0]
+    self.assertEqual([(b"a", b"1"), (b"b", b"2")], javaWriter.pairs())
+    self.assertTrue(javaWriter.committed)
+
+if __name__ == "__main__":
+  unittest.main()